@@ -0,0 +1,103 @@
+"""
+Bulk relation extraction endpoint on the Flask server of the app.
+
+POST /api/rex/bulk with either a JSON array or NDJSON lines (in the body or as an uploaded "file"), each item being a
+text or an object with "text" and an optional "id". Texts are predicted with bounded concurrency and one NDJSON row is
+streamed back per extracted estimate as soon as its text is done, followed by a status row of the text with its "id" and
+"n_estimates" (and an "error" field if it could not be processed). Every text gets a status row, also when no estimates
+were found in it.
+
+curl -X POST --data-binary @abstracts.ndjson -H "Content-Type: application/x-ndjson" <host>/api/rex/bulk
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterator, List, Tuple
+
+from flask import Response, request, stream_with_context
+
+from app import server
+from utils import common, rexdemo
+
+BULK_CONCURRENCY = 8
+BULK_MAX_TEXTS = 10000
+BULK_MAX_TEXT_LENGTH = 100000
+BULK_EXECUTOR = ThreadPoolExecutor(max_workers=BULK_CONCURRENCY)
+
+
+class BulkRequestError(ValueError):
+    pass
+
+
+def parse_item(inp_item, position: int) -> Tuple[str, str]:
+    if isinstance(inp_item, str):
+        return str(position), inp_item
+    if isinstance(inp_item, dict) and isinstance(inp_item.get("text"), str):
+        return str(inp_item.get("id", position)), inp_item["text"]
+    raise BulkRequestError(f"Item {position} should be a text or an object with a text field")
+
+
+def parse_texts(inp_body: str) -> List[Tuple[str, str]]:
+    """
+    (id, text) pairs of a JSON array or NDJSON request body
+    """
+    try:
+        if inp_body.lstrip().startswith("["):
+            items = json.loads(inp_body)
+        else:
+            items = [json.loads(line) for line in inp_body.splitlines() if line.strip()]
+    except ValueError as e:
+        raise BulkRequestError(f"Could not parse the request as a JSON array or NDJSON: {e}")
+    if len(items) > BULK_MAX_TEXTS:
+        raise BulkRequestError(f"Too many texts ({len(items)}), the limit is {BULK_MAX_TEXTS} per request")
+    texts = [parse_item(inp_item=x, position=i) for i, x in enumerate(items)]
+    for text_id, text in texts:
+        if len(text) > BULK_MAX_TEXT_LENGTH:
+            raise BulkRequestError(f"Text {text_id} is longer than {BULK_MAX_TEXT_LENGTH} characters")
+    return texts
+
+
+def extract_rows(text_id: str, inp_text: str) -> List[Dict]:
+    rex_results = common.predict_by_sentence(inp_text=inp_text, pred_type="rex")
+    table = rexdemo.cvalmentions2table(inp_cvals=rexdemo.extract_estimates(rex_results=rex_results))
+    return [dict(id=text_id, estimate=i, **row) for i, row in enumerate(table.to_dict('records'))]
+
+
+def stream_rows(inp_texts: List[Tuple[str, str]]) -> Iterator[str]:
+    """
+    NDJSON lines of the estimates of every text followed by its status row, in the order texts complete
+    """
+    in_flight = dict()
+
+    def drain(futures):
+        for future in futures:
+            text_id = in_flight.pop(future)
+            rows, status = [], dict(id=text_id, n_estimates=0)
+            try:
+                rows = future.result()
+                status["n_estimates"] = len(rows)
+            except common.APIError as e:
+                status["error"] = common.api_error_message(inp_error=e, pred_type="rex")
+            except (KeyError, TypeError, ValueError):
+                status["error"] = "Unexpected response of the REX API for this text"
+            for row in rows + [status]:
+                yield json.dumps(row) + "\n"
+
+    for text_id, text in inp_texts:
+        if len(in_flight) >= BULK_CONCURRENCY:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            yield from drain(finished)
+        in_flight[BULK_EXECUTOR.submit(extract_rows, text_id, text)] = text_id
+    while in_flight:
+        finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        yield from drain(finished)
+
+
+@server.route("/api/rex/bulk", methods=["POST"])
+def rex_bulk():
+    upload = request.files.get("file")
+    body = upload.read().decode("utf-8") if upload is not None else request.get_data(as_text=True)
+    try:
+        texts = parse_texts(inp_body=body)
+    except BulkRequestError as e:
+        return Response(json.dumps(dict(error=str(e))), status=400, mimetype="application/json")
+    return Response(stream_with_context(stream_rows(inp_texts=texts)), mimetype="application/x-ndjson")
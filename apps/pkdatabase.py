@@ -1,20 +1,22 @@
+import json
 import pathlib
 import pickle
 import random
 import statistics
-from typing import Dict, List
+from typing import Dict, List, Tuple, Union
 from dash import dash_table
 import pandas as pd
 import dash
 from dash.exceptions import PreventUpdate
-from spacy import displacy
 from dash.dependencies import Input, Output, State
 import dash_dangerously_set_inner_html
 import dash_html_components as html
 import dash_core_components as dcc
 from app import app
 from utils import common, docsearch
-from utils.pkdatabase import PKEstimate, HOWTO_DB, records2plot, get_pmids
+from utils.pkdatabase import PKEstimate, HOWTO_DB, records2plot, get_pmids, unique_dicts
+from pkcase.markup import entities_markup, decompress_markup
+from pkcase.segments import SegmentedStore, MAX_SEGMENTS
 import plotly.express as px
 import plotly.figure_factory as ff
 import dash_bootstrap_components as dbc
@@ -25,27 +27,81 @@ random.seed(0)
 PATH = pathlib.Path(__file__).parent
 DATA_PATH = PATH.joinpath("../datasets/pkdatabase/").resolve()
 
-ALLRECORDS = pd.read_pickle(DATA_PATH.joinpath("maindbdf.pkl"))
-EMPTYRECORDS = [{k: "" for k in ALLRECORDS.to_dict('records')[0].keys()}]
+STORE_PATH = DATA_PATH.joinpath("segments")
+STORE = SegmentedStore(store_dir=str(STORE_PATH)) if SegmentedStore.exists(str(STORE_PATH)) else None
+STORE_VERSION = None
+RECORD_UPDATED = "This estimate has been updated since the table was loaded, please refresh the search"
 
 with open(DATA_PATH.joinpath("lookup_options.pkl"), "rb") as fp:
     SUGGESTIONS_OBJECT_DB = pickle.load(fp)
 
-PROV_DATA = ALLRECORDS.to_dict('records')[0:3]
-with open(DATA_PATH.joinpath("estimates_classes.pkl"), "rb") as fp:
-    RECORDS2IDS: Dict[int, PKEstimate] = pickle.load(fp)
 
-if DEBUG:
-    n = 1000
-    ALLRECORDS = ALLRECORDS[0:n]
+def prepare_records(inp_records: pd.DataFrame) -> pd.DataFrame:
+    if DEBUG:
+        n = 1000
+        inp_records = inp_records[0:n]
+    inp_records = pd.DataFrame(inp_records)
+    inp_records.rename(columns={"ID": "id"}, inplace=True)
+    inp_records.set_index('id', inplace=True, drop=False)
+    return inp_records
+
+
+def refresh_db():
+    """
+    Reloads the records and estimates when new segments have been appended to (or compacted in) the store, and
+    compacts the store in the background once appends have left it with too many segments
+    """
+    global DB, STORE_VERSION
+    if STORE is None:
+        return
+    manifest = STORE.read_manifest()
+    if manifest["version"] == STORE_VERSION:
+        return
+    # the records and their estimates are published together, callbacks read both from the same DB
+    DB = (prepare_records(STORE.load_records(manifest=manifest)), STORE.load_estimates(manifest=manifest))
+    STORE_VERSION = manifest["version"]
+    if len(manifest["segments"]) > MAX_SEGMENTS:
+        STORE.compact_in_background()
+
+
+# (records, estimates): the records of the table and the estimates (spans) of their IDs
+DB: Tuple[pd.DataFrame, Union[pd.DataFrame, Dict[int, PKEstimate]]]
+if STORE is not None:
+    refresh_db()
+else:
+    with open(DATA_PATH.joinpath("estimates_classes.pkl"), "rb") as fp:
+        DB = (prepare_records(pd.read_pickle(DATA_PATH.joinpath("maindbdf.pkl"))), pickle.load(fp))
+
+EMPTYRECORDS = [{k: "" for k in DB[0].columns}]
+PROV_DATA = DB[0].to_dict('records')[0:3]
+
+
+def get_estimate_context(est_id, inp_estimates) -> Tuple[str, List[Dict], str]:
+    """
+    Returns the sentence, the entity spans and the central value text of an estimate, either from the segmented
+    store or from the pickled PKEstimate objects. Raises KeyError if the estimate is no longer in the database (its
+    record was updated since the table was loaded)
+    """
+    if STORE is not None:
+        row = inp_estimates.loc[est_id]
+        return row["Sentence"], json.loads(row["Entities"]), row["Value"]
+    est = inp_estimates[est_id]
+    return est.sent_text, unique_dicts(est.get_character_spans()), est.central_v.text
+
+
+def get_estimate_markup(est_id, inp_estimates) -> str:
+    """
+    Highlighted sentence of an estimate, precomputed in the store (estimates of segments built before the markup was
+    stored and of the pickles are highlighted on the fly). Raises KeyError like get_estimate_context
+    """
+    if STORE is not None:
+        markup = inp_estimates.loc[est_id].get("Markup")
+        if isinstance(markup, bytes):
+            return decompress_markup(markup)
+    sent_text, ents, _ = get_estimate_context(est_id, inp_estimates=inp_estimates)
+    return entities_markup(inp_text=sent_text, inp_ents=ents)
 
-ALLRECORDS = pd.DataFrame(ALLRECORDS)
 
-ALLRECORDS.rename(columns={"ID": "id"}, inplace=True)
-ALLRECORDS.set_index('id', inplace=True, drop=False)
-
-COLORS = {"PK": "#d90368", "VALUE": "#ebe8e8", "RANGE": "#fcba5d", "UNITS": "#5dfcd2", "COMPARE": "#8714fa"}
-DISPLACY_OPTIONS = {"ents": ["PK", "VALUE", "RANGE", "UNITS", "COMPARE"], "colors": COLORS}
 INTERDIV_LG_MARGIN = "50px"
 LABELS_FONTSIZE = '18px'
 SEARCH_BORDER = '40px'
@@ -144,7 +200,7 @@ layout = html.Div(
                         columns=[dict(name=i, id=i, deletable=True, selectable=True, hideable=True) if i != "URL" else
                                  dict(name=i, id=i, deletable=True, selectable=True, hideable=True, type="text",
                                       presentation="markdown")
-                                 for i in ALLRECORDS.columns],
+                                 for i in DB[0].columns],
                         data=PROV_DATA,
                         editable=True,
                         filter_action="native",
@@ -212,7 +268,8 @@ def update_data_table_search(_, drug_name: str, s):
     #      animal_study = True
     #      extra += " (animal studies) "
 
-    base_df = ALLRECORDS
+    refresh_db()
+    base_df, _ = DB
     search_pmids = get_pmids(drug_query=drug_name, clinical_trial=clinical_trial)
 
     if search_pmids is not None and len(search_pmids) > 0:
@@ -274,6 +331,8 @@ def selection(select_n_clicks, deselect_n_clicks, original_rows, filtered_rows,
 )
 def update_stats(all_rows_data, slctd_row_indices, slct_rows_names, slctd_rows,
                  order_of_rows_indices, order_of_rows_names, actv_cell, slctd_cell):
+    refresh_db()
+    _, estimates = DB
     #   print('***************************************************************************')
     #   #  print('Data across all pages pre or post filtering: {}'.format(all_rows_data))
     #   print('---------------------------------------------')
@@ -331,12 +390,14 @@ def update_stats(all_rows_data, slctd_row_indices, slct_rows_names, slctd_rows,
         title = ""
         # print(actv_cell)
         # print(dff.columns)
-        if 'row_id' in actv_cell.keys():
-            est = RECORDS2IDS[actv_cell['row_id']]
+        try:
+            if 'row_id' in actv_cell.keys():
+                markup = get_estimate_markup(actv_cell['row_id'], inp_estimates=estimates)
 
-        else:
-            est = RECORDS2IDS[actv_cell['row']]
-        print(est)
+            else:
+                markup = get_estimate_markup(actv_cell['row'], inp_estimates=estimates)
+        except KeyError:
+            markup = f"<i>{RECORD_UPDATED}</i>"
 
         # if "Title" in dff.columns:
         #     if 'row_id' in actv_cell.keys():
@@ -345,17 +406,8 @@ def update_stats(all_rows_data, slctd_row_indices, slct_rows_names, slctd_rows,
         #         title = dff["Title"].tolist()[actv_cell['row']]
         # print(title)
 
-        ents = []
-        for x in est.get_character_spans():
-            if x not in ents:
-                ents.append(x)
-        ents = sorted(ents, key=lambda anno: anno['start'])
-
-        instance = [dict(text=est.sent_text, ents=ents, title=None)]
-
-        out_ent_div = [html.Div(dash_dangerously_set_inner_html.DangerouslySetInnerHTML(
-            displacy.render(instance, style="ent", manual=True, jupyter=False, options=DISPLACY_OPTIONS))
-            , style=dict(fontSize=16, display='inline-block'))]
+        out_ent_div = [html.Div(dash_dangerously_set_inner_html.DangerouslySetInnerHTML(markup),
+                                style=dict(fontSize=16, display='inline-block'))]
 
     # Get plot for the graph:
 
@@ -363,8 +415,11 @@ def update_stats(all_rows_data, slctd_row_indices, slct_rows_names, slctd_rows,
 
     for v in slctd_row_indices:
 
-        tmp_est = RECORDS2IDS[all_rows_data[v]['id']]
-        estimate_text = tmp_est.central_v.text
+        try:
+            _, _, estimate_text = get_estimate_context(all_rows_data[v]['id'], inp_estimates=estimates)
+        except KeyError:
+            out_ent_div = [html.H5(RECORD_UPDATED)]
+            continue
         if check_if_float(inp_text=estimate_text):
             selected_values.append(float(estimate_text))
         else:
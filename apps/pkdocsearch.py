@@ -1,11 +1,16 @@
 import pathlib
 import pickle
-from typing import List
+import uuid
+from typing import Dict, List, Union
+import dash
+import numpy as np
 import pandas as pd
 from dash import dcc, html
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 from utils import docsearch, common
+from utils.cache import LRUCache
 from app import app
 
 # ================= 1. Define global variables (don't modify them on the app) ===========================
@@ -19,21 +24,43 @@ with open(DATA_PATH.joinpath("lookup_options.pkl"), "rb") as fp:
 INITIAL_SUGGESTIONS = SUGGESTIONS_OBJECT.all_unique_items[0:docsearch.MAX_SUG]
 MAIN_DB = pd.read_parquet(path=DATA_PATH.joinpath("allPapers.parquet"))
 ALL_PMIDS = MAIN_DB['pmid'].to_numpy()
+PAPER_INDEX = docsearch.PaperIndex(inp_papers=MAIN_DB)
+# MAIN_DB row positions of the results of recent searches, by search id. Pages and downloads are served from here, an evicted
+# search is run again from the query kept in the browser
+SEARCH_RESULTS = LRUCache(maxsize=64)
+HIDDEN = dict(display='none')
+PAGER_STYLE = dict(display='flex', justifyContent='center', alignItems='center', margin='10px 0px 40px 0px')
 
 
 # ================= 2. Main search function ===========================
-def get_records(drug_query: str, clinical_trial: bool = False, sortby: str = "pk"):
+def get_positions(drug_query: str, clinical_trial: bool = False) -> Union[np.ndarray, None]:
+    """
+    Row positions in MAIN_DB of the papers matching the query, unsorted (see PAPER_INDEX for their display order)
+    """
     query_pmids = docsearch.get_json(inp_query=drug_query, clinical_trial=clinical_trial)
     if query_pmids is not None and len(query_pmids) > 0:
-        df_subset = MAIN_DB[MAIN_DB['pmid'].isin(query_pmids)]
-        if len(df_subset) > 0:
-            if sortby == "date":
-                df_subset = df_subset.sort_values("pubdate", ascending=False)
-            relevant_records = df_subset.to_dict('records')
-            return relevant_records
+        positions = np.flatnonzero(MAIN_DB['pmid'].isin(query_pmids).to_numpy())
+        if len(positions) > 0:
+            return positions
+    return None
+
+
+def get_records(drug_query: str, clinical_trial: bool = False, sortby: str = "pk"):
+    positions = get_positions(drug_query=drug_query, clinical_trial=clinical_trial)
+    if positions is not None:
+        return MAIN_DB.iloc[PAPER_INDEX.order(inp_positions=positions, sortby=sortby)].to_dict('records')
     return None
 
 
+def search_positions(inp_search: Dict) -> Union[np.ndarray, None]:
+    positions = SEARCH_RESULTS.get(inp_search['id'])
+    if positions is None:
+        positions = get_positions(drug_query=inp_search['query'], clinical_trial=inp_search['pop_pk'])
+        if positions is not None:
+            SEARCH_RESULTS.set(inp_search['id'], positions)
+    return positions
+
+
 layout = html.Div(children=[
 
     html.H1("Find relevant PK literature"),
@@ -175,8 +202,14 @@ layout = html.Div(children=[
         html.Div(dbc.Spinner(html.Div(id='my-output'), color="red", fullscreen=False, debounce=2,
                              show_initially=False,
                              size="md", spinner_style={"top": 700, "position": "fixed", "fontSize": "20px",
-                                                       "height": 70, "width": 70}))
-
+                                                       "height": 70, "width": 70})),
+        html.Div([
+            dbc.Button('Previous', id='search-prev', color='secondary', disabled=True,
+                       style=docsearch.PAGER_BUTTON_STYLE),
+            html.Span(id='search-page-label', style={"fontSize": docsearch.LABELS_FONTSIZE}),
+            dbc.Button('Next', id='search-next', color='secondary', disabled=True,
+                       style=docsearch.PAGER_BUTTON_STYLE)
+        ], id='search-pager', style=HIDDEN)
 
     ],
         style=dict(marginTop=docsearch.MARGIN_RESULTS_TOP, verticalAlign="top")
@@ -191,53 +224,93 @@ layout = html.Div(children=[
 @app.callback(
     Output(component_id='my-output', component_property='children'),
     Output(component_id='memory', component_property='data'),
+    Output('search-pager', 'style'),
+    Output('search-page-label', 'children'),
+    Output('search-prev', 'disabled'),
+    Output('search-next', 'disabled'),
     Input(component_id='button', component_property='n_clicks'),
     State(component_id='my-input', component_property='value'),
     Input(component_id="sortby", component_property="value"),
     Input("study-type", "value"),
     Input(component_id='my-input', component_property='n_submit'),
+    Input('search-prev', 'n_clicks'),
+    Input('search-next', 'n_clicks'),
+    State('memory', 'data'),
     prevent_initial_call=True
 )
-def update_output_div(_, drug_name: str, sorting: str, study_type: List[int], s):
+def update_output_div(_, drug_name: str, sorting: str, study_type: List[int], s, prev_clicks, next_clicks,
+                      inp_search: Dict):
+    """
+    Runs a search and shows its first page, or moves to the previous/next page of the current search. The browser
+    only keeps the query, the number of results and the current page (memory). Changing the sort order of the current
+    search reorders its results without running it again
+    """
+    trigger = dash.callback_context.triggered[0]['prop_id']
+    pop_pk = 1 in study_type
+    if trigger.startswith("search-prev") or trigger.startswith("search-next"):
+        if inp_search is None:
+            raise PreventUpdate
+        positions = search_positions(inp_search=inp_search)
+        if positions is None:
+            return no_results(drug_name=inp_search['query']), None, HIDDEN, "", True, True
+        page = inp_search['page'] + (1 if trigger.startswith("search-next") else -1)
+        return render_page(inp_search=dict(inp_search, page=page), positions=positions)
+
     if drug_name == "":
-        return html.Div(), None
-
-    pop_pk = False
-    extra = ""
-    if 1 in study_type:
-        pop_pk = True
-        extra += " (population PK) "
-
-    records_to_display = get_records(drug_query=drug_name, clinical_trial=pop_pk,
-                                     sortby=sorting)
-
-    if records_to_display is not None:
-        n = len(records_to_display)
-        out = []
-        for i, tmp_record in enumerate(records_to_display):
-            try:
-                out.append(docsearch.make_card(inp_record=tmp_record, x=i))
-            except ValueError as e:
-                print(f"Error constructing card {tmp_record}")
-                print(e)
-
-        # if switch:
-        #    extra = "(only clinical trials)"
-        header_div_1 = html.Div([html.P(f"""{n} results for "{drug_name}" {extra}""")],
-                                style={'margin': 10})
-
-        if out:
-            out_div = html.Div([header_div_1, docsearch.render_cards(inp_list_cards=out)], style={"marginTop": "20px"})
-        else:
-            header_div_1 = html.H5(f"No relevant PK papers found for {drug_name}, please check spelling...",
-                                   style={"marginTop": f"20px"})
-            out_div = html.Div([header_div_1], style={"marginTop": "20px"})
-    else:
-        header_div_1 = html.H5(f"No relevant PK papers found for {drug_name}, please check spelling",
+        return html.Div(), None, HIDDEN, "", True, True
+
+    if trigger.startswith("sortby") and inp_search is not None and inp_search['query'] == drug_name and \
+            inp_search['pop_pk'] == pop_pk:
+        positions = search_positions(inp_search=inp_search)
+        if positions is not None:
+            return render_page(inp_search=dict(inp_search, sortby=sorting, page=0), positions=positions)
+
+    positions = get_positions(drug_query=drug_name, clinical_trial=pop_pk)
+    if positions is None:
+        return no_results(drug_name=drug_name), None, HIDDEN, "", True, True
+
+    search = dict(id=uuid.uuid4().hex, query=drug_name, pop_pk=pop_pk, sortby=sorting, n=len(positions), page=0)
+    SEARCH_RESULTS.set(search['id'], positions)
+    return render_page(inp_search=search, positions=positions)
+
+
+def no_results(drug_name: str):
+    header_div_1 = html.H5(f"No relevant PK papers found for {drug_name}, please check spelling",
+                           style={"marginTop": f"20px"})
+    return html.Div([header_div_1], style={"marginTop": "20px"})
+
+
+def render_page(inp_search: Dict, positions: np.ndarray):
+    """
+    Cards of one page of the results, with the memory and the pager state of that page
+    """
+    n = len(positions)
+    page_positions = docsearch.page_slice(page=inp_search['page'], n_results=n)
+    page = page_positions.start // docsearch.PAGE_SIZE
+    extra = " (population PK) " if inp_search['pop_pk'] else ""
+    out = []
+    page_rows = PAPER_INDEX.page(inp_positions=positions, sortby=inp_search['sortby'], inp_slice=page_positions)
+    for i, tmp_record in enumerate(MAIN_DB.iloc[page_rows].to_dict('records')):
+        try:
+            out.append(docsearch.make_card(inp_record=tmp_record, x=page_positions.start + i))
+        except ValueError as e:
+            print(f"Error constructing card {tmp_record}")
+            print(e)
+
+    # if switch:
+    #    extra = "(only clinical trials)"
+    header_div_1 = html.Div([html.P(f"""{n} results for "{inp_search['query']}" {extra}""")],
+                            style={'margin': 10})
+    if not out:
+        header_div_1 = html.H5(f"No relevant PK papers found for {inp_search['query']}, please check spelling...",
                                style={"marginTop": f"20px"})
-        out_div = html.Div([header_div_1], style={"marginTop": "20px"})
+        return html.Div([header_div_1], style={"marginTop": "20px"}), None, HIDDEN, "", True, True
 
-    return out_div, records_to_display
+    out_div = html.Div([header_div_1, docsearch.render_cards(inp_list_cards=out)], style={"marginTop": "20px"})
+    last_page = docsearch.n_pages(n_results=n) - 1
+    pager_style = PAGER_STYLE if last_page > 0 else HIDDEN
+    label = f"Page {page + 1} of {last_page + 1} ({page_positions.start + 1}-{page_positions.stop} of {n})"
+    return out_div, dict(inp_search, page=page), pager_style, label, page == 0, page == last_page
 
 
 @app.callback(
@@ -246,13 +319,13 @@ def update_output_div(_, drug_name: str, sorting: str, study_type: List[int], s)
     State('memory', 'data'),
     prevent_initial_call=True
 )
-def fun(_, inp_records):
+def fun(_, inp_search):
     out_df = pd.DataFrame({})
-    if inp_records is not None:
-        try:
-            out_df = pd.DataFrame(inp_records)
-        except:
-            pass
+    if inp_search is not None:
+        positions = search_positions(inp_search=inp_search)
+        if positions is not None:
+            out_df = MAIN_DB.iloc[PAPER_INDEX.order(inp_positions=positions, sortby=inp_search['sortby'])]
+            out_df = out_df.reset_index(drop=True)
     return dcc.send_data_frame(out_df.to_csv, "pkpdai_results.csv")
 
 
@@ -4,6 +4,7 @@ import dash_html_components as html
 from dash import dcc
 from spacy import displacy
 from utils import rexdemo, common, nerdemo
+from utils.cache import cached_render
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
 from app import app
@@ -25,15 +26,7 @@ CONCLUSIONS
 When compared with studies in Caucasians, Chinese children showed a similar time to peak plasma concentration after intranasal administration, but the achieved plasma concentrations were about three times higher. Possible reasons are differences in age, ethnicity, and mode of administration.
 """
 
-layout = html.Div(children=[
-
-    html.H1("PK Named Entity Recognition"),
-    html.H4("A model to locate PK parameter mentions in scientific text text",
-            style=dict(marginTop=common.INTERDIV_MARGIN)),
-    html.Div(nerdemo.HOWTO_CARD, className="accordion", style=dict(marginTop=common.INTERDIV_LG_MARGIN)),
-
-    html.Div(dcc.Markdown(
-        '''
+EXAMPLES_MARKDOWN = '''
 Some examples to try:  
 
 * Two hours before operation each patient received midazolam 0.5 mg kg-1 orally for premedication and 0.5 mg kg-1 
@@ -55,7 +48,17 @@ variables, including fraction metabolized by AO (Fm,AO) and hepatic extraction r
  distribution volume of the central compartment (V1) and peripheral compartments (V2, V3) plus interpatient 
  variability (%CV) were: CL, 284 mL h-170 kg-1 (18%); V1, 5450 mL70 kg-1 (19%); Q2, 110 mL h-170 kg-1; V2, 
  4800 mL70 kg-1; Q3, 1610 mL h-170 kg-1; V3, 2040 mL70 kg-1. '''
-    ), style=dict(marginTop=common.INTERDIV_LG_MARGIN)),
+
+common.prewarm_predictions(inp_texts=[STARTING_VALUE] + common.markdown_examples(EXAMPLES_MARKDOWN), pred_type="ner")
+
+layout = html.Div(children=[
+
+    html.H1("PK Named Entity Recognition"),
+    html.H4("A model to locate PK parameter mentions in scientific text text",
+            style=dict(marginTop=common.INTERDIV_MARGIN)),
+    html.Div(nerdemo.HOWTO_CARD, className="accordion", style=dict(marginTop=common.INTERDIV_LG_MARGIN)),
+
+    html.Div(dcc.Markdown(EXAMPLES_MARKDOWN), style=dict(marginTop=common.INTERDIV_LG_MARGIN)),
     dbc.Textarea(id="ner-input",
                  value=STARTING_VALUE,
                  bs_size="lg",
@@ -108,16 +111,20 @@ variables, including fraction metabolized by AO (Fm,AO) and hepatic extraction r
 )
 def update_output(inp_text, _):
     # out_ents = predic_ner(inp_text=inp_text)
-    api_results = common.query_api(inp_text=inp_text, pred_type="ner")
-    ner_results = common.request_handler(inp_request=api_results)
-    if ner_results is None:
-        return "Error querying the NER API - try in a few minutes", [], None, dict()
+    if not inp_text:
+        return "Enter some text to process"
+    try:
+        ner_results = common.predict_by_sentence(inp_text=inp_text, pred_type="ner")
+    except common.APIError as e:
+        return common.api_error_message(inp_error=e, pred_type="ner")
     out_ents = []
     if ner_results is not None and "entities" in ner_results.keys() and "text" in ner_results.keys():
         out_ents = ner_results["entities"]
     instance = [dict(text=ner_results["text"], ents=out_ents, title=None)]
     out_ent_div = html.Div(dash_dangerously_set_inner_html.DangerouslySetInnerHTML(
-        displacy.render(instance, style="ent", manual=True, jupyter=False, options=DISPLACY_OPTIONS))
+        cached_render(lambda: displacy.render(instance, style="ent", manual=True, jupyter=False,
+                                              options=DISPLACY_OPTIONS),
+                      "ent", instance, DISPLACY_OPTIONS))
         , style=dict(fontSize=18))
 
     return out_ent_div
@@ -1,16 +1,41 @@
+import base64
 import pathlib
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import dash
 import pandas as pd
 from dash import dcc
+from dash.exceptions import PreventUpdate
 import dash_html_components as html
 from utils import rexdemo, common
-from spark_display.relation_extraction import RelationExtractionVisualizer
-from app import app
+from utils.cache import LRUCache, cached_render
+from utils.incremental import DocumentJob
+from flask import send_from_directory
+from spark_display.relation_extraction import RelationExtractionVisualizer, FONTS_DIR, FONT_FILE
+from app import app, server
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output, State
+from dash.dependencies import ClientsideFunction, Input, Output, State
 import dash_dangerously_set_inner_html
 
 PATH = pathlib.Path(__file__).parent
 
+TEXT_MAX_LENGTH = 3000
+DOCUMENT_MAX_LENGTH = 500000
+DOCUMENT_CHUNK_CHARS = 2500
+DOCUMENT_CONCURRENCY = 4
+DOCUMENT_POLL_MS = 1000
+# Chunks of all documents being processed share the executor, which bounds the requests sent to the API
+DOCUMENT_EXECUTOR = ThreadPoolExecutor(max_workers=DOCUMENT_CONCURRENCY)
+DOCUMENT_JOBS = LRUCache(maxsize=32)
+TABLE_COLUMNS = ["Parameter", "Chemical", "Value", "Units", "Deviation", "DevUnits", "Compare"]
+# The font of the relation graphs is downloaded once and cached by the browser instead of being inlined in every SVG
+FONTS_ROUTE = "/spark-display/fonts/"
+FONT_MAX_AGE = 7 * 24 * 3600
+# Stateless between renders, shared by all callbacks
+VISUALIZER = RelationExtractionVisualizer(writer='string')
+
 EXAMPLE_OTHERS = """The pharmacokinetics of oral midazolam (Dormicum, 15 mg) and loprazolam (Dormonoct, 1 mg) were 
 studied in eight healthy young volunteers in a cross-over design. Plasma concentrations of midazolam were measured 
 with a gas chromatographic method and loprazolam concentrations were determined by a radio-receptor technique. 
@@ -34,14 +59,7 @@ Bioavailability of midazolam after IM administration was 92%. Peak onset of seda
 MORE_EXAMPLES = """Rifampin significantly (P < 0.0001) increased the systemic and oral clearance of midazolam from 0.44 ± 0.2 L h/kg and 1.56 ± 0.8 L h/kg to 0.96 ± 0.3 L h/kg and 34.4 ± 21.2 L h/kg,
 respectively."""
 
-layout = html.Div(children=[
-    dcc.Store(id='memory-rex'),
-    html.H1("PK Relation Extraction"),
-    html.H4("An app to visualize PK relations extracted in scientific sentences",
-            style=dict(marginTop=common.INTERDIV_MARGIN)),
-    html.Div(rexdemo.HOWTO_CARD_REX, className="accordion", style=dict(marginTop=common.INTERDIV_LG_MARGIN)),
-    html.Div(dcc.Markdown(
-        '''
+EXAMPLES_MARKDOWN = '''
 Some examples to try:   
 
 * Bendamustine plasma concentration peaked near the end of infusion and was rapidly eliminated with a mean elimination half-life (t(1/2)) of 0.67-0.8 h. 
@@ -55,21 +73,51 @@ Some examples to try:
  resulted in a Css of 9.2 mg l-1 and 7.2 mg l-1 , for every 6 h and every 8 h respectively. Variability in 
  paracetamol PK resulted in Css above 5.4 and 4.1 mg l-1 , respectively, in 90% of the population and above 15.5 and 
  11.7 mg l-1, respectively, in 10% at these dosing regimens. '''
-    ), style=dict(marginTop=common.INTERDIV_LG_MARGIN)),
+
+STARTING_VALUE = ("Ten nonobese subjects (mean age 30.6 ± 7.12 y; body mass index 21.56 ± 1.95 kg/m2 ) and 20 "
+                  "obese subjects (mean age 34.47 ± 7.03 y; body mass index 33.17 ± 2.38 kg/m2 ) participated in "
+                  "the study and were given p.o. amoxicillin.  Both maximum concentration (Cmax ; 12.12 ± 4.06 "
+                  "vs. 9.66 ± 2.93 mg/L) and area under the curve (AUC)0-inf (34.18 ± 12.94 mg.h/L vs. 26.88 ± "
+                  "9.24 mg.h/L) were slightly higher in nonobese than in obese subjects, respectively, "
+                  "but differences were not significant. The volume of distribution (V/F) parameter was "
+                  "statistically significantly higher in obese compared to nonobese patients (44.20 ± 17.85 L "
+                  "vs. 27.57 ± 12.96 L).")
+
+common.prewarm_predictions(inp_texts=[STARTING_VALUE, EXAMPLE_OTHERS, EXAMPLE_OTHERS2, MORE_EXAMPLES] +
+                           common.markdown_examples(EXAMPLES_MARKDOWN), pred_type="rex")
+
+layout = html.Div(children=[
+    dcc.Store(id='memory-rex'),
+    html.H1("PK Relation Extraction"),
+    html.H4("An app to visualize PK relations extracted in scientific sentences",
+            style=dict(marginTop=common.INTERDIV_MARGIN)),
+    html.Div(rexdemo.HOWTO_CARD_REX, className="accordion", style=dict(marginTop=common.INTERDIV_LG_MARGIN)),
+    html.Div(dcc.Markdown(EXAMPLES_MARKDOWN), style=dict(marginTop=common.INTERDIV_LG_MARGIN)),
     dbc.Textarea(id="rex-input", bs_size="lg",
-                 value="Ten nonobese subjects (mean age 30.6 ± 7.12 y; body mass index 21.56 ± 1.95 kg/m2 ) and 20 "
-                       "obese subjects (mean age 34.47 ± 7.03 y; body mass index 33.17 ± 2.38 kg/m2 ) participated in "
-                       "the study and were given p.o. amoxicillin.  Both maximum concentration (Cmax ; 12.12 ± 4.06 "
-                       "vs. 9.66 ± 2.93 mg/L) and area under the curve (AUC)0-inf (34.18 ± 12.94 mg.h/L vs. 26.88 ± "
-                       "9.24 mg.h/L) were slightly higher in nonobese than in obese subjects, respectively, "
-                       "but differences were not significant. The volume of distribution (V/F) parameter was "
-                       "statistically significantly higher in obese compared to nonobese patients (44.20 ± 17.85 L "
-                       "vs. 27.57 ± 12.96 L).",
+                 value=STARTING_VALUE,
                  placeholder="Enter some pharmacokinetic text here",
-                 maxLength=3000,
+                 maxLength=TEXT_MAX_LENGTH,
                  debounce=False,
                  style=dict(marginTop=common.INTERDIV_LG_MARGIN, height=rexdemo.MAINAREAHEIGHT),
                  ),
+    html.Div(
+        [
+            dbc.Checklist(id="rex-document-mode", switch=True, value=[],
+                          options=[{"label": "Document mode (full papers are processed in chunks)", "value": 1}]),
+            dbc.Checklist(id="rex-client-render", switch=True, value=[],
+                          options=[{"label": "Draw the relations in the browser", "value": 1}]),
+            dcc.Upload(id="rex-upload", accept=".txt,text/plain", multiple=False,
+                       children=html.Div(["Drag and drop or ", html.A("select a plain-text file")]),
+                       style=dict(borderWidth="1px", borderStyle="dashed", borderRadius="8px", textAlign="center",
+                                  padding="10px", marginTop=common.INTERDIV_MARGIN)),
+            dcc.Store(id="rex-job"),
+            dcc.Store(id="rex-graph"),
+            dcc.Store(id="rex-chunks"),
+            dcc.Store(id="rex-drawn"),
+            dcc.Interval(id="rex-interval", interval=DOCUMENT_POLL_MS, disabled=True),
+        ],
+        style=dict(marginTop=common.INTERDIV_MARGIN)
+    ),
     html.Div(
         [
             dbc.Button('Process', id='rex-button',
@@ -87,8 +135,13 @@ Some examples to try:
     html.Div(
         [
 
+            html.Div(id="rex-progress"),
+            # chunks of a document job, added by the browser as they are done (see rex.add_chunks)
+            html.Div(id="rex-doc-output", style=dict(margin="auto")),
+            html.Div(id="rex-doc-table"),
             dbc.Spinner(
                 [html.Div(id='rex-output'),
+                 html.Div(id='rex-graph-output', style=dict(margin="auto")),
                  html.Div(id="tabular-output"),
                  dbc.Form(
                      [
@@ -124,27 +177,117 @@ Some examples to try:
     Output("tabular-output", "children"),
     Output(component_id='memory-rex', component_property='data'),
     Output(component_id='download-button-rex', component_property='style'),
+    Output("rex-graph", "data"),
+    Output("rex-job", "data"),
+    Output("rex-interval", "disabled"),
+    Output("rex-progress", "children"),
+    Output("rex-chunks", "data"),
     [State("rex-input", "value"),
-     Input("rex-button", "n_clicks")],
+     State("rex-document-mode", "value"),
+     State("rex-client-render", "value"),
+     State("rex-job", "data"),
+     State("rex-drawn", "data"),
+     Input("rex-button", "n_clicks"),
+     Input("rex-interval", "n_intervals")],
     prevent_initial_call=True
 )
-def update_output(inp_text, _):
-    out_tab_style = {'display': 'none'}
+def update_output(inp_text, document_mode, client_render, job_id, drawn, *_):
+    """
+    Process button: predicts the text (or starts a document job in document mode). Interval ticks: sends the table rows
+    and relation graphs of the document chunks done since the last tick, the browser adds them to the ones it already
+    shows (drawn holds the chunks it has, chunks of a tick whose response was dropped are sent again). With
+    client_render the relations are sent as a compact graph drawn in the browser instead of a server-side SVG
+    """
+    trigger = dash.callback_context.triggered[0]['prop_id']
+    if trigger.startswith("rex-interval"):
+        job = DOCUMENT_JOBS.get(job_id) if job_id else None
+        if job is None:
+            return [dash.no_update] * 6 + [True, dash.no_update, dash.no_update]
+        # checked before merging so that no chunk finishes unmerged after the last tick
+        finished = job.finished
+        new = job.merge_done()
+        drawn_chunks = set(drawn['chunks']) if drawn and drawn.get('job') == job_id else set()
+        pending = sorted(i for i in list(job.rendered) if i not in drawn_chunks)
+        if not new and not pending and not finished:
+            raise PreventUpdate
+        chunks = dict(job=job_id, columns=TABLE_COLUMNS,
+                      chunks=[dict(i=i, **job.rendered[i]['chunk']) for i in pending])
+        if not finished:
+            return [dash.no_update] * 7 + [job_progress(job=job), chunks]
+        tables = [job.rendered[i]['table'] for i in sorted(job.rendered) if not job.rendered[i]['table'].empty]
+        out_records = pd.concat(tables, ignore_index=True).to_records(index=False) if tables else None
+        out_tab_style = dict(display='block' if tables else 'none')
+        return [dash.no_update, dash.no_update, out_records, out_tab_style, dash.no_update, job_id, True,
+                job_progress(job=job), chunks]
 
-    api_results = common.query_api(inp_text=inp_text, pred_type="rex")
-    rex_results = common.request_handler(inp_request=api_results)
-    if rex_results is None:
-        return "Error querying the REX API - try in a few minutes", [], None, dict()
-    pkre, prodigy_output, extra_ents, sofs = rex_results['spark_format'], rex_results['main'], \
-                                             rex_results['extra_ents'], rex_results['sentence_offsets']
-    pkre = rexdemo.pkre2sparknlp(pkre=prodigy_output)
-    c_val_dicts = rexdemo.get_c_val_dicts(prodigy_output)
+    if not inp_text:
+        return "Enter some text to process", [], None, dict(display='none'), None, None, True, "", None
+    if document_mode:
+        previous_job = DOCUMENT_JOBS.get(job_id) if job_id else None
+        if previous_job is not None:
+            previous_job.cancel()
+        job = DocumentJob(inp_text=inp_text, pred_type="rex",
+                          predict_fn=lambda x: common.predict_exact(inp_text=x, pred_type="rex"),
+                          executor=DOCUMENT_EXECUTOR, max_chunk_chars=DOCUMENT_CHUNK_CHARS,
+                          render_fn=lambda x: render_chunk(rex_results=x, client_render=bool(client_render)))
+        job_id = uuid.uuid4().hex
+        DOCUMENT_JOBS.set(job_id, job)
+        return "", "", None, dict(display='none'), None, job_id, False, job_progress(job=job), \
+            dict(job=job_id, columns=TABLE_COLUMNS, chunks=[])
+
+    try:
+        rex_results = common.predict_by_sentence(inp_text=inp_text, pred_type="rex")
+    except common.APIError as e:
+        return common.api_error_message(inp_error=e, pred_type="rex"), [], None, dict(), None, None, True, "", None
+    return list(render_rex_results(rex_results=rex_results, client_render=bool(client_render))) + \
+        [None, True, "", None]
+
+
+def job_progress(job: DocumentJob) -> str:
+    if not job.finished:
+        return f"Processed {job.n_done} of {job.n_chunks} chunks..."
+    errors = job.errors()
+    if errors:
+        return f"{len(errors)} of {job.n_chunks} chunks could not be processed - " + \
+               common.api_error_message(inp_error=errors[0], pred_type="rex")
+    return ""
+
+
+def render_svg(main: Dict) -> str:
+    return cached_render(lambda: VISUALIZER.display(rexdemo.pkre2sparknlp(pkre=main), relation_col='relations',
+                                                    return_html=True, exclude_relations=["NO_RELATION"],
+                                                    max_x=1700, font_url=FONTS_ROUTE + FONT_FILE),
+                         "rex", main['text'], main['spans'], main['relations'], 1700, FONTS_ROUTE + FONT_FILE)
+
+
+def render_chunk(rex_results: Dict, client_render: bool) -> Dict:
+    """
+    Table of the central values of one document chunk and what the browser adds for it (see rex.add_chunks): its table
+    rows and its relations, as a compact graph (client_render) or an SVG. Estimates only look for their drug within
+    the chunk
+    """
+    c_val_dicts_mentions = rexdemo.extract_estimates(rex_results=rex_results)
+    table = rexdemo.cvalmentions2table(inp_cvals=c_val_dicts_mentions) if c_val_dicts_mentions else pd.DataFrame()
+    main = rex_results['main']
+    chunk = dict(rows=[[None if pd.isna(v) else v for v in row]
+                       for row in table.reindex(columns=TABLE_COLUMNS).values.tolist()])
+    if client_render:
+        chunk['graph'] = rexdemo.pkre2graph(pkre=main, exclude_relations=["NO_RELATION"],
+                                            font_url=FONTS_ROUTE + FONT_FILE)
+    else:
+        chunk['html'] = render_svg(main)
+    return dict(table=table, chunk=chunk)
+
+
+def render_rex_results(rex_results: Dict, client_render: bool = False):
+    """
+    Relations visualization, table of central values with their drugs, table records, download button style and the
+    compact relation graph drawn in the browser (client_render, the visualization is then empty)
+    """
+    out_tab_style = {'display': 'none'}
+    c_val_dicts_mentions = rexdemo.extract_estimates(rex_results=rex_results)
     out_records = None
-    if c_val_dicts:
-        extra_ents = rexdemo.remove_bad_chemicals(inp_chemicals=extra_ents, inp_cvals=c_val_dicts)
-        c_val_dicts = rexdemo.add_drugs(inp_c_val_dicts=c_val_dicts, inp_extra_dicts=extra_ents,
-                                        sentences_offsets=sofs)
-        c_val_dicts_mentions = rexdemo.transform2mentions(inp_text=prodigy_output["text"], inp_c_val_dicts=c_val_dicts)
+    if c_val_dicts_mentions:
         tabular_output = rexdemo.cvalmentions2table(inp_cvals=c_val_dicts_mentions)
 
         out_records = tabular_output.to_records(index=False)
@@ -153,9 +296,11 @@ def update_output(inp_text, _):
                                                    )
     else:
         out_tabular_div = ""
-    visualizer = RelationExtractionVisualizer()
-    html_content = visualizer.display(pkre, relation_col='relations', return_html=True,
-                                      exclude_relations=["NO_RELATION"], max_x=1700)
+    main = rex_results['main']
+    if client_render:
+        graph = rexdemo.pkre2graph(pkre=main, exclude_relations=["NO_RELATION"], font_url=FONTS_ROUTE + FONT_FILE)
+        return "", out_tabular_div, out_records, out_tab_style, graph
+    html_content = render_svg(main)
 
     # clean_rels = [x for x in prodigy_output['relations'] if x['label'] != 'NO_RELATION']
     # cvals = [x['child_span'] for x in clean_rels if x['label'] == 'C_VAL' and x['child_span']['label'] == "VALUE"]
@@ -165,7 +310,26 @@ def update_output(inp_text, _):
     html_content = '<div>' + html_content + '</div>'
     out_img = html.Div(dash_dangerously_set_inner_html.DangerouslySetInnerHTML(html_content), style=dict(margin="auto"))
 
-    return out_img, out_tabular_div, out_records, out_tab_style
+    return out_img, out_tabular_div, out_records, out_tab_style, None
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="rex", function_name="render_graph"),
+    Output("rex-graph-output", "className"),
+    Input("rex-graph", "data")
+)
+
+app.clientside_callback(
+    ClientsideFunction(namespace="rex", function_name="add_chunks"),
+    Output("rex-drawn", "data"),
+    Input("rex-chunks", "data"),
+    State("rex-drawn", "data")
+)
+
+
+@server.route(FONTS_ROUTE + "<path:filename>")
+def serve_font(filename):
+    return send_from_directory(FONTS_DIR, filename, max_age=FONT_MAX_AGE)
 
 
 @app.callback(
@@ -187,11 +351,31 @@ def fun(_, inp_records):
 
 @app.callback(
     Output("rex-input", "value"),
-    [Input("rex-clear-button", "n_clicks")],
+    Output("rex-document-mode", "value"),
+    [Input("rex-clear-button", "n_clicks"),
+     Input("rex-upload", "contents")],
     prevent_initial_call=True
 )
-def update_output2(_):
-    return None
+def update_output2(_, upload_contents):
+    """
+    Clears the input, or loads an uploaded plain-text file and switches to document mode
+    """
+    if dash.callback_context.triggered[0]['prop_id'].startswith("rex-upload"):
+        if upload_contents is None:
+            raise PreventUpdate
+        encoded = upload_contents.split(",", 1)[-1]
+        return base64.b64decode(encoded).decode("utf-8", errors="replace"), [1]
+    return None, dash.no_update
+
+
+@app.callback(
+    Output("rex-input", "maxLength"),
+    Input("rex-document-mode", "value")
+)
+def update_max_length(document_mode):
+    if document_mode:
+        return DOCUMENT_MAX_LENGTH
+    return TEXT_MAX_LENGTH
 
 
 @app.callback(
@@ -0,0 +1,275 @@
+/*
+Browser-side drawing of the relation graphs of the REX demo, from the compact JSON of utils.rexdemo.pkre2graph:
+{t: text, e: [[start, end, label], ...], r: [[head entity, child entity, label], ...], ec: entity label colours,
+rc: relation label colours, f: font URL}. The layout follows spark_display.relation_extraction: words and entities
+are wrapped into lines, entities are highlighted with their label below and relations are drawn as arrows above.
+The chunks of a document job are added one by one as they are done, in document order, with their table rows.
+*/
+(function () {
+    var SVG_NS = "http://www.w3.org/2000/svg";
+    var START_X = 10;
+    var START_Y = 75;
+    var LINE_HEIGHT = 100;
+    var DEFAULT_WIDTH = 1700;
+    var FONT = "Lucida";
+    var WORD_COLOR = "#afb1b3";
+    var CHUNK_COLOR = "#d3e5eb";
+    var LABEL_COLOR = "#bfb8b2";
+    var RELATION_BACKGROUND = "#303030";
+
+    function textWidth(text) {
+        return (text.length + 1) * 9.7 - 5;
+    }
+
+    function element(tag, attributes, text) {
+        var node = document.createElementNS(SVG_NS, tag);
+        Object.keys(attributes).forEach(function (k) {
+            node.setAttribute(k, attributes[k]);
+        });
+        if (text !== undefined) {
+            node.textContent = text;
+        }
+        return node;
+    }
+
+    function layout(graph, maxX) {
+        var words = [], entities = {}, x = START_X, y = START_Y, position = 0;
+
+        function newLine() {
+            x = START_X;
+            y += LINE_HEIGHT;
+        }
+
+        function place(width) {
+            if (x + width + 10 >= maxX && x > START_X) {
+                newLine();
+            }
+        }
+
+        function addText(text) {
+            text.replace(/\s*\n+/g, "\n").trim().split("\n").forEach(function (line, n) {
+                if (n > 0) {
+                    newLine();
+                }
+                line.split(" ").forEach(function (word) {
+                    if (!word) {
+                        return;
+                    }
+                    var width = textWidth(word);
+                    place(width);
+                    words.push({text: word, x: x, y: y});
+                    x += width + 10;
+                });
+            });
+        }
+
+        var order = graph.e.map(function (_, i) {
+            return i;
+        }).sort(function (a, b) {
+            return graph.e[a][0] - graph.e[b][0];
+        });
+        order.forEach(function (i) {
+            var ent = graph.e[i];
+            if (ent[0] < position) {
+                return;  // overlaps the previous entity
+            }
+            addText(graph.t.slice(position, ent[0]));
+            var chunk = graph.t.slice(ent[0], ent[1]), width = textWidth(chunk);
+            place(width);
+            entities[i] = {text: chunk, label: ent[2], x: x, y: y, width: width, nIn: 0, nOut: 0};
+            x += width + 20;
+            position = ent[1];
+        });
+        addText(graph.t.slice(position));
+        return {words: words, entities: entities, height: y + LINE_HEIGHT};
+    }
+
+    function arrow(graph, head, child, label) {
+        // endpoints are spread around the centre of the entities when several arrows start or end there
+        var direction = child.x + child.width / 2 >= head.x + head.width / 2 ? 1 : -1;
+        var sx = head.x + head.width / 2 + direction * (10 + 5 * head.nOut++);
+        var ex = child.x + child.width / 2 - direction * (10 + 5 * child.nIn++);
+        var sy, ey, c1y, c2y;
+        if (head.y === child.y) {
+            sy = head.y - 20;
+            ey = sy - 4;
+            c1y = c2y = sy - 50;
+        } else if (head.y > child.y) {
+            sy = head.y - 20;
+            ey = child.y + 30;
+            c1y = c2y = (sy + ey) / 2;
+        } else {
+            sy = head.y - 20;
+            ey = child.y - 20;
+            c1y = c2y = (sy + ey) / 2;
+        }
+        var color = graph.rc[label] || "#888888";
+        var nodes = [element("path", {
+            d: "M" + sx + "," + sy + " C" + sx + "," + c1y + " " + ex + "," + c2y + " " + ex + "," + ey,
+            stroke: color, "stroke-width": 1, fill: "none"
+        })];
+        // arrow head along the tangent at the end of the curve (its last control point is right above or below it)
+        var dy = ey > c2y ? 1 : -1;
+        nodes.push(element("polyline", {
+            points: (ex - 5) + "," + (ey - 5 * dy) + " " + ex + "," + ey + " " + (ex + 5) + "," + (ey - 5 * dy),
+            stroke: color, "stroke-width": 1, fill: "none"
+        }));
+        // label at the middle of the curve
+        var mx = (sx + ex) / 2, my = (sy + 3 * c1y + 3 * c2y + ey) / 8;
+        var labelWidth = textWidth(label) / 1.35;
+        nodes.push(element("rect", {
+            x: mx - labelWidth / 2 - 3, y: my - 10, width: labelWidth + 3, height: 13, rx: 2, ry: 2,
+            fill: RELATION_BACKGROUND, stroke: color, "stroke-width": 1
+        }));
+        nodes.push(element("text", {x: mx - labelWidth / 2, y: my, fill: color, "font-size": 12,
+                                    "font-family": "courier"}, label));
+        return nodes;
+    }
+
+    function draw(graph, maxX) {
+        var placed = layout(graph, maxX);
+        var svg = element("svg", {width: maxX, height: placed.height, version: "1.1"});
+        if (graph.f) {
+            svg.appendChild(element("style", {},
+                "@font-face {font-family: '" + FONT + "'; src: url('" + graph.f + "') format('truetype');}"));
+        }
+        Object.keys(placed.entities).forEach(function (i) {
+            var ent = placed.entities[i], color = graph.ec[ent.label] || "#888888";
+            svg.appendChild(element("rect", {
+                x: ent.x - 3, y: ent.y - 18, width: ent.width, height: 25, rx: 2, ry: 2, stroke: color,
+                "stroke-width": 1, fill: color, "fill-opacity": 0.2
+            }));
+            svg.appendChild(element("text", {x: ent.x, y: ent.y, fill: CHUNK_COLOR, "font-size": 16,
+                                             "font-family": FONT, style: "font-weight:100"}, ent.text));
+            svg.appendChild(element("text", {
+                x: ent.x + ent.width / 2 - textWidth(ent.label) / 2.75, y: ent.y + 20, fill: LABEL_COLOR,
+                "font-size": 14, "font-family": FONT, style: "font-weight:lighter"
+            }, ent.label.toUpperCase()));
+        });
+        placed.words.forEach(function (word) {
+            svg.appendChild(element("text", {x: word.x, y: word.y, fill: WORD_COLOR, "font-size": 16,
+                                             "font-family": FONT, style: "font-weight:100"}, word.text));
+        });
+        var arcs = element("g", {}), labels = element("g", {});
+        svg.appendChild(arcs);
+        svg.appendChild(labels);
+        graph.r.forEach(function (rel) {
+            var head = placed.entities[rel[0]], child = placed.entities[rel[1]];
+            if (!head || !child) {
+                return;
+            }
+            var nodes = arrow(graph, head, child, rel[2]);
+            nodes.slice(0, 2).forEach(function (n) {
+                arcs.appendChild(n);
+            });
+            nodes.slice(2).forEach(function (n) {
+                labels.appendChild(n);
+            });
+        });
+        return svg;
+    }
+
+    function clear(container) {
+        while (container.firstChild) {
+            container.removeChild(container.firstChild);
+        }
+    }
+
+    function graphWidth(container) {
+        return Math.min(container.clientWidth || DEFAULT_WIDTH, DEFAULT_WIDTH);
+    }
+
+    // nodes carry the position of their chunk in data-chunk, so that chunks done out of order are shown in order
+    function insertInOrder(container, node, position) {
+        node.setAttribute("data-chunk", position);
+        var next = Array.prototype.find.call(container.children, function (child) {
+            return child.hasAttribute("data-chunk") && Number(child.getAttribute("data-chunk")) > position;
+        });
+        container.insertBefore(node, next || null);
+    }
+
+    function chunksTable(container, columns) {
+        var table = container.querySelector("table");
+        if (table) {
+            return table;
+        }
+        var head = document.createElement("thead"), row = document.createElement("tr");
+        table = document.createElement("table");
+        table.className = "table table-striped table-bordered table-hover";
+        columns.forEach(function (c) {
+            var cell = document.createElement("th");
+            cell.textContent = c;
+            row.appendChild(cell);
+        });
+        head.appendChild(row);
+        table.appendChild(head);
+        container.appendChild(table);
+        return table;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        rex: {
+            // chunks: {job, columns, chunks: [{i, rows, graph or html}, ...]} sent by the server on every tick,
+            // returns the chunks of the job drawn so far ({job, chunks: [i, ...]}), chunks already drawn are skipped
+            add_chunks: function (chunks, drawn) {
+                var output = document.getElementById("rex-doc-output"),
+                    table = document.getElementById("rex-doc-table");
+                if (!output || !table) {
+                    return window.dash_clientside.no_update;
+                }
+                if (!chunks || !drawn || drawn.job !== chunks.job) {
+                    clear(output);
+                    clear(table);
+                    drawn = {job: chunks ? chunks.job : null, chunks: []};
+                }
+                if (!chunks) {
+                    return drawn;
+                }
+                var done = {};
+                drawn.chunks.forEach(function (i) {
+                    done[i] = true;
+                });
+                var added = [];
+                chunks.chunks.forEach(function (chunk) {
+                    if (done[chunk.i]) {
+                        return;
+                    }
+                    var segment = document.createElement("div");
+                    if (chunk.graph) {
+                        segment.appendChild(draw(chunk.graph, graphWidth(output)));
+                    } else {
+                        segment.innerHTML = chunk.html;
+                    }
+                    insertInOrder(output, segment, chunk.i);
+                    if (chunk.rows.length) {
+                        // rows of one chunk are kept together in a tbody of their own
+                        var rows = document.createElement("tbody");
+                        chunk.rows.forEach(function (values) {
+                            var row = document.createElement("tr");
+                            values.forEach(function (v) {
+                                var cell = document.createElement("td");
+                                cell.textContent = v === null ? "" : v;
+                                row.appendChild(cell);
+                            });
+                            rows.appendChild(row);
+                        });
+                        insertInOrder(chunksTable(table, chunks.columns), rows, chunk.i);
+                    }
+                    added.push(chunk.i);
+                });
+                return {job: drawn.job, chunks: drawn.chunks.concat(added)};
+            },
+            render_graph: function (graph) {
+                var container = document.getElementById("rex-graph-output");
+                if (!container) {
+                    return "";
+                }
+                clear(container);
+                if (graph) {
+                    container.appendChild(draw(graph, graphWidth(container)));
+                }
+                return "";
+            }
+        }
+    });
+})();
@@ -3,7 +3,7 @@ from dash.dependencies import Input, Output
 import dash_bootstrap_components as dbc
 
 from app import app, server
-from apps import pkdocsearch, pkrexdemo, pkhome, pknerdemo, about, team, pkdatabase
+from apps import pkdocsearch, pkrexdemo, pkhome, pknerdemo, about, team, pkdatabase, pkbulkapi
 from utils import common
 
 navbar = dbc.NavbarSimple(
@@ -0,0 +1,238 @@
+"""
+Streaming build of the PK estimates database.
+
+Predicted sentences are read from a JSONL file (one PKSentence input per line: text, relations, pmid, is_title),
+grouped into abstracts by PMID and fanned out in batches to a pool of worker processes. Each batch of estimate
+records and estimate spans is written straight to Parquet, so memory is bounded by the batches in flight rather
+than by the size of the corpus. A fingerprint of every abstract (its predicted sentences and the model version) is
+written to ABSTRACTS_FILE so that later rebuilds can skip unchanged abstracts. The unit mention of every estimate is
+kept in ESTIMATES_FILE, so that the estimates hit by a change of the unit standardisation tables can be standardised
+again without reprocessing their abstracts (see pkcase.segments).
+
+python -m pkcase.corpus --input sentences.jsonl --output-dir datasets/pkdatabase --workers 8
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+from pkcase.markup import compress_markup, entities_markup
+from pkcase.predicted import PKSentence, PKAbstract, PKAbstractsDB, PKEstimate
+
+RECORDS_FILE = "maindb.parquet"
+ESTIMATES_FILE = "estimates.parquet"
+ABSTRACTS_FILE = "abstracts.parquet"
+RECORDS_COLUMNS = ["PMID", "Parameter", "Type", "Value", "Units", "Compare", "Sentece", "Title", "URL", "ID"]
+SPAN_RECORD_COLUMNS = ["ID", "PMID", "Sentence", "Value", "UnitsMention", "Entities", "Markup"]
+FINGERPRINT_FIELDS = ["text", "relations", "is_title"]
+
+ProcessedAbstract = Tuple[Dict, List[Dict], List[Dict]]
+
+
+def read_sentences(inp_path: str) -> Iterator[Dict]:
+    """
+    Reads a JSONL file, or all the JSONL files of a directory (e.g. the shards written by pkcase.inference)
+    """
+    paths = [inp_path]
+    if os.path.isdir(inp_path):
+        paths = [os.path.join(inp_path, x) for x in sorted(os.listdir(inp_path)) if x.endswith(".jsonl")]
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def group_abstracts(inp_sentences: Iterable[Dict]) -> Iterator[List[Dict]]:
+    """
+    Groups consecutive sentences sharing the same PMID, the input is expected to be grouped by PMID
+    """
+    for _, abstract_sents in itertools.groupby(inp_sentences, key=lambda x: x['pmid']):
+        yield list(abstract_sents)
+
+
+def batch_elements(inp_elements: Iterable, batch_size: int) -> Iterator[List]:
+    iterator = iter(inp_elements)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def hash_json(inp_object) -> str:
+    return hashlib.sha256(json.dumps(inp_object, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def abstract_fingerprint(inp_sentences: List[Dict], model_version: str) -> str:
+    """
+    Identifies the inputs of an abstract: its predicted sentences and the model that predicted them
+    """
+    sentences = [{k: s.get(k) for k in FINGERPRINT_FIELDS} for s in inp_sentences]
+    return hash_json([sentences, model_version])
+
+
+def output_hash(inp_records: List[Dict], inp_span_records: List[Dict]) -> str:
+    """
+    Identifies the outputs of an abstract regardless of the estimate IDs they were given (the markup is derived from the
+    sentence and its entities, so it is left out)
+    """
+    records = [{k: v for k, v in r.items() if k != "ID"} for r in inp_records]
+    span_records = [{k: v for k, v in r.items() if k not in ["ID", "Markup"]} for r in inp_span_records]
+    return hash_json([records, span_records])
+
+
+def format_span_record(inp_estimate: PKEstimate, pmid, est_id) -> Dict:
+    ents = inp_estimate.get_character_spans()
+    return {
+        "ID": est_id,
+        "PMID": pmid,
+        "Sentence": inp_estimate.sent_text,
+        "Value": inp_estimate.central_v.text,
+        "UnitsMention": PKEstimate.get_text_or_none(inp_estimate.central_v_units),
+        "Entities": json.dumps(ents),
+        "Markup": compress_markup(entities_markup(inp_text=inp_estimate.sent_text, inp_ents=ents))
+    }
+
+
+def process_abstracts(inp_abstracts: List[List[Dict]], model_version: str = "") -> List[ProcessedAbstract]:
+    """
+    Worker function: builds the abstracts of a batch and returns, for every abstract, its fingerprint entry, its estimate
+    records and its estimate span records. IDs are left empty and assigned by the writer so that they do not depend on
+    the number of workers
+    """
+    out = []
+    for abstract_sents in inp_abstracts:
+        abstract = PKAbstract(inp_sents=[PKSentence(inp_sent=s) for s in abstract_sents])
+        records, span_records = [], []
+        for tmp_e, original_est, s in PKAbstractsDB.abstract_estimates(abstract=abstract):
+            records.append(PKAbstractsDB.format_est(inp_dict=tmp_e, pmid=abstract.pmid, sentence_text=s.text,
+                                                    title=abstract.title, est_id=None))
+            span_records.append(format_span_record(inp_estimate=original_est, pmid=abstract.pmid, est_id=None))
+        entry = {
+            "PMID": abstract.pmid,
+            "Fingerprint": abstract_fingerprint(inp_sentences=abstract_sents, model_version=model_version),
+            "OutputHash": output_hash(inp_records=records, inp_span_records=span_records),
+            "Estimates": len(records)
+        }
+        out.append((entry, records, span_records))
+    return out
+
+
+def imap_bounded(executor: ProcessPoolExecutor, fn, inp_elements: Iterable, max_in_flight: int) -> Iterator:
+    """
+    Ordered map over an executor that keeps at most max_in_flight tasks submitted (Executor.map would consume the
+    whole input first)
+    """
+    in_flight = deque()
+    for x in inp_elements:
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().result()
+        in_flight.append(executor.submit(fn, x))
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+class ParquetBatchWriter(object):
+    """
+    Appends batches of records to a Parquet file as row groups, the schema is taken from the first batch
+    """
+
+    def __init__(self, inp_path: str):
+        self.path = inp_path
+        self.writer = None
+        self.n_rows = 0
+
+    def write(self, inp_records: List[Dict]):
+        if not inp_records:
+            return
+        table = pa.Table.from_pandas(pd.DataFrame(inp_records), preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = table.cast(self.writer.schema)
+        self.writer.write_table(table)
+        self.n_rows += len(inp_records)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def build_corpus(inp_path: str, out_dir: str, n_workers: int = None, batch_size: int = 100, start_id: int = 0,
+                 model_version: str = "") -> int:
+    """
+    Builds the estimate records (RECORDS_FILE), the estimate span store (ESTIMATES_FILE) and the abstract fingerprints
+    (ABSTRACTS_FILE) in out_dir from a JSONL file of predicted sentences. Returns the number of estimates written
+    """
+    return write_corpus(inp_sentences=read_sentences(inp_path), out_dir=out_dir, n_workers=n_workers,
+                        batch_size=batch_size, start_id=start_id, model_version=model_version)
+
+
+def write_corpus(inp_sentences: Iterable[Dict], out_dir: str, n_workers: int = None, batch_size: int = 100,
+                 start_id: int = 0, model_version: str = "", inp_filter: Union[Callable[[Dict], bool], None] = None
+                 ) -> int:
+    """
+    Same as build_corpus for any iterable of predicted sentences grouped by PMID, estimate IDs start at start_id.
+    Abstracts whose fingerprint entry does not pass inp_filter are still listed in ABSTRACTS_FILE (with Rows=False)
+    but their estimates are not written
+    """
+    n_workers = n_workers or os.cpu_count()
+    os.makedirs(out_dir, exist_ok=True)
+    records_writer = ParquetBatchWriter(os.path.join(out_dir, RECORDS_FILE))
+    spans_writer = ParquetBatchWriter(os.path.join(out_dir, ESTIMATES_FILE))
+    abstracts_writer = ParquetBatchWriter(os.path.join(out_dir, ABSTRACTS_FILE))
+    batches = batch_elements(group_abstracts(inp_sentences), batch_size=batch_size)
+    worker = partial(process_abstracts, model_version=model_version)
+    est_id = start_id
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            for processed in tqdm(imap_bounded(executor, worker, batches, max_in_flight=2 * n_workers)):
+                records, span_records, entries = [], [], []
+                for entry, abstract_records, abstract_span_records in processed:
+                    entry["Rows"] = inp_filter is None or inp_filter(entry)
+                    entries.append(entry)
+                    if not entry["Rows"]:
+                        continue
+                    for r, sr in zip(abstract_records, abstract_span_records):
+                        r["ID"] = est_id
+                        sr["ID"] = est_id
+                        est_id += 1
+                    records.extend(abstract_records)
+                    span_records.extend(abstract_span_records)
+                records_writer.write(records)
+                spans_writer.write(span_records)
+                abstracts_writer.write(entries)
+    finally:
+        records_writer.close()
+        spans_writer.close()
+        abstracts_writer.close()
+    return est_id - start_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the PK estimates database from predicted sentences")
+    parser.add_argument("--input", required=True, help="JSONL file (or directory of JSONL files) with predicted "
+                                                       "sentences grouped by PMID")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Abstracts per worker task")
+    parser.add_argument("--model-version", default="", help="Version of the model that predicted the input sentences")
+    args = parser.parse_args()
+    n_estimates = build_corpus(inp_path=args.input, out_dir=args.output_dir, n_workers=args.workers,
+                               batch_size=args.batch_size, model_version=args.model_version)
+    print(f"{n_estimates} estimates written to {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+Batch relation extraction over a corpus of abstracts with the PKPDAI REX API.
+
+Abstracts are read from a JSONL file (one abstract per line: pmid, title, abstract) and sent to pred_rex with a bounded
+number of requests in flight. Failed requests are retried with exponential backoff. Predictions are split into
+sentences and written as JSONL shards in the input format of pkcase.corpus. Every completed shard is recorded in a
+checkpoint file, so an interrupted run resumes where it stopped.
+
+python -m pkcase.inference --input abstracts.jsonl --output-dir datasets/predictions --workers 16
+python -m pkcase.corpus --input datasets/predictions --output-dir datasets/pkdatabase
+"""
+import argparse
+import bisect
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterator, List, Set, Tuple
+
+import requests
+from tqdm import tqdm
+
+API_URL = "https://pkpdai.azurewebsites.net/"
+CHECKPOINT_FILE = "checkpoint.json"
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+class InferenceError(Exception):
+    pass
+
+
+def read_abstracts(inp_path: str) -> Iterator[Dict]:
+    with open(inp_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def abstract_text(inp_abstract: Dict) -> Tuple[str, int]:
+    """
+    Text sent to the API for an abstract and the character offset where its title ends
+    """
+    title = (inp_abstract.get('title') or "").strip()
+    body = (inp_abstract.get('abstract') or "").strip()
+    if title:
+        return f"{title} {body}".strip(), len(title)
+    return body, 0
+
+
+def shift_span(inp_span: Dict, offset: int) -> Dict:
+    out = dict(inp_span)
+    out['start'] -= offset
+    out['end'] -= offset
+    return out
+
+
+def rex2sentences(inp_pmid, inp_result: Dict, title_end: int = 0) -> List[Dict]:
+    """
+    Splits a pred_rex result into the sentences expected by pkcase.corpus (text, relations, pmid, is_title), with
+    relations re-based on the sentence offsets. Relations across sentences are dropped
+    """
+    text = inp_result['main']['text']
+    sent_offs = sorted(tuple(x) for x in inp_result['sentence_offsets'])
+    starts = [s for s, _ in sent_offs]
+    sentences = [dict(text=text[s:e], relations=[], pmid=inp_pmid, is_title=s < title_end) for s, e in sent_offs]
+    for r in inp_result['main']['relations']:
+        head, child = r['head_span'], r['child_span']
+        pos = bisect.bisect_right(starts, min(head['start'], child['start'])) - 1
+        if pos < 0 or max(head['end'], child['end']) > sent_offs[pos][1]:
+            continue
+        offset = sent_offs[pos][0]
+        sentences[pos]['relations'].append(dict(left=shift_span(head, offset), right=shift_span(child, offset),
+                                                label=r['label']))
+    return sentences
+
+
+class RexBatchRunner(object):
+    def __init__(self, out_dir: str, api_url: str = API_URL, max_in_flight: int = 8, max_retries: int = 5,
+                 backoff: float = 1., max_backoff: float = 60., connect_timeout: float = 5., read_timeout: float = 60.,
+                 shard_size: int = 1000):
+        self.out_dir = out_dir
+        self.query_url = api_url.rstrip("/") + "/pred_rex"
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = (connect_timeout, read_timeout)
+        self.shard_size = shard_size
+        self.checkpoint_path = os.path.join(out_dir, CHECKPOINT_FILE)
+        self.local = threading.local()
+
+    def read_checkpoint(self) -> Dict:
+        if not os.path.isfile(self.checkpoint_path):
+            return dict(shards=0, done=[], failed=dict())
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_checkpoint(self, checkpoint: Dict):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def shard_path(self, shard_id: int) -> str:
+        return os.path.join(self.out_dir, f"shard-{shard_id:05d}.jsonl")
+
+    def session(self) -> requests.Session:
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def backoff_delay(self, attempt: int) -> float:
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.)
+
+    def predict(self, inp_text: str) -> Dict:
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff_delay(attempt - 1))
+            try:
+                response = self.session().post(self.query_url, json=dict(text=inp_text), timeout=self.timeout)
+            except requests.RequestException as e:
+                error = f"{type(e).__name__}: {e}"
+                continue
+            if response.status_code in [200, 201]:
+                try:
+                    return response.json()
+                except ValueError as e:
+                    raise InferenceError(f"Invalid JSON response: {e}") from e
+            error = f"HTTP {response.status_code}"
+            if response.status_code not in RETRY_STATUSES:
+                break
+        raise InferenceError(error)
+
+    def process(self, inp_abstract: Dict) -> List[Dict]:
+        text, title_end = abstract_text(inp_abstract)
+        if not text:
+            return []
+        result = self.predict(text)
+        try:
+            return rex2sentences(inp_pmid=inp_abstract['pmid'], inp_result=result, title_end=title_end)
+        except (KeyError, TypeError, ValueError) as e:
+            raise InferenceError(f"Unexpected response ({type(e).__name__}: {e})") from e
+
+    def run(self, inp_path: str) -> Dict:
+        """
+        Predicts every abstract of inp_path that is not in the checkpoint yet. Returns the number of abstracts done and
+        failed in this run
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        checkpoint = self.read_checkpoint()
+        done: Set = set(checkpoint['done'])
+        failed = checkpoint['failed']
+        shard_pmids, shard_lines = [], []
+        stats = dict(done=0, failed=0)
+
+        def flush_shard():
+            if not shard_pmids:
+                return
+            tmp_path = self.shard_path(checkpoint['shards']) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(shard_lines)
+            os.replace(tmp_path, self.shard_path(checkpoint['shards']))
+            checkpoint['shards'] += 1
+            checkpoint['done'].extend(shard_pmids)
+            for pmid in shard_pmids:
+                failed.pop(str(pmid), None)
+            self.write_checkpoint(checkpoint)
+            shard_pmids.clear()
+            shard_lines.clear()
+
+        def collect(futures):
+            for future in futures:
+                pmid = in_flight.pop(future)
+                try:
+                    sentences = future.result()
+                except InferenceError as e:
+                    failed[str(pmid)] = str(e)
+                    stats['failed'] += 1
+                    continue
+                shard_pmids.append(pmid)
+                shard_lines.extend(json.dumps(s) + "\n" for s in sentences)
+                stats['done'] += 1
+                progress.update()
+                if len(shard_pmids) >= self.shard_size:
+                    flush_shard()
+
+        in_flight = dict()
+        progress = tqdm(desc="abstracts")
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+                for abstract in read_abstracts(inp_path):
+                    if abstract['pmid'] in done:
+                        continue
+                    if len(in_flight) >= self.max_in_flight:
+                        finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(finished)
+                    in_flight[executor.submit(self.process, abstract)] = abstract['pmid']
+                    done.add(abstract['pmid'])
+                collect(list(wait(in_flight).done))
+        finally:
+            flush_shard()
+            self.write_checkpoint(checkpoint)
+            progress.close()
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch relation extraction of abstracts with the PKPDAI REX API")
+    parser.add_argument("--input", required=True, help="JSONL file with one abstract per line (pmid, title, abstract)")
+    parser.add_argument("--output-dir", required=True, help="Directory for the JSONL shards and the checkpoint")
+    parser.add_argument("--api-url", default=API_URL)
+    parser.add_argument("--workers", type=int, default=8, help="Maximum number of requests in flight")
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--backoff", type=float, default=1., help="First retry delay in seconds, doubled every retry")
+    parser.add_argument("--shard-size", type=int, default=1000, help="Abstracts per shard")
+    args = parser.parse_args()
+    runner = RexBatchRunner(out_dir=args.output_dir, api_url=args.api_url, max_in_flight=args.workers,
+                            max_retries=args.retries, backoff=args.backoff, shard_size=args.shard_size)
+    stats = runner.run(inp_path=args.input)
+    print(f"{stats['done']} abstracts predicted, {stats['failed']} failed (run again to retry them)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+Highlighted-sentence markup of PK estimates (the entities of an estimate as <mark> elements, styled by
+assets/entities.css), built once per estimate when the database is built and stored zlib-compressed.
+"""
+import html
+import zlib
+from typing import Dict, List
+
+from pkcase.predicted import unique_dicts
+
+ENTITY_LABELS = ["PK", "VALUE", "RANGE", "UNITS", "COMPARE"]
+
+
+def entities_markup(inp_text: str, inp_ents: List[Dict]) -> str:
+    """
+    Sentence with its entities highlighted. Duplicated entities are dropped, as well as entities overlapping a
+    previous one
+    """
+    parts = []
+    end_previous = 0
+    for ent in sorted(unique_dicts(inp_ents), key=lambda anno: anno['start']):
+        if ent['start'] < end_previous:
+            continue
+        label = ent['label'] if ent['label'] in ENTITY_LABELS else "OTHER"
+        parts.append(html.escape(inp_text[end_previous:ent['start']]))
+        parts.append(f'<mark class="ent ent-{label.lower()}">{html.escape(inp_text[ent["start"]:ent["end"]])}'
+                     f'<span>{html.escape(ent["label"])}</span></mark>')
+        end_previous = ent['end']
+    parts.append(html.escape(inp_text[end_previous:]))
+    return '<div class="entities">' + "".join(parts).replace("\n", "<br>") + '</div>'
+
+
+def compress_markup(inp_markup: str) -> bytes:
+    return zlib.compress(inp_markup.encode("utf-8"), 9)
+
+
+def decompress_markup(inp_data: bytes) -> str:
+    return zlib.decompress(inp_data).decode("utf-8")
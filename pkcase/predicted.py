@@ -1,5 +1,6 @@
+import json
 from collections import Counter
-from typing import List, Dict, Union, Tuple
+from typing import List, Dict, Union, Tuple, Iterable, Set
 from termcolor import colored
 import re
 
@@ -39,6 +40,58 @@ MAGNITUDES = {
 RANGE_SEPARATORS = [', and ,', '- x (-)', 'to over', '·–·', ',–,', 'and', '–‐', '−,', '%-', 'to', '-', '‐', '−', ';',
                     ',', '–']
 
+WEIGHT_NORMALISATIONS = ['70·kg(-1)', '70·kg-1', '70·(kg)-1']
+STANDARD_WEIGHT = '70·kg'
+OPEN_BRACKETS = '([{'
+CLOSE_BRACKETS = ')]}'
+MINUS_SIGNS = '-−'
+
+
+def standardisation_tables() -> Dict:
+    """
+    Snapshot of the unit standardisation tables (JSON-serialisable), stored with the estimates standardised with them
+    """
+    tables = dict(TO_REMOVE=TO_REMOVE, UNIT_SYNONYMS=UNIT_SYNONYMS, MAGNITUDES=MAGNITUDES,
+                  RANGE_SEPARATORS=RANGE_SEPARATORS, WEIGHT_NORMALISATIONS=WEIGHT_NORMALISATIONS,
+                  STANDARD_WEIGHT=STANDARD_WEIGHT)
+    return json.loads(json.dumps(tables, ensure_ascii=False))
+
+
+def changed_unit_terms(old_tables: Dict, new_tables: Dict) -> Set[str]:
+    """
+    Terms of the entries that differ between two snapshots of the standardisation tables: the main form and all the
+    old and new synonyms of a changed synonym/magnitude entry, the added or removed items of a list and both values of
+    a changed string
+    """
+    terms = set()
+    for name in set(old_tables) | set(new_tables):
+        old_table, new_table = old_tables.get(name), new_tables.get(name)
+        if old_table == new_table:
+            continue
+        if isinstance(old_table, dict) or isinstance(new_table, dict):
+            old_table, new_table = old_table or {}, new_table or {}
+            for key in set(old_table) | set(new_table):
+                if old_table.get(key) != new_table.get(key):
+                    terms.update([key] + list(old_table.get(key) or []) + list(new_table.get(key) or []))
+        elif isinstance(old_table, list) and isinstance(new_table, list) and set(old_table) != set(new_table):
+            terms.update(set(old_table) ^ set(new_table))
+        elif isinstance(old_table, list) and isinstance(new_table, list):
+            # same items in another order (e.g. separators tried in order)
+            terms.update(old_table)
+        else:
+            terms.update(x for x in [old_table, new_table] if isinstance(x, str))
+    return terms
+
+
+def unit_mention_hits(inp_mention: str, inp_terms: Set[str]) -> bool:
+    """
+    True if a term of inp_terms appears in the unit mention, in its normalised form (before synonyms are replaced) or
+    in its standardised form. A conservative test: only mentions that do not hit any changed entry are guaranteed to
+    standardise the same way
+    """
+    forms = [inp_mention.lower(), normalise_unit(inp_mention), standardise_unit(inp_mention)]
+    return any(term in form for term in inp_terms for form in forms)
+
 
 def num_meas(inp_paper: List[Dict]) -> int:
     total_cvals = 0
@@ -72,6 +125,20 @@ def extract_sents_with_meas(inp_paper: List[Dict]) -> List[Dict]:
     return [s for s in inp_paper if has_cvals(s)]
 
 
+def unique_dicts(inp_dicts: Iterable[Dict]) -> List[Dict]:
+    """
+    Removes duplicated dictionaries (with hashable values) keeping the order of first appearance
+    """
+    seen = set()
+    out_dicts = []
+    for d in inp_dicts:
+        d_key = frozenset(d.items())
+        if d_key not in seen:
+            seen.add(d_key)
+            out_dicts.append(d)
+    return out_dicts
+
+
 class Span(object):
     def __init__(self, inp_dict: Dict, inp_text: str):
         self.start = inp_dict['start']
@@ -83,6 +150,13 @@ class Span(object):
         if self.label == "PK":
             self.is_param = True
 
+    @property
+    def key(self) -> Tuple[int, int, str]:
+        return self.start, self.end, self.label
+
+    def to_dict(self) -> Dict:
+        return dict(start=self.start, end=self.end, label=self.label)
+
 
 class PKSpan(Span):
     def __init__(self, inp_dict: Dict, inp_text: str):
@@ -135,7 +209,10 @@ def unit_std_dict(inp_mention: str, standard_dot: str = '·', standard_div: str
     return f"{standard_dot}".join(std_subunits_one)
 
 
-def standardise_unit(inp_mention: str) -> str:
+def normalise_unit(inp_mention: str) -> str:
+    """
+    First steps of standardise_unit: case, "per", dots and multiplication signs
+    """
     inp_mention = inp_mention.strip()
     inp_mention = "".join([x.lower() if x != 'M' else x for x in inp_mention])
     inp_mention = inp_mention.replace("per cent", "%")
@@ -150,6 +227,11 @@ def standardise_unit(inp_mention: str) -> str:
     for x in TO_REMOVE:
         inp_mention = inp_mention.replace(x, '')
     inp_mention = sub_all_mult(inp_mention=inp_mention)
+    return inp_mention
+
+
+def standardise_unit(inp_mention: str) -> str:
+    inp_mention = normalise_unit(inp_mention=inp_mention)
     inp_mention = unit_std_dict(inp_mention=inp_mention)
 
     inp_mention = inp_mention.replace("micro·", "μ")
@@ -157,70 +239,170 @@ def standardise_unit(inp_mention: str) -> str:
     return inp_mention
 
 
-def check_for_divide(inp_mention: str) -> str:
-    if len(inp_mention.split("/")) > 1:
-        # Checks for the first "/" and if more than one, conversts subsequent "/" to "·"
-        splt_on_divide = inp_mention.split("/", 1)
-        replaced_second_divide = [x.replace("/", "·") for x in splt_on_divide]
-        replaced_second_divide = ["(" + item + ")(-1)" for item in replaced_second_divide[1:]]
-        replaced_second_divide.insert(0, splt_on_divide[0])
-        new_inp_mention = "·".join(replaced_second_divide)
-        return new_inp_mention.strip("·")
+def match_weight(inp_mention: str, pos: int) -> Union[str, None]:
+    for weight in WEIGHT_NORMALISATIONS:
+        if inp_mention.startswith(weight, pos):
+            return weight
+    return None
+
 
-    return inp_mention
+def is_exponent_start(inp_mention: str, pos: int) -> bool:
+    """
+    True if a negative exponent ("-1", "−2", "^-1") starts at pos
+    """
+    if inp_mention[pos] == '^':
+        pos += 1
+    return pos + 1 < len(inp_mention) and inp_mention[pos] in MINUS_SIGNS and inp_mention[pos + 1].isdigit()
 
 
-def check_weight_bracket_dot_split(inp_mention: str) -> List:
-    weight_split = re.split(r"70·kg\(-1\)|70·kg-1|70·\(kg\)-1", inp_mention)
-    if len(weight_split) > 1:
-        weight_split = [minus for minus in weight_split if (minus != "" and minus is not None)]
-        weight_split = "".join(weight_split)
-        dot_split = re.split(r"·(?=[^\)]*(?:\(|$))", weight_split)
-        dot_split.extend(["70·kg(-1)"])
-        dot_split = [dot for dot in dot_split if (dot != "" and dot is not None)]
-    else:
-        dot_split = re.split(r"·(?=[^\)]*(?:\(|$))", inp_mention)
-        dot_split = [dot for dot in dot_split if (dot != "" and dot is not None)]
-    return dot_split
-
-
-def check_weight_dot_split(inp_mention: str) -> List:
-    if len(re.findall("70·kg\(-1\)|70·kg-1|70·\(kg\)-1", inp_mention)) >= 1:
-        weight_split = re.split("70·kg\(-1\)|70·kg-1|70·\(kg\)-1", inp_mention)
-        weight_split = [minus for minus in weight_split if (minus != "" and minus is not None)]
-        weight_split = "".join(weight_split)
-        dot_split = re.split(r"·", weight_split)
-        dot_split.extend(["70·kg(-1)"])
-        dot_split = [dot for dot in dot_split if (dot != "" and dot is not None)]
-    else:
-        dot_split = re.split(r"·", inp_mention)
-        dot_split = [dot for dot in dot_split if (dot != "" and dot is not None)]
-
-    return dot_split
-
-
-def check_for_brackets(inp_mention: str) -> List:
-    big_parenthesis_regex = r"\((.*?)\)-\d+|\((.*?)\)−\d+|\((.*?)\)\(-\d+\)|\((.*?)\)\(−\d+\)"
-    small_parenthesis_regex = r"\((-\d+)\)|\((−\d+)\)|(-\d+)|(−\d+)"
-    if len(re.findall(big_parenthesis_regex, inp_mention)) >= 1:
-        # split on dots outside of brackets only
-        dot_split = check_weight_bracket_dot_split(inp_mention)
-        brackets_split = [re.split(r"\((.*?)\)", dot) and re.split(r"(-\d)|(−\d)", dot) for dot in dot_split]
-        brackets_split = [[bracket for bracket in i if bracket is not None] for i in brackets_split]
-        brackets_split = [[num_bracket.strip("(){}[]") for num_bracket in i] for i in brackets_split]
-        brackets_split = [[bracket for bracket in i if bracket != ""] for i in brackets_split]
-        final_split = [[strip_bracket.replace("−", "-") for strip_bracket in i] for i in brackets_split]
-    elif len(re.findall(small_parenthesis_regex, inp_mention)) >= 1:
-        dot_split = check_weight_dot_split(inp_mention)
-        minus_one_split = [re.split(small_parenthesis_regex, dot2) for dot2 in dot_split]
-        minus_one_split = [[num_minus.strip("(){}[]") for num_minus in i if num_minus] for i in minus_one_split]
-        minus_one_split = [[minus for minus in i if (minus != "" and minus is not None)] for i in minus_one_split]
-        final_split = [[strip_minus.replace("−", "-") for strip_minus in i] for i in minus_one_split]
-    else:
-        final_split = [[inp_mention]]
-    if not all([0 < len(sublist) <= 2 for sublist in final_split]):
-        a = 1
-    return final_split
+def tokenize_unit(inp_mention: str) -> List[Tuple[str, str]]:
+    """
+    Splits a standardised unit mention into (token_type, value) tuples in a single left-to-right pass.
+    Token types: UNIT, DOT, DIV, OPEN, CLOSE, EXP (negative exponent as positive power, e.g. "1") and WEIGHT (the
+    "70 kg" normalisation, e.g. "70·kg-1")
+    e.g. ml·min-1/70·kg -> [(UNIT, ml), (DOT, ·), (UNIT, min), (EXP, 1), (DIV, /), (UNIT, 70), (DOT, ·), (UNIT, kg)]
+    """
+    tokens = []
+    pos = 0
+    n = len(inp_mention)
+    while pos < n:
+        char = inp_mention[pos]
+        weight = match_weight(inp_mention=inp_mention, pos=pos)
+        if weight is not None:
+            tokens.append(('WEIGHT', STANDARD_WEIGHT))
+            pos += len(weight)
+        elif char == '·':
+            tokens.append(('DOT', char))
+            pos += 1
+        elif char == '/':
+            tokens.append(('DIV', char))
+            pos += 1
+        elif char in OPEN_BRACKETS:
+            tokens.append(('OPEN', char))
+            pos += 1
+        elif char in CLOSE_BRACKETS:
+            tokens.append(('CLOSE', char))
+            pos += 1
+        elif is_exponent_start(inp_mention=inp_mention, pos=pos):
+            pos += 2 if char == '^' else 1
+            start = pos
+            # digits glued to a "70 kg" normalisation belong to the weight, e.g. h-170·kg-1
+            while pos < n and inp_mention[pos].isdigit() and (pos == start or match_weight(inp_mention, pos) is None):
+                pos += 1
+            tokens.append(('EXP', inp_mention[start:pos]))
+        else:
+            start = pos
+            pos += 1
+            while pos < n and inp_mention[pos] not in '·/' + OPEN_BRACKETS + CLOSE_BRACKETS and \
+                    not is_exponent_start(inp_mention=inp_mention, pos=pos) and \
+                    match_weight(inp_mention=inp_mention, pos=pos) is None:
+                pos += 1
+            tokens.append(('UNIT', inp_mention[start:pos]))
+    return tokens
+
+
+class UnitExpressionParser(object):
+    """
+    Recursive-descent parser for standardised unit mentions. Builds the numerator/denominator AST as two lists of
+    (unit, power) factors:
+
+    expression := product ('/' product)*          everything after the first '/' goes to the denominator
+    product    := factor ('·'? factor)*
+    factor     := (UNIT | WEIGHT | '(' expression ')') exponent?
+    exponent   := EXP | '(' EXP ')'
+
+    N.B. second slash equivalent to multiplication and "70 kg" normalisations always go last in the denominator
+    """
+
+    def __init__(self, inp_mention: str):
+        self.tokens = tokenize_unit(inp_mention=inp_mention)
+        self.pos = 0
+        self.depth = 0
+        self.weights = []
+
+    def peek(self, offset: int = 0) -> Union[str, None]:
+        if self.pos + offset < len(self.tokens):
+            return self.tokens[self.pos + offset][0]
+        return None
+
+    def advance(self) -> Tuple[str, str]:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+        numerator, denominator = self.parse_expression()
+        return numerator, denominator + [(w, 1) for w in self.weights]
+
+    def parse_expression(self):
+        numerator, denominator = self.parse_product()
+        while self.peek() == 'DIV':
+            self.advance()
+            tmp_num, tmp_denom = self.parse_product()
+            denominator += tmp_num + tmp_denom
+        return numerator, denominator
+
+    def parse_product(self):
+        numerator, denominator = [], []
+        while self.peek() not in [None, 'DIV'] and not (self.peek() == 'CLOSE' and self.depth > 0):
+            if self.peek() in ['DOT', 'CLOSE']:
+                # unbalanced closing brackets are ignored
+                self.advance()
+                continue
+            tmp_num, tmp_denom = self.parse_factor()
+            numerator += tmp_num
+            denominator += tmp_denom
+        return numerator, denominator
+
+    def parse_exponent(self) -> int:
+        if self.peek() == 'EXP':
+            return int(self.advance()[1])
+        if self.peek() == 'OPEN' and self.peek(1) == 'EXP' and self.peek(2) == 'CLOSE':
+            self.advance()
+            power = int(self.advance()[1])
+            self.advance()
+            return power
+        return 0
+
+    def parse_factor(self):
+        token_type, value = self.advance()
+        if token_type == 'WEIGHT':
+            self.weights.append(value)
+            return [], []
+        if token_type == 'EXP':
+            # exponent without a base, keep it as plain text
+            return [("-" + value, 1)], []
+        if token_type == 'OPEN':
+            self.depth += 1
+            numerator, denominator = self.parse_expression()
+            self.depth -= 1
+            if self.peek() == 'CLOSE':
+                self.advance()
+            power = self.parse_exponent()
+            if power == 0:
+                return numerator, denominator
+            # (a/b)-n = b^n/a^n: every factor of the group is inverted and raised to the power on its own
+            return [(u, p * power) for u, p in denominator], [(u, p * power) for u, p in numerator]
+        power = self.parse_exponent()
+        if power == 0:
+            return [(value, 1)], []
+        return [], [(value, power)]
+
+
+def render_unit_factor(inp_factor: Tuple[str, int]) -> str:
+    unit, power = inp_factor
+    if power == 1:
+        return unit
+    return f"({unit})^{power}"
+
+
+def parse_unit_expression(inp_mention: str) -> Tuple[List[str], List[str]]:
+    """
+    Parses a standardised unit mention into its numerator and denominator units
+    e.g. ml·min-1·kg-1 -> (['ml'], ['min', 'kg']); mg/h-2 -> (['mg'], ['(h)^2'])
+    """
+    numerator, denominator = UnitExpressionParser(inp_mention=inp_mention).parse()
+    return [render_unit_factor(f) for f in numerator], [render_unit_factor(f) for f in denominator]
 
 
 def standardise_divide(inp_mention: str) -> Tuple:
@@ -228,37 +410,13 @@ def standardise_divide(inp_mention: str) -> Tuple:
     Converts all units into dict of numerator and denominator (removes all "/" and "-1")
     N.B. second slash equivalent to multiplication
     """
-    # 1. check for /, and if more than one convert subsequent to ·
-    inp_mention = check_for_divide(inp_mention)
-
-    # 2. Check for brackets and splits on the dot returning numerator and denominator candidates
-    units_split = check_for_brackets(inp_mention)
-    # ml*kg-1*h*min-1 -> [[ml], [kg, -1], [h], [min, -1]]
-    # ml/h -> [[ml],[h, -1]
-    # 3. Add all those without -digits to nominator list
-    num_list = [sublist for sublist in units_split if len(sublist) == 1]
-    minus_list = [sub for sub in units_split if sub not in num_list]
-    minus_list = [x for x in minus_list if x]
-    # sort out if any minus digits that are not 1s
-    denom_list = []
-    for sublist in minus_list:
-        if sublist[1] != "-1":
-            power = sublist[1].replace("-", "^")
-            subject = "(" + sublist[0] + ")"
-            new_sublist = "".join([subject, power])
-            denom_list.append([new_sublist])
-        else:
-            new_subject = sublist[0]
-            denom_list.append([new_subject])
-
-    # get final denominator and nominator lists
-    num_list = [item for sublist in num_list for item in sublist]
-    denom_list = [item for sublist in denom_list for item in sublist]
+    # ml*kg-1*h*min-1 -> [ml, h] / [kg, min]
+    # ml/h -> [ml] / [h]
+    num_list, denom_list = parse_unit_expression(inp_mention=inp_mention)
 
     # join elements with mutliplication sign
     numerator = "·".join(num_list)
     denominator = "·".join(denom_list)
-    # print(numerator, "/", denominator)
 
     return numerator, denominator
 
@@ -336,6 +494,15 @@ def convert_final_std(inp_num, inp_denom) -> Tuple[str, str, bool]:
             return "", "", False
 
 
+def std_unit_mention(inp_mention: str) -> str:
+    """
+    Standardised form of a unit mention, e.g. "mL/min/kg" -> "[ml] / [kg·min]"
+    """
+    num, denom = standardise_divide(standardise_unit(inp_mention))
+    std_mention, _, _ = convert_final_std(inp_num=num, inp_denom=denom)
+    return std_mention
+
+
 class PKEstimate(object):
     def __init__(self, param: PKSpan, central_v: Span, central_v_units: Union[Span, None],
                  deviation_v: Union[Span, None], deviation_v_units: Union[Span, None],
@@ -359,12 +526,7 @@ class PKEstimate(object):
     @staticmethod
     def std_units(inp_u):
         if inp_u is not None:
-            u_std = standardise_unit(inp_u.text)
-            num, denom = standardise_divide(u_std)
-            std_unit_mention, std_unit_magnitudes, _ = convert_final_std(inp_num=num,
-                                                                         inp_denom=denom)
-            return std_unit_mention
-
+            return std_unit_mention(inp_u.text)
         return ""
 
     def get_dict_output(self):
@@ -380,15 +542,15 @@ class PKEstimate(object):
             Compare=self.get_text_or_none(self.compare)
         )
 
+    def get_spans(self) -> List[Span]:
+        return [x for x in [self.param, self.central_v, self.central_v_units, self.deviation_v,
+                            self.deviation_v_units, self.compare] if x is not None]
+
     def get_ents(self):
-        out_ents = []
-        for x in [self.param, self.central_v, self.central_v_units, self.deviation_v, self.deviation_v_units,
-                  self.compare]:
-            if x is not None:
-                e = dict(start=x.start, end=x.end, label=x.label)
-                if e not in out_ents:
-                    out_ents.append(e)
-        return out_ents
+        out_ents = dict()
+        for x in self.get_spans():
+            out_ents.setdefault(x.key, x.to_dict())
+        return list(out_ents.values())
 
     def print_estimate(self):
         character_annots = self.get_character_spans()
@@ -398,21 +560,13 @@ class PKEstimate(object):
         print(t)
 
     def get_character_spans(self):
-        ents = []
-        for x in [self.param, self.central_v, self.central_v_units, self.deviation_v, self.deviation_v_units,
-                  self.compare]:
-            if x is not None and x not in ents:
-                ents.append(dict(start=x.start, end=x.end, label=x.label))
-        return ents
+        return self.get_ents()
 
     @staticmethod
     def view_all_entities_terminal(inp_text, ner_dictionaries):
         color_map = {"PK": "red", "VALUE": "blue", "UNITS": "green", "RANGE": "cyan", "COMPARE": "magenta"}
         # filter uniques
-        uq_ner_dictionaries = []
-        for t in ner_dictionaries:
-            if t not in uq_ner_dictionaries:
-                uq_ner_dictionaries.append(t)
+        uq_ner_dictionaries = unique_dicts(ner_dictionaries)
         if uq_ner_dictionaries:
             uq_ner_dictionaries = sorted(uq_ner_dictionaries, key=lambda anno: anno['start'])
             sentence_text = ""
@@ -435,10 +589,41 @@ def make_span(inp_dict: Union[Dict, None], original_text: str):
     return None
 
 
+def span_key(inp_span: Dict) -> Tuple[int, int, str]:
+    return inp_span['start'], inp_span['end'], inp_span['label']
+
+
+def index_relations(inp_relations: List[Dict]) -> Dict[Tuple[int, int, str], Dict[str, List[Dict]]]:
+    """
+    Builds an adjacency index of a sentence in one pass over its relations:
+    span key (start, end, label) -> {relation label: [related spans in relation order]}
+    """
+    relations_index = dict()
+    for r in inp_relations:
+        left_key = span_key(r['left'])
+        right_key = span_key(r['right'])
+        if left_key != right_key:
+            relations_index.setdefault(left_key, dict()).setdefault(r['label'], []).append(r['right'])
+            relations_index.setdefault(right_key, dict()).setdefault(r['label'], []).append(r['left'])
+    return relations_index
+
+
+def find_related(relations_index: Dict, inp_span: Dict, rel_label: str, ent_labels: List[str]) -> Union[Dict, None]:
+    """
+    Returns the last span linked to inp_span through a rel_label relation whose label is in ent_labels
+    """
+    related = None
+    for ent in relations_index.get(span_key(inp_span), dict()).get(rel_label, []):
+        if ent['label'] in ent_labels:
+            related = ent
+    return related
+
+
 def get_measurements(inp_sent: Dict) -> Union[List[PKEstimate], None]:
     measurements = []
     sent_text = inp_sent['text']
     sent_relations = inp_sent['relations']
+    relations_index = index_relations(inp_relations=sent_relations)
     for r in sent_relations:
         if r['label'] == 'C_VAL':
             # HERE, EXTRACT EVERYTHING FROM INSIDE
@@ -453,35 +638,19 @@ def get_measurements(inp_sent: Dict) -> Union[List[PKEstimate], None]:
                     if ent['label'] in ['VALUE', 'RANGE']:
                         c_v = ent  # Span(inp_dict=ent, inp_text=sent_text)
             if param is not None and c_v is not None:
-                c_v_units = None
-                d_v = None
-                d_v_units = None
-                compare = None
                 # 2) Find Units and Compare
-                for sub_r in sent_relations:
-                    if sub_r['label'] == 'RELATED' and (sub_r['right'] == c_v or sub_r['left'] == c_v):
-                        for side in ['left', 'right']:
-                            if sub_r[side] != c_v:
-                                if sub_r[side]['label'] == "COMPARE":
-                                    compare = sub_r[side]
-                                if sub_r[side]['label'] == "UNITS":
-                                    c_v_units = sub_r[side]
+                c_v_units = find_related(relations_index=relations_index, inp_span=c_v, rel_label='RELATED',
+                                         ent_labels=['UNITS'])
+                compare = find_related(relations_index=relations_index, inp_span=c_v, rel_label='RELATED',
+                                       ent_labels=['COMPARE'])
                 # 3) Find Dev
-                for sub_r in sent_relations:
-                    if sub_r['label'] == 'D_VAL' and (sub_r['right'] == c_v or sub_r['left'] == c_v):
-                        for side in ['left', 'right']:
-                            if sub_r[side] != c_v:
-                                if sub_r[side]['label'] in ['VALUE', 'RANGE']:
-                                    d_v = sub_r[side]
-
+                d_v = find_related(relations_index=relations_index, inp_span=c_v, rel_label='D_VAL',
+                                   ent_labels=['VALUE', 'RANGE'])
                 # 4) Find Dev units
+                d_v_units = None
                 if d_v:
-                    for sub_r in sent_relations:
-                        if sub_r['label'] == 'RELATED' and (sub_r['right'] == d_v or sub_r['left'] == d_v):
-                            for side in ['left', 'right']:
-                                if sub_r[side] != d_v:
-                                    if sub_r[side]['label'] == "UNITS":
-                                        d_v_units = sub_r[side]
+                    d_v_units = find_related(relations_index=relations_index, inp_span=d_v, rel_label='RELATED',
+                                             ent_labels=['UNITS'])
 
                 # Estimation object
 
@@ -528,19 +697,11 @@ class PKSentence(object):
     def get_dict_estimates(self):
         out_estimates = []
         if self.estimates is not None:
-            for e in self.estimates:
-                out_dict = e.get_dict_output()
-                if out_dict not in out_estimates:
-                    out_estimates.append(out_dict)
+            out_estimates = unique_dicts(e.get_dict_output() for e in self.estimates)
         return out_estimates
 
     def get_entities(self):
-        uq_ents = []
-        for estimate in self.estimates:
-            ents = estimate.get_ents()
-            for e in ents:
-                if e not in uq_ents:
-                    uq_ents.append(e)
+        uq_ents = unique_dicts(e for estimate in self.estimates for e in estimate.get_ents())
         uq_ents = sorted(uq_ents, key=lambda x: x['start'])
         return uq_ents
 
@@ -584,21 +745,29 @@ class PKAbstractsDB(object):
             "ID": est_id
         }
 
+    @staticmethod
+    def abstract_estimates(abstract: PKAbstract):
+        """
+        Yields (dict output, PKEstimate, PKSentence) for every estimate in an abstract
+        """
+        for s in abstract.sentences:
+            if s.estimates is not None:
+                tmp_estimates = s.get_dict_estimates()
+                for tmp_e, original_est in zip(tmp_estimates, s.estimates):
+                    yield tmp_e, original_est, s
+
     def estimates_to_records(self):
         estimates_records = []
         out_dict = dict()
         est_id = 0
         for abstract in tqdm(self.abstracts):
-            for s in abstract.sentences:
-                if s.estimates is not None:
-                    tmp_estimates = s.get_dict_estimates()
-                    for tmp_e, original_est in zip(tmp_estimates, s.estimates):
-                        estimates_records.append(self.format_est(inp_dict=tmp_e,
-                                                                 pmid=abstract.pmid,
-                                                                 sentence_text=s.text,
-                                                                 title=abstract.title,
-                                                                 est_id=est_id)
-                                                 )
-                        out_dict[est_id] = original_est
-                        est_id += 1
+            for tmp_e, original_est, s in self.abstract_estimates(abstract=abstract):
+                estimates_records.append(self.format_est(inp_dict=tmp_e,
+                                                         pmid=abstract.pmid,
+                                                         sentence_text=s.text,
+                                                         title=abstract.title,
+                                                         est_id=est_id)
+                                         )
+                out_dict[est_id] = original_est
+                est_id += 1
         return estimates_records, out_dict
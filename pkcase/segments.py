@@ -0,0 +1,422 @@
+"""
+Append-only, segmented PK estimates database.
+
+Each segment is an immutable directory with the RECORDS_FILE and ESTIMATES_FILE written by pkcase.corpus for a set of
+PMIDs. Segments own a contiguous range of estimate IDs reserved from the manifest's next_id counter, so IDs are stable
+and never collide across updates. The rows a segment copies unchanged from an older one keep their IDs. The manifest is replaced atomically on every change and readers only ever see the
+segments it lists, which lets the app pick up new segments while it is running.
+
+The manifest also points to the abstract index (PMID, Fingerprint, OutputHash, Segment), which records the fingerprint
+of every abstract and the segment holding its live rows. A rebuild only reprocesses abstracts whose fingerprint changed
+and only writes new rows for those whose output changed, older rows of a reprocessed abstract are hidden and dropped on
+compaction. Once there are more than MAX_SEGMENTS segments, they are compacted by the command line after an update and
+by the app (in the background) when it picks up the new manifest.
+
+The manifest keeps a snapshot of the unit standardisation tables the live rows were standardised with. When the tables
+change, only the unit mentions hitting a changed entry are standardised again and only the abstracts whose units
+actually changed get new rows (see restandardise), no abstract is reprocessed.
+
+python -m pkcase.segments append --store datasets/pkdatabase/segments --input new_sentences.jsonl
+python -m pkcase.segments rebuild --store datasets/pkdatabase/segments --input all_sentences.jsonl --model-version 2
+python -m pkcase.segments compact --store datasets/pkdatabase/segments
+python -m pkcase.segments restandardise --store datasets/pkdatabase/segments
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Set, Union
+
+import pandas as pd
+
+from pkcase.corpus import RECORDS_FILE, ESTIMATES_FILE, ABSTRACTS_FILE, RECORDS_COLUMNS, SPAN_RECORD_COLUMNS, \
+    read_sentences, group_abstracts, write_corpus, abstract_fingerprint, output_hash
+from pkcase.predicted import standardisation_tables, changed_unit_terms, unit_mention_hits, std_unit_mention
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+INDEX_COLUMNS = ["PMID", "Fingerprint", "OutputHash", "Segment"]
+FILE_COLUMNS = {RECORDS_FILE: RECORDS_COLUMNS, ESTIMATES_FILE: SPAN_RECORD_COLUMNS}
+MAX_SEGMENTS = 20
+
+
+class StoreLockedError(RuntimeError):
+    pass
+
+
+def row_keys(inp_records: pd.DataFrame, inp_spans: pd.DataFrame) -> List[str]:
+    """
+    Content hash of every row of inp_records (with its span record), regardless of its ID
+    """
+    spans = inp_spans.set_index("ID", drop=False).loc[inp_records["ID"]]
+    return [output_hash(inp_records=[r], inp_span_records=[sr])
+            for r, sr in zip(inp_records.to_dict("records"), spans.to_dict("records"))]
+
+
+def stable_ids(new_records: pd.DataFrame, new_spans: pd.DataFrame, old_records: pd.DataFrame,
+               old_spans: pd.DataFrame) -> List[int]:
+    """
+    IDs of the new rows of reprocessed abstracts: a new row with the same content as a live row of the same abstract
+    takes its ID (every live row is taken once), the other rows keep their new ID
+    """
+    available = {}
+    for key, pmid, est_id in zip(row_keys(old_records, old_spans), old_records["PMID"], old_records["ID"]):
+        available.setdefault((pmid, key), []).append(int(est_id))
+    ids = []
+    for key, pmid, est_id in zip(row_keys(new_records, new_spans), new_records["PMID"], new_records["ID"]):
+        reusable = available.get((pmid, key))
+        ids.append(reusable.pop(0) if reusable else int(est_id))
+    return ids
+
+
+class SegmentedStore(object):
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.manifest_path = os.path.join(store_dir, MANIFEST_FILE)
+
+    @staticmethod
+    def exists(store_dir) -> bool:
+        return os.path.isfile(os.path.join(store_dir, MANIFEST_FILE))
+
+    @staticmethod
+    def segment_name(start_id: int, end_id: int) -> str:
+        return f"seg-{start_id:010d}-{end_id:010d}"
+
+    def segment_path(self, name: str, file_name: str = "") -> str:
+        return os.path.join(self.store_dir, name, file_name)
+
+    def read_manifest(self) -> Dict:
+        if not os.path.isfile(self.manifest_path):
+            return dict(version=0, next_id=0, segments=[], index=None, retired=[])
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_manifest(self, manifest: Dict):
+        manifest["version"] += 1
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def read_index(self, manifest: Union[Dict, None] = None) -> pd.DataFrame:
+        manifest = manifest or self.read_manifest()
+        if manifest["index"] is None:
+            return pd.DataFrame(columns=INDEX_COLUMNS)
+        return pd.read_parquet(os.path.join(self.store_dir, manifest["index"]))
+
+    def write_index(self, manifest: Dict, index: pd.DataFrame):
+        """
+        Writes a new index file and points the manifest to it, the previous one is retired
+        """
+        name = f"index-{manifest['version'] + 1:06d}.parquet"
+        tmp_path = os.path.join(self.store_dir, name + ".tmp")
+        index[INDEX_COLUMNS].to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, os.path.join(self.store_dir, name))
+        if manifest["index"] is not None:
+            manifest["retired"].append(manifest["index"])
+        manifest["index"] = name
+
+    @contextmanager
+    def lock(self):
+        """
+        Serializes writers (appends and compactions), readers never take the lock
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        lock_path = os.path.join(self.store_dir, LOCK_FILE)
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            raise StoreLockedError(f"{self.store_dir} is being updated by another process (remove {lock_path} if stale)")
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
+
+    def read_segments(self, file_name: str, columns: Union[List[str], None] = None,
+                      manifest: Union[Dict, None] = None) -> pd.DataFrame:
+        """
+        Concatenates file_name across segments keeping only the live rows of every abstract (an empty frame with the
+        columns of file_name when the store has no estimates yet)
+        """
+        manifest = manifest or self.read_manifest()
+        index = self.read_index(manifest=manifest)
+        live_pmids = index.groupby("Segment")["PMID"].apply(set).to_dict()
+        frames = []
+        for seg in manifest["segments"]:
+            if seg["n_estimates"] > 0:
+                rows = pd.read_parquet(self.segment_path(seg["name"], file_name), columns=columns)
+                frames.append(rows[rows["PMID"].isin(live_pmids.get(seg["name"], set()))])
+        if frames:
+            return pd.concat(frames, ignore_index=True)
+        return pd.DataFrame(columns=columns or FILE_COLUMNS[file_name])
+
+    def load_records(self, manifest: Union[Dict, None] = None) -> pd.DataFrame:
+        return self.read_segments(file_name=RECORDS_FILE, manifest=manifest)
+
+    def load_estimates(self, manifest: Union[Dict, None] = None) -> pd.DataFrame:
+        estimates = self.read_segments(file_name=ESTIMATES_FILE, manifest=manifest)
+        return estimates.set_index("ID", drop=False)
+
+    def load_pmids(self, manifest: Union[Dict, None] = None) -> Set:
+        return set(self.read_index(manifest=manifest)["PMID"])
+
+    def append(self, inp_path: str, n_workers: int = None, batch_size: int = 100,
+               model_version: str = "") -> Union[str, None]:
+        """
+        Writes the abstracts of inp_path whose PMIDs are not yet in the store as a new segment. Returns the name of
+        the new segment or None if no estimates were written
+        """
+        return self.update(inp_path=inp_path, n_workers=n_workers, batch_size=batch_size,
+                           model_version=model_version, reprocess_changed=False)
+
+    def rebuild(self, inp_path: str, n_workers: int = None, batch_size: int = 100,
+                model_version: str = "") -> Union[str, None]:
+        """
+        Same as append, but abstracts already in the store are reprocessed when their fingerprint changed (new
+        predictions or model version). New rows are only written for the abstracts whose output changed, the others
+        just get their fingerprint updated and keep their estimate IDs. Rows of a reprocessed abstract that did not
+        change keep their IDs too
+        """
+        return self.update(inp_path=inp_path, n_workers=n_workers, batch_size=batch_size,
+                           model_version=model_version, reprocess_changed=True)
+
+    def update(self, inp_path: str, n_workers: int, batch_size: int, model_version: str,
+               reprocess_changed: bool) -> Union[str, None]:
+        with self.lock():
+            manifest = self.read_manifest()
+            # rows standardised with older tables are updated first, so that their output hashes are current
+            tables_changed = manifest.get("std_tables") != standardisation_tables()
+            self.restandardise_rows(manifest=manifest)
+            index = self.read_index(manifest=manifest)
+            known = dict(zip(index["PMID"], zip(index["Fingerprint"], index["OutputHash"])))
+
+            def selected_sentences():
+                for abstract_sents in group_abstracts(read_sentences(inp_path)):
+                    pmid = abstract_sents[0]['pmid']
+                    if pmid in known:
+                        if not reprocess_changed:
+                            continue
+                        fingerprint = abstract_fingerprint(inp_sentences=abstract_sents, model_version=model_version)
+                        if fingerprint == known[pmid][0]:
+                            continue
+                    yield from abstract_sents
+
+            def output_changed(entry):
+                return entry["PMID"] not in known or known[entry["PMID"]][1] != entry["OutputHash"]
+
+            start_id = manifest["next_id"]
+            tmp_dir = self.segment_path(f".tmp-{start_id}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            n_estimates = write_corpus(inp_sentences=selected_sentences(), out_dir=tmp_dir, n_workers=n_workers,
+                                       batch_size=batch_size, start_id=start_id, model_version=model_version,
+                                       inp_filter=output_changed)
+            abstracts_path = os.path.join(tmp_dir, ABSTRACTS_FILE)
+            if not os.path.isfile(abstracts_path):
+                shutil.rmtree(tmp_dir)
+                if tables_changed:
+                    self.write_manifest(manifest)
+                return None
+            processed = pd.read_parquet(abstracts_path)
+            name = None
+            if n_estimates > 0:
+                self.keep_ids(seg_dir=tmp_dir, manifest=manifest, inp_pmids=set(known))
+                name = self.segment_name(start_id=start_id, end_id=start_id + n_estimates)
+                os.replace(tmp_dir, self.segment_path(name))
+                manifest["segments"].append(dict(name=name, start_id=start_id, end_id=start_id + n_estimates,
+                                                 n_estimates=n_estimates))
+                manifest["next_id"] = start_id + n_estimates
+            else:
+                shutil.rmtree(tmp_dir)
+            previous_segments = index.set_index("PMID")["Segment"]
+            processed["Segment"] = [name if has_rows else previous_segments[pmid]
+                                    for pmid, has_rows in zip(processed["PMID"], processed["Rows"])]
+            index = pd.concat([index[~index["PMID"].isin(processed["PMID"])], processed[INDEX_COLUMNS]],
+                              ignore_index=True)
+            self.write_index(manifest=manifest, index=index)
+            manifest["std_tables"] = standardisation_tables()
+            self.write_manifest(manifest)
+            return name
+
+    def keep_ids(self, seg_dir: str, manifest: Dict, inp_pmids: Set):
+        """
+        Gives the rows of a new segment (written in seg_dir) that are the same as live rows of their abstract the IDs
+        of those rows, only abstracts of inp_pmids are looked up
+        """
+        records = pd.read_parquet(os.path.join(seg_dir, RECORDS_FILE))
+        reprocessed = set(records["PMID"]) & inp_pmids
+        if not reprocessed:
+            return
+        spans = pd.read_parquet(os.path.join(seg_dir, ESTIMATES_FILE))
+        old_records = self.read_segments(file_name=RECORDS_FILE, manifest=manifest)
+        old_records = old_records[old_records["PMID"].isin(reprocessed)]
+        old_spans = self.read_segments(file_name=ESTIMATES_FILE, manifest=manifest)
+        old_spans = old_spans[old_spans["PMID"].isin(reprocessed)]
+        ids = stable_ids(new_records=records, new_spans=spans, old_records=old_records, old_spans=old_spans)
+        if ids == records["ID"].tolist():
+            return
+        new_ids = dict(zip(records["ID"], ids))
+        records["ID"] = ids
+        spans["ID"] = spans["ID"].map(new_ids)
+        records.to_parquet(os.path.join(seg_dir, RECORDS_FILE), index=False)
+        spans.to_parquet(os.path.join(seg_dir, ESTIMATES_FILE), index=False)
+
+    def restandardise(self) -> Union[str, None]:
+        """
+        Standardises again the units of the live rows after a change of the standardisation tables. Returns the name
+        of the segment with the updated rows or None if no units changed
+        """
+        with self.lock():
+            manifest = self.read_manifest()
+            if manifest.get("std_tables") == standardisation_tables():
+                return None
+            name = self.restandardise_rows(manifest=manifest)
+            self.write_manifest(manifest)
+            return name
+
+    def restandardise_rows(self, manifest: Dict) -> Union[str, None]:
+        """
+        Writes the rows of the abstracts whose units change with the current standardisation tables as a new segment
+        and points the index to it, only the rows whose units changed get new estimate IDs. Only the unit mentions hitting an entry
+        changed since the manifest's snapshot are standardised again (all of them without a snapshot). Rows of
+        segments built before the unit mentions were stored keep their units. The caller holds the lock and writes
+        the manifest
+        """
+        tables = standardisation_tables()
+        old_tables = manifest.get("std_tables")
+        if old_tables == tables:
+            return None
+        manifest["std_tables"] = tables
+        estimates = self.read_segments(file_name=ESTIMATES_FILE, manifest=manifest)
+        if "UnitsMention" not in estimates.columns:
+            return None
+        records = self.read_segments(file_name=RECORDS_FILE, manifest=manifest)
+        mentions = records["ID"].map(estimates.set_index("ID")["UnitsMention"])
+        terms = changed_unit_terms(old_tables=old_tables, new_tables=tables) if old_tables is not None else None
+        new_units = dict((m, std_unit_mention(m)) for m in mentions.dropna().unique()
+                         if terms is None or unit_mention_hits(inp_mention=m, inp_terms=terms))
+        hit = mentions.isin(list(new_units))
+        changed = hit & (records["Units"] != mentions.map(new_units))
+        pmids = set(records.loc[changed, "PMID"])
+        if not pmids:
+            return None
+
+        affected = records["PMID"].isin(pmids)
+        new_records = records[affected].copy()
+        new_records.loc[hit[affected], "Units"] = mentions[affected & hit].map(new_units)
+        new_spans = estimates[estimates["PMID"].isin(pmids)].set_index("ID", drop=False).loc[new_records["ID"]]
+        start_id = manifest["next_id"]
+        end_id = start_id + int(changed.sum())
+        new_ids = new_records["ID"].to_numpy().copy()
+        new_ids[changed[affected].to_numpy()] = range(start_id, end_id)
+        new_records["ID"] = new_ids
+        new_spans = new_spans.assign(ID=new_ids).reset_index(drop=True)
+        name = self.segment_name(start_id=start_id, end_id=end_id)
+        tmp_dir = self.segment_path(f".tmp-{name}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        new_records.to_parquet(os.path.join(tmp_dir, RECORDS_FILE), index=False)
+        new_spans.to_parquet(os.path.join(tmp_dir, ESTIMATES_FILE), index=False)
+        os.replace(tmp_dir, self.segment_path(name))
+        manifest["segments"].append(dict(name=name, start_id=start_id, end_id=end_id, n_estimates=len(new_records)))
+        manifest["next_id"] = end_id
+
+        index = self.read_index(manifest=manifest)
+        hashes = dict((pmid, output_hash(inp_records=rows.to_dict("records"),
+                                         inp_span_records=new_spans[new_spans["PMID"] == pmid].to_dict("records")))
+                      for pmid, rows in new_records.groupby("PMID", sort=False))
+        updated = index["PMID"].isin(pmids)
+        index.loc[updated, "Segment"] = name
+        index.loc[updated, "OutputHash"] = index.loc[updated, "PMID"].map(hashes)
+        self.write_index(manifest=manifest, index=index)
+        return name
+
+    def remove(self, name: str):
+        path = os.path.join(self.store_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.isfile(path):
+            os.remove(path)
+
+    def compact(self, max_segments: int = 1) -> Union[str, None]:
+        """
+        Merges all segments into one when there are more than max_segments, dropping the rows hidden by a rebuild.
+        Estimate IDs are kept. Replaced segments and index files are deleted on the following compaction so that
+        readers of the previous manifest can still finish
+        """
+        with self.lock():
+            manifest = self.read_manifest()
+            segments = manifest["segments"]
+            if len(segments) <= max_segments:
+                return None
+            for name in manifest["retired"]:
+                self.remove(name)
+            manifest["retired"] = []
+            start_id, end_id = segments[0]["start_id"], segments[-1]["end_id"]
+            name = self.segment_name(start_id=start_id, end_id=end_id)
+            tmp_dir = self.segment_path(f".tmp-{name}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            n_estimates = 0
+            for file_name in [RECORDS_FILE, ESTIMATES_FILE]:
+                merged = self.read_segments(file_name=file_name, manifest=manifest)
+                merged.to_parquet(os.path.join(tmp_dir, file_name), index=False)
+                n_estimates = len(merged)
+            os.replace(tmp_dir, self.segment_path(name))
+            index = self.read_index(manifest=manifest)
+            index["Segment"] = name
+            manifest["retired"] = [seg["name"] for seg in segments]
+            manifest["segments"] = [dict(name=name, start_id=start_id, end_id=end_id, n_estimates=n_estimates)]
+            self.write_index(manifest=manifest, index=index)
+            self.write_manifest(manifest)
+            return name
+
+    def compact_in_background(self, max_segments: int = 1) -> threading.Thread:
+        """
+        Compacts in a daemon thread, nothing is done if another process is updating the store (the next call retries)
+        """
+        def run():
+            try:
+                self.compact(max_segments=max_segments)
+            except StoreLockedError:
+                pass
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental updates of the segmented PK estimates database")
+    parser.add_argument("action", choices=["append", "rebuild", "compact", "restandardise"])
+    parser.add_argument("--store", required=True, help="Directory of the segmented store")
+    parser.add_argument("--input", help="JSONL file with predicted sentences grouped by PMID (append, rebuild)")
+    parser.add_argument("--model-version", default="", help="Version of the model that predicted the input sentences")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--max-segments", type=int, default=None,
+                        help=f"Compact when there are more segments (default: 1 for compact, {MAX_SEGMENTS} after "
+                             f"append, rebuild and restandardise)")
+    args = parser.parse_args()
+    store = SegmentedStore(store_dir=args.store)
+    if args.action in ["append", "rebuild"]:
+        if args.input is None:
+            parser.error(f"{args.action} requires --input")
+        update = store.append if args.action == "append" else store.rebuild
+        name = update(inp_path=args.input, n_workers=args.workers, batch_size=args.batch_size,
+                      model_version=args.model_version)
+    elif args.action == "restandardise":
+        name = store.restandardise()
+    else:
+        name = store.compact(max_segments=args.max_segments or 1)
+    if name and args.action != "compact":
+        compacted = store.compact(max_segments=args.max_segments or MAX_SEGMENTS)
+        if compacted:
+            print(f"Compacted into: {compacted}")
+    print(f"New segment: {name}" if name else "Nothing to do")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Local stand-in for the PKPDAI prediction API.
+
+Serves pred_ner and pred_rex with responses shaped like the real API, built from simple regular expressions instead of
+the models, so that batch jobs and the apps can be run and tested offline. Latency and error rates can be configured to
+exercise timeouts and retries.
+
+python -m pkcase.standin --port 8060 --latency 0.2 --error-rate 0.1
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+PK_TERMS = {
+    "clearance": ("CL", "clearance"),
+    "half-life": ("THALF", "half-life"),
+    "volume of distribution": ("VD", "volume of distribution"),
+    "bioavailability": ("F", "bioavailability"),
+    "tmax": ("TMAX", "tmax"),
+    "cmax": ("CMAX", "cmax"),
+    "auc": ("AUC", "auc"),
+}
+PK_PATTERN = re.compile("|".join(re.escape(t) for t in PK_TERMS), flags=re.IGNORECASE)
+VALUE_PATTERN = re.compile(r"\d+(?:[.,]\d+)?(?:\s*(?:-|to)\s*\d+(?:[.,]\d+)?)?")
+UNITS_PATTERN = re.compile(r"\s*((?:ng|mg|μg|g|ml|mL|L|l|h|min|kg|%)(?:\s?[/·]\s?(?:ng|mg|μg|g|ml|mL|L|l|h|min|kg))*)"
+                           r"(?![A-Za-z])")
+SENTENCE_PATTERN = re.compile(r".+?(?:[.!?]+(?=\s|$)|$)", flags=re.DOTALL)
+CHEMICAL_PATTERN = re.compile(r"\b[a-z]+(?:azolam|pam|mycin|cillin|pin|ol|ine|ide)\b", flags=re.IGNORECASE)
+
+
+def sentence_offsets(inp_text: str) -> List[Tuple[int, int]]:
+    offsets = []
+    for m in SENTENCE_PATTERN.finditer(inp_text):
+        start = m.start() + len(m.group()) - len(m.group().lstrip())
+        if start < m.end():
+            offsets.append((start, m.end()))
+    return offsets
+
+
+def predict_entities(inp_text: str) -> List[Dict]:
+    entities = []
+    for m in PK_PATTERN.finditer(inp_text):
+        kb_id, kb_name = PK_TERMS[m.group().lower()]
+        entities.append(dict(start=m.start(), end=m.end(), label="PK", kb_id=kb_id, kb_name=kb_name))
+    for m in VALUE_PATTERN.finditer(inp_text):
+        label = "RANGE" if re.search(r"-|to", m.group()) else "VALUE"
+        entities.append(dict(start=m.start(), end=m.end(), label=label))
+        units = UNITS_PATTERN.match(inp_text, m.end())
+        if units:
+            entities.append(dict(start=units.start(1), end=units.end(1), label="UNITS"))
+    return sorted(entities, key=lambda x: x['start'])
+
+
+def predict_relations(inp_text: str, inp_entities: List[Dict]) -> List[Dict]:
+    """
+    Links every value to the closest preceding parameter of its sentence (C_VAL) and to the units that follow it
+    (RELATED)
+    """
+    relations = []
+    for sent_start, sent_end in sentence_offsets(inp_text):
+        param = None
+        sent_ents = [e for e in inp_entities if sent_start <= e['start'] and e['end'] <= sent_end]
+        for i, ent in enumerate(sent_ents):
+            if ent['label'] == "PK":
+                param = ent
+            elif ent['label'] in ["VALUE", "RANGE"] and param is not None:
+                relations.append(dict(head_span=param, child_span=ent, label="C_VAL"))
+                if i + 1 < len(sent_ents) and sent_ents[i + 1]['label'] == "UNITS":
+                    relations.append(dict(head_span=ent, child_span=sent_ents[i + 1], label="RELATED"))
+    return relations
+
+
+def predict_ner(inp_text: str) -> Dict:
+    return dict(text=inp_text, entities=[e for e in predict_entities(inp_text) if e['label'] == "PK"])
+
+
+def predict_rex(inp_text: str) -> Dict:
+    entities = predict_entities(inp_text)
+    main = dict(text=inp_text, spans=entities, relations=predict_relations(inp_text, entities))
+    chemicals = [dict(start=m.start(), end=m.end(), label="CHEMICAL") for m in CHEMICAL_PATTERN.finditer(inp_text)
+                 if not PK_PATTERN.fullmatch(m.group())]
+    return dict(spark_format=main, main=main, extra_ents=chemicals, sentence_offsets=sentence_offsets(inp_text))
+
+
+PREDICTORS = {"/pred_ner": predict_ner, "/pred_rex": predict_rex}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    disable_nagle_algorithm = True
+    latency = 0.
+    error_rate = 0.
+
+    def do_POST(self):
+        predictor = PREDICTORS.get(self.path.rstrip("/"))
+        if predictor is None:
+            return self.send_json(404, dict(error=f"Unknown endpoint {self.path}"))
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            inp_text = json.loads(body)["text"]
+        except (ValueError, KeyError, TypeError):
+            return self.send_json(400, dict(error="Expected a JSON body with a text field"))
+        if self.latency:
+            time.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if random.random() < self.error_rate:
+            return self.send_json(503, dict(error="Stand-in failure"))
+        self.send_json(200, predictor(inp_text))
+
+    def send_json(self, status: int, inp_dict: Dict):
+        out = json.dumps(inp_dict).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host: str = "127.0.0.1", port: int = 0, latency: float = 0.,
+                error_rate: float = 0.) -> ThreadingHTTPServer:
+    """
+    Builds the stand-in server (port 0 picks a free port, see server.server_address)
+    """
+    handler = type("ConfiguredStandInHandler", (StandInHandler,), dict(latency=latency, error_rate=error_rate))
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_in_thread(latency: float = 0., error_rate: float = 0.) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Starts a stand-in server on a free local port, returns it (call shutdown() to stop it) with its base URL
+    """
+    server = make_server(latency=latency, error_rate=error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the PKPDAI prediction API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8060)
+    parser.add_argument("--latency", type=float, default=0., help="Mean latency per request in seconds")
+    parser.add_argument("--error-rate", type=float, default=0., help="Fraction of requests answered with a 503")
+    args = parser.parse_args()
+    server = make_server(host=args.host, port=args.port, latency=args.latency, error_rate=args.error_rate)
+    print(f"Serving pred_ner and pred_rex on http://{args.host}:{args.port}/")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark of the SVG writers of the relation visualizer: render time and peak allocations of the svgwrite and string
+writers on stand-in predictions of texts of increasing length, after checking that both produce the same elements.
+
+python -m spark_display.benchmark --lengths 500 3000 10000 --repeats 5
+"""
+import argparse
+import re
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from pkcase import standin
+from utils import rexdemo
+from spark_display.relation_extraction import RelationExtractionVisualizer, WRITERS
+
+SENTENCES = ["The clearance of midazolam was 3.5 L/h in healthy volunteers.",
+             "The terminal half-life of loprazolam was 8.4 h and its Cmax 4.1 ng/mL.",
+             "Bioavailability was 44 % after oral administration of 15 mg.",
+             "The volume of distribution of flumazenil at steady state was 1.0 L/kg."]
+
+
+def make_text(length):
+    sentences = []
+    while sum(len(s) + 1 for s in sentences) < length:
+        sentences.append(SENTENCES[len(sentences) % len(SENTENCES)])
+    return " ".join(sentences)
+
+
+def render(visualizer, pkre):
+    return visualizer.display(pkre, relation_col='relations', return_html=True, exclude_relations=["NO_RELATION"],
+                              max_x=1700)
+
+
+def same_value(value_a, value_b):
+    """Same attribute value, numbers (also in lists such as points) being compared up to 1e-3"""
+    tokens_a, tokens_b = re.split(r"[\s,]+", value_a.strip()), re.split(r"[\s,]+", value_b.strip())
+    if len(tokens_a) != len(tokens_b):
+        return False
+    for a, b in zip(tokens_a, tokens_b):
+        try:
+            if abs(float(a) - float(b)) >= 1e-3:
+                return False
+        except ValueError:
+            if a != b:
+                return False
+    return True
+
+
+def same_elements(svg_a, svg_b):
+    """Same elements in the same order, with the same text and the same attributes up to number formatting"""
+    elements_a, elements_b = list(ET.fromstring(svg_a).iter()), list(ET.fromstring(svg_b).iter())
+    if len(elements_a) != len(elements_b):
+        return False
+    for a, b in zip(elements_a, elements_b):
+        if a.tag != b.tag or (a.text or "").strip() != (b.text or "").strip() or set(a.attrib) != set(b.attrib):
+            return False
+        if not all(same_value(v, b.attrib[k]) for k, v in a.attrib.items()):
+            return False
+    return True
+
+
+def measure(visualizer, pkre, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        render(visualizer, pkre)
+    elapsed = (time.perf_counter() - start) / repeats
+    tracemalloc.start()
+    render(visualizer, pkre)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render time and peak allocations of the relation visualizer writers")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[500, 3000, 10000], help="Text lengths (chars)")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    visualizers = dict((w, RelationExtractionVisualizer(writer=w)) for w in WRITERS)
+    print(f"{'chars':>7} {'relations':>9} {'writer':>9} {'ms/render':>10} {'peak MB':>8}")
+    for length in args.lengths:
+        main_results = standin.predict_rex(make_text(length))['main']
+        pkre = rexdemo.pkre2sparknlp(pkre=main_results)
+        outputs = [render(v, pkre) for v in visualizers.values()]
+        if not same_elements(*outputs):
+            raise AssertionError(f"The writers produce different SVGs for a text of {length} characters")
+        for name, visualizer in visualizers.items():
+            elapsed, peak = measure(visualizer, pkre, repeats=args.repeats)
+            print(f"{length:>7} {len(main_results['relations']):>9} {name:>9} {elapsed * 1000:>10.1f} "
+                  f"{peak / 2 ** 20:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,88 +1,182 @@
-import random
+import hashlib
 import os
+from collections import Counter
 import json
+from types import MappingProxyType
 import numpy as np
 import svgwrite
-import math
 import re
 from IPython.display import display, HTML
+from spark_display import svg_writer
 
 here = os.path.abspath(os.path.dirname(__file__))
 # overlap_hist = []
 # y_hist_dict = {}
-x_i_diff_dict = {}
-x_o_diff_dict = {}
 SURRCOL = "#afb1b3"
 ENTLAB = "#bfb8b2"
+FONTS_DIR = os.path.join(here, 'fonts')
+FONT_FILE = 'Lucida_Console.ttf'
+FONT_PATH = os.path.join(FONTS_DIR, FONT_FILE)
+MAIN_FONT = 'Lucida'
+# vertical layout: baselines of consecutive lines are LINE_BELOW + the room above the next line apart, which is
+# TEXT_ABOVE for lines without relations and ARC_ABOVE + ARC_LEVEL_HEIGHT per arc level above the first otherwise.
+# Every arc bends through the room above the lower of the lines it joins, ARC_PEAK + its level above that baseline
+FIRST_BASELINE = 75
+LINE_OFFSET = 100
+LINE_BELOW = 25
+TEXT_ABOVE = 35
+ARC_ABOVE = 75
+ARC_LEVEL_HEIGHT = 18
+ARC_PEAK = 60
 
 
-class RelationExtractionVisualizer:
+def load_colors(file_name):
+    with open(os.path.join(here, 'label_colors', file_name), 'r', encoding='utf-8') as f_:
+        return json.load(f_)
+
+
+# read once and shared read-only by all renders
+RELATION_COLORS = MappingProxyType(load_colors('relations.json'))
+ENTITY_COLORS = MappingProxyType(dict((k.lower(), v) for k, v in load_colors('ner.json').items()))
+
+
+def get_color(label, palette):
+    """Colour of a label in palette, or a colour derived from the label itself so that it is the same in every render"""
+    label = label.lower().strip()
+    if label in palette:
+        return palette[label]
+    return '#%02X%02X%02X' % tuple(x * 200 // 255 for x in hashlib.md5(label.encode('utf-8')).digest()[:3])
+
+
+class RenderState:
+    """Layout state of a single render, so that one visualizer can serve concurrent renders"""
 
     def __init__(self):
-        with open(os.path.join(here, 'label_colors/relations.json'), 'r', encoding='utf-8') as f_:
-            self.color_dict = json.load(f_)
-        with open(os.path.join(here, 'label_colors/ner.json'), 'r', encoding='utf-8') as f_:
-            self.entity_color_dict = json.load(f_)
-            self.entity_color_dict = dict((k.lower(), v) for k, v in self.entity_color_dict.items())
-            self.font_path = os.path.join(here, 'fonts/Lucida_Console.ttf')
-            self.main_font = 'Lucida'
-
-    def __get_color(self, l):
-        r = lambda: random.randint(0, 200)
-        return '#%02X%02X%02X' % (r(), r(), r())
+        # arcs already drawn from / to every entity position, the next one is spread a bit further from the first
+        self.arcs_out = Counter()
+        self.arcs_in = Counter()
+        self.arcs = []
+
+
+def font_face_css(font_url):
+    """@font-face rule loading the main font from font_url (e.g. a cacheable static route) instead of inlining it"""
+    return "@font-face {font-family: '%s'; src: url('%s') format('truetype');}" % (MAIN_FONT, font_url)
+
+
+class MaxSegmentTree:
+    """Range assignment and range maximum over n positions, both in O(log n)"""
+
+    def __init__(self, n):
+        self.n = n
+        self.values = [-1] * (4 * n)
+        self.pending = [None] * (4 * n)
+
+    def __push(self, node):
+        if self.pending[node] is not None:
+            for child in [2 * node, 2 * node + 1]:
+                self.values[child] = self.pending[node]
+                self.pending[child] = self.pending[node]
+            self.pending[node] = None
+
+    def assign(self, lo, hi, value, node=1, node_lo=0, node_hi=None):
+        node_hi = self.n - 1 if node_hi is None else node_hi
+        if hi < node_lo or node_hi < lo:
+            return
+        if lo <= node_lo and node_hi <= hi:
+            self.values[node] = value
+            self.pending[node] = value
+            return
+        self.__push(node)
+        mid = (node_lo + node_hi) // 2
+        self.assign(lo, hi, value, 2 * node, node_lo, mid)
+        self.assign(lo, hi, value, 2 * node + 1, mid + 1, node_hi)
+        self.values[node] = max(self.values[2 * node], self.values[2 * node + 1])
+
+    def query(self, lo, hi, node=1, node_lo=0, node_hi=None):
+        node_hi = self.n - 1 if node_hi is None else node_hi
+        if hi < node_lo or node_hi < lo:
+            return -1
+        if lo <= node_lo and node_hi <= hi:
+            return self.values[node]
+        self.__push(node)
+        mid = (node_lo + node_hi) // 2
+        return max(self.query(lo, hi, 2 * node, node_lo, mid), self.query(lo, hi, 2 * node + 1, mid + 1, node_hi))
+
+
+def arc_levels(extents):
+    """
+    Levels of the arcs above a text line given by their x extents (x_start, x_end). Shorter arcs are placed first and
+    every arc goes one level above the highest arc it overlaps, so nested arcs never cross. O(R log R)
+    """
+    coords = sorted(set(x for extent in extents for x in extent))
+    index = dict((x, i) for i, x in enumerate(coords))
+    tree = MaxSegmentTree(len(coords))
+    levels = [0] * len(extents)
+    for i in sorted(range(len(extents)), key=lambda j: (extents[j][1] - extents[j][0], extents[j][0])):
+        lo, hi = index[extents[i][0]], index[extents[i][1]]
+        levels[i] = tree.query(lo, hi) + 1
+        tree.assign(lo, hi, levels[i])
+    return levels
+
+
+def line_baselines(max_levels):
+    """Baselines of the text lines given the highest arc level of every line (-1 for lines without arcs)"""
+    baselines = []
+    for level in max_levels:
+        above = ARC_ABOVE + ARC_LEVEL_HEIGHT * level if level >= 0 else TEXT_ABOVE
+        baselines.append(baselines[-1] + LINE_BELOW + above if baselines else max(above, TEXT_ABOVE))
+    return baselines
+
+
+def bezier_control_points(points):
+    """
+    Control points of the smooth cubic Bezier curves through 3 points, for many arcs at once.
+    points -- array of shape (n_arcs, 3, 2)
+    Output: arrays A and B of shape (n_arcs, 2, 2), the first and second control points of the 2 segments of every arc
+    """
+    # closed-form solution of the spline system [[2, 1], [2, 7]] A = [p0 + 2 p1, 8 p1 + p2]
+    p0, p1, p2 = points[:, 0], points[:, 1], points[:, 2]
+    rhs0 = p0 + 2 * p1
+    rhs1 = 8 * p1 + p2
+    a0 = (7 * rhs0 - rhs1) / 12.
+    a1 = (rhs1 - rhs0) / 6.
+    b0 = 2 * p1 - a1
+    b1 = (a1 + p2) / 2.
+    return np.stack([a0, a1], axis=1), np.stack([b0, b1], axis=1)
+
+
+def bezier_paths(points):
+    """SVG path data (2 "C" curves) of the arcs through the 3 points of every row of points (n_arcs, 3, 2)"""
+    a, b = bezier_control_points(points)
+    coords = np.concatenate([points[:, :1], a[:, :1], b[:, :1], points[:, 1:2], a[:, 1:], b[:, 1:], points[:, 2:]],
+                            axis=1).reshape(len(points), -1)
+    return ["M%.1f,%.1f C%.1f,%.1f %.1f,%.1f %.1f,%.1f C%.1f,%.1f %.1f,%.1f %.1f,%.1f" % tuple(row)
+            for row in coords]
+
+
+# "svgwrite" validates every element and builds an XML tree, "string" formats the same markup straight into strings
+WRITERS = {
+    'svgwrite': lambda size: svgwrite.Drawing("temp.svg", profile='full', size=size),
+    'string': lambda size: svg_writer.Drawing(size=size),
+}
+
+
+class RelationExtractionVisualizer:
+
+    def __init__(self, writer='svgwrite'):
+        self.writer = WRITERS[writer]
+        self.color_dict = RELATION_COLORS
+        self.entity_color_dict = ENTITY_COLORS
+        self.font_path = FONT_PATH
+        self.main_font = MAIN_FONT
 
     def __size(self, text):
         return ((len(text) + 1) * 9.7) - 5
 
-    def __draw_line(self, dwg, s_x, s_y, e_x, e_y, d_type, color, show_relations, size_of_entity_label):
+    def __draw_line(self, dwg, state, s_x, s_y, e_x, e_y, d_type, color, show_relations, size_of_entity_label,
+                    level=0):
         eps = 0.0000001
 
-        def get_bezier_coef(points):
-            # since the formulas work given that we have n+1 points
-            # then n must be this:
-            n = len(points) - 1
-
-            # build coefficents matrix
-            C = 4 * np.identity(n)
-            np.fill_diagonal(C[1:], 1)
-            np.fill_diagonal(C[:, 1:], 1)
-            C[0, 0] = 2
-            C[n - 1, n - 1] = 7
-            C[n - 1, n - 2] = 2
-
-            # build points vector
-            P = [2 * (2 * points[i] + points[i + 1]) for i in range(n)]
-            P[0] = points[0] + 2 * points[1]
-            P[n - 1] = 8 * points[n - 1] + points[n]
-
-            # solve system, find a & b
-            A = np.linalg.solve(C, P)
-            B = [0] * n
-            for i in range(n - 1):
-                B[i] = 2 * points[i + 1] - A[i + 1]
-            B[n - 1] = (A[n - 1] + points[n]) / 2
-
-            return A, B
-
-        # returns the general Bezier cubic formula given 4 control points
-        def get_cubic(a, b, c, d):
-            return lambda t: np.power(1 - t, 3) * a + 3 * np.power(1 - t, 2) * t * b + 3 * (1 - t) * np.power(t,
-                                                                                                              2) * c + np.power(
-                t, 3) * d
-
-        # return one cubic curve for each consecutive points
-        def get_bezier_cubic(points):
-            A, B = get_bezier_coef(points)
-            return [
-                get_cubic(points[i], A[i], B[i], points[i + 1])
-                for i in range(len(points) - 1)
-            ]
-
-        # evalute each cubic curve on the range [0, 1] sliced in n points
-        def evaluate_bezier(points, n):
-            curves = get_bezier_cubic(points)
-            return np.array([fun(t) for fun in curves for t in np.linspace(0, 1, n)])
-
         def draw_pointer(dwg_i, s_x_i, s_y_i, e_x_i, e_y_i):
             size = 5
             ratio = 1
@@ -127,114 +221,53 @@ class RelationExtractionVisualizer:
                 stroke=color, stroke_width="1", fill='none', ))
             return text_place_y
 
-        unique_o_index = str(s_x) + str(s_y)
-        unique_i_index = str(e_x) + str(e_y)
+        out_diff = 10 + 5 * state.arcs_out[(s_x, s_y)]
+        in_diff = 10 + 5 * state.arcs_in[(e_x, e_y)]
+        state.arcs_out[(s_x, s_y)] += 1
+        state.arcs_in[(e_x, e_y)] += 1
         if s_x > e_x:
-            if unique_o_index in x_o_diff_dict:
-                s_x -= 5
-            else:
-                s_x -= 10
-                x_o_diff_dict[unique_o_index] = 5
+            s_x -= out_diff
             if s_y > e_y:
                 e_x += size_of_entity_label
-
-            if unique_i_index in x_i_diff_dict:
-                e_x += 5
-            else:
-                e_x += 10
-                x_i_diff_dict[unique_i_index] = 5
+            e_x += in_diff
         else:
-            if unique_o_index in x_o_diff_dict:
-                s_x += 5
-            else:
-                s_x += 10
-                x_o_diff_dict[unique_o_index] = 5
+            s_x += out_diff
             if s_y > e_y:
                 e_x -= size_of_entity_label
-            if unique_i_index in x_i_diff_dict:
-                e_x -= 5
-            else:
-                e_x -= 10
-                x_i_diff_dict[unique_i_index] = 5
-        # this_y_vals = list(range(min(s_x,e_x), max(s_x,e_x)+1))
-        # this_y_vals = [ str(s_y)+'|'+str(i) for i in this_y_vals]
-        # common = set(this_y_vals) & set(overlap_hist)
-        # overlap_hist.extend(this_y_vals)
-        # if s_y not in y_hist_dict:
-        #    y_hist_dict[s_y] = 20
-        # if common:
-        #    y_hist_dict[s_y] += 20
-        # y_increase = y_hist_dict[s_y]
-        angle = -1
+            e_x -= in_diff
+        # the arc bends through its level above the lower of the two lines, so that arcs within a line and arcs
+        # between lines share the same levels
+        peak_y = max(s_y, e_y) - ARC_PEAK - ARC_LEVEL_HEIGHT * level
+        text_place_y = peak_y + 5
         if s_y == e_y:
-            angle = 0
             s_y -= 20
             e_y = s_y - 4  # 55
-
-            text_place_y = s_y - 35
-
-            pth = evaluate_bezier(np.array([[s_x, s_y],
-                                            [(s_x + e_x) / 2.0, s_y - 40],
-                                            [e_x, e_y]]), 50)
-            dwg.add(dwg.polyline(pth,
-                                 stroke=color, stroke_width="1", fill='none', ))
-            draw_pointer(dwg, (s_x + e_x) / 2.0, s_y - 50, e_x, e_y)
         elif s_y >= e_y:
-            e_y += 15
+            # up to the bottom of the entity on a line above
             s_y -= 20
-            text_place_y = s_y - (abs(s_y - e_y) / 2)
-
-            pth = evaluate_bezier(np.array([[s_x, s_y],
-                                            # [((3*s_x)+e_x)/4.0, (s_y+e_y)/2.0],
-                                            [(s_x + e_x) / 2.0, (s_y + e_y) / 2.0],
-                                            # [(s_x+(3*e_x))/4.0,(s_y+e_y)/2.0],
-                                            [e_x, e_y]]), 50)
-            dwg.add(dwg.polyline(pth,
-                                 stroke=color, stroke_width="1", fill='none', ))
-            draw_pointer(dwg, s_x, s_y, e_x, e_y)
-
-            '''
-            line = dwg.add(dwg.polyline(
-                    [(s_x, s_y),(s_x, s_y-y_increase), (e_x, s_y-y_increase),
-                    (e_x, e_y),    
-                    (e_x+2, e_y),
-                    (e_x, e_y-4),
-                    (e_x-2, e_y),
-                    (e_x, e_y)
-                    ],
-                    stroke=color, stroke_width = "2", fill='none',))
-            '''
+            e_y += 15
         else:
-            s_y -= 5
-            e_y -= 40
-            text_place_y = s_y + (abs(s_y - e_y) / 2)
-
-            line = dwg.add(dwg.polyline(
-                [(s_x, s_y),
-                 (e_x, e_y - 40),
-                 (e_x + 2, e_y),
-                 (e_x, e_y + 4),
-                 (e_x - 2, e_y),
-                 (e_x, e_y)
-                 ],
-                stroke=color, stroke_width="1", fill='none', ))
-            draw_pointer(dwg, s_x, s_y, e_x, e_y)
+            # down to the top of the entity on a line below
+            s_y += 5
+            e_y -= 24
+        state.arcs.append(([[s_x, s_y],
+                            [(s_x + e_x) / 2.0, peak_y],
+                            [e_x, e_y]], color))
+        draw_pointer(dwg, (s_x + e_x) / 2.0, peak_y - 10 if s_y >= e_y else peak_y, e_x, e_y)
 
         if show_relations:
-            if angle == -1: angle = math.degrees(math.atan((s_y - e_y) / ((s_x - e_x) + eps)))
             rel_temp_size = self.__size(d_type) / 1.35
             rect_x, rect_y = (((s_x + e_x) / 2.0) - (rel_temp_size / 2.0) - 3, text_place_y - 10)
             rect_w, rect_h = (rel_temp_size + 3, 13)
             dwg.add(dwg.rect(insert=(rect_x, rect_y), rx=2, ry=2,
                              size=(rect_w, rect_h),
-                             fill='#303030', stroke=color, stroke_width='1',
-                             transform=f"rotate({angle} {rect_x + rect_w / 2} {rect_y + rect_h / 2})"))
+                             fill='#303030', stroke=color, stroke_width='1'))
 
             dwg.add(dwg.text(d_type, insert=(((s_x + e_x) / 2) - (rel_temp_size / 2.0), text_place_y),
-                             fill=color, font_size='12', font_family='courier',
-                             transform=f"rotate({angle} {rect_x + rect_w / 2} {rect_y + rect_h / 2})"))
+                             fill=color, font_size='12', font_family='courier'))
 
-    def __gen_graph(self, rdf, selected_text, exclude_relations, show_relations, max_x=1000, subcolor="#e80707"):
+    def __gen_graph(self, rdf, selected_text, exclude_relations, show_relations, max_x=1000, subcolor="#e80707",
+                    font_url=None, embed_font=False):
 
         exclude_relations = [i.lower().strip() for i in exclude_relations]
         rdf = [i for i in rdf if i.result.lower().strip() not in exclude_relations]
@@ -243,9 +276,9 @@ class RelationExtractionVisualizer:
         done_ent2 = {}
         all_done = {}
 
-        start_y = 75
+        start_y = FIRST_BASELINE
         x_limit = max_x
-        y_offset = 100
+        y_offset = LINE_OFFSET
         # dwg = svgwrite.Drawing("temp.svg",profile='full', size = (x_limit, len(selected_text) * 1.1 + len(rdf)*20))
 
         begin_index = 0
@@ -269,14 +302,8 @@ class RelationExtractionVisualizer:
                                                             t.metadata['entity2_end'],
                                                             t.metadata['chunk2'],
                                                             t.metadata['entity2']]
-            if t.metadata['entity1'].lower().strip() not in self.entity_color_dict:
-                self.entity_color_dict[t.metadata['entity1'].lower().strip()] = self.__get_color(
-                    t.metadata['entity1'].lower().strip())
-            if t.metadata['entity2'].lower().strip() not in self.entity_color_dict:
-                self.entity_color_dict[t.metadata['entity2'].lower().strip()] = self.__get_color(
-                    t.metadata['entity2'].lower().strip())
-
-                # all_entities_1_index.append(t[4]['entity1_begin'])
+
+            # all_entities_1_index.append(t[4]['entity1_begin'])
         all_entities_index = np.asarray(list(all_entities_index))
         all_entities_index = all_entities_index[np.argsort(all_entities_index)]
         dwg_rects, dwg_texts = [], []
@@ -309,7 +336,7 @@ class RelationExtractionVisualizer:
 
             # rectange chunk 1
             dwg_rects.append(
-                [(start_x - 3, start_y - 18), (this_size, 25), self.entity_color_dict[e_entity_now.lower().strip()]])
+                [(start_x - 3, start_y - 18), (this_size, 25), get_color(e_entity_now, self.entity_color_dict)])
             # dwg.add(dwg.rect(insert=(start_x-3, start_y-18),rx=2,ry=2, size=(this_size,25),
             # stroke=self.entity_color_dict[e_entity_now.lower()], stroke_width='1', fill=self.entity_color_dict[
             # e_entity_now.lower()], fill_opacity='0.2')) chunk1
@@ -347,8 +374,43 @@ class RelationExtractionVisualizer:
                 #                 font_family='Monaco', style='font-weight:lighter'))
                 start_x += this_size + 10
 
-        dwg = svgwrite.Drawing("temp.svg", profile='full', size=(x_limit, start_y + y_offset))
-        dwg.embed_font(self.main_font, self.font_path)
+        # the words were laid out on lines y_offset apart, the lines are now moved to baselines that leave room for the
+        # levels of the arcs above every line
+        def line_of(y):
+            return int(round((y - FIRST_BASELINE) / y_offset))
+
+        relations = [(all_done[int(row.metadata['entity2_begin'])], all_done[int(row.metadata['entity1_begin'])],
+                      row.result) for row in rdf]
+        line_arcs = {}
+        max_levels = [-1] * (line_of(start_y) + 1)
+        for i, (d_key2, d_key1, _) in enumerate(relations):
+            # arcs between lines take a level above the lower line, like the arcs within that line
+            line_arcs.setdefault(line_of(max(d_key2[1], d_key1[1])), []).append(i)
+            # the upper line of an arc between lines also needs the room of one arc level above it
+            for d_key in [d_key2, d_key1]:
+                max_levels[line_of(d_key[1])] = 0
+        relation_levels = [0] * len(relations)
+        for line, arc_ids in line_arcs.items():
+            x_pairs = [(relations[i][0][0], relations[i][1][0]) for i in arc_ids]
+            levels = arc_levels([(min(pair), max(pair)) for pair in x_pairs])
+            for i, level in zip(arc_ids, levels):
+                relation_levels[i] = level
+            max_levels[line] = max(levels)
+        baselines = line_baselines(max_levels)
+
+        def move(y):
+            return y - FIRST_BASELINE - y_offset * line_of(y) + baselines[line_of(y)]
+
+        dwg_rects = [[(x, move(y))] + rest for (x, y), *rest in dwg_rects]
+        dwg_texts = [[text, (x, move(y))] + rest for text, (x, y), *rest in dwg_texts]
+        for d_key in all_done.values():
+            d_key[1] = move(d_key[1])
+
+        dwg = self.writer((x_limit, baselines[-1] + LINE_BELOW + 10))
+        if embed_font:
+            dwg.embed_font(self.main_font, self.font_path)
+        elif font_url is not None:
+            dwg.embed_stylesheet(font_face_css(font_url))
 
         for crect_ in dwg_rects:
             dwg.add(dwg.rect(insert=crect_[0], rx=2, ry=2, size=crect_[1], stroke=crect_[2],
@@ -360,31 +422,32 @@ class RelationExtractionVisualizer:
 
         relation_distances = []
         relation_coordinates = []
-        for row in rdf:
-            if row.result.lower().strip() not in self.color_dict:
-                self.color_dict[row.result.lower().strip()] = self.__get_color(row.result.lower().strip())
-
-            d_key2 = all_done[int(row.metadata['entity2_begin'])]
-            d_key1 = all_done[int(row.metadata['entity1_begin'])]
+        for (d_key2, d_key1, result), level in zip(relations, relation_levels):
             this_dist = abs(d_key2[0] - d_key1[0]) + abs(d_key2[1] - d_key1[1])
             relation_distances.append(this_dist)
-            relation_coordinates.append((d_key2, d_key1, row.result))
-
-        relation_distances = np.array(relation_distances)
-        relation_coordinates = np.array(relation_coordinates)
-        temp_ind = np.argsort(relation_distances)
-        relation_distances = relation_distances[temp_ind]
-        relation_coordinates = relation_coordinates[temp_ind]
+            relation_coordinates.append((d_key2, d_key1, result, level))
+
+        temp_ind = np.argsort(relation_distances, kind='stable')
+        relation_coordinates = [relation_coordinates[i] for i in temp_ind]
+        # arcs are collected while drawing pointers and labels, then all their curves are computed in one go and drawn
+        # in a group below the labels
+        state = RenderState()
+        arcs_group = dwg.add(dwg.g())
         for row in relation_coordinates:
             # if int(row[0][1]) == int(row[1][1]):
             size_of_entity_label = int(row[1][2])
-            self.__draw_line(dwg, int(row[0][0]), int(row[0][1]), int(row[1][0]), int(row[1][1]),
-                             row[2], self.color_dict[row[2].lower().strip()], show_relations, size_of_entity_label)
+            self.__draw_line(dwg, state, int(row[0][0]), int(row[0][1]), int(row[1][0]), int(row[1][1]),
+                             row[2], get_color(row[2], self.color_dict), show_relations, size_of_entity_label,
+                             level=row[3])
+        if state.arcs:
+            paths = bezier_paths(np.array([points for points, _ in state.arcs], dtype=float))
+            for path, (_, color) in zip(paths, state.arcs):
+                arcs_group.add(dwg.path(d=path, stroke=color, stroke_width="1", fill='none'))
 
         return dwg.tostring()
 
     def display(self, result, relation_col, document_col='document', exclude_relations=['O'], show_relations=True,
-                return_html=False, max_x=1000):
+                return_html=False, max_x=1000, font_url=None, embed_font=False):
         """Displays Relation Extraction visualization. 
         Inputs:
         result -- A Dataframe or dictionary.
@@ -393,6 +456,8 @@ class RelationExtractionVisualizer:
         exclude_relations -- list of relations that don't need to be displayed. Default: ["O"]
         show_relations -- Display relation types on arrows. Default: True
         return_html -- If true, returns raw html code instead of displaying. Default: False
+        font_url -- URL the SVG loads its font from, leave None when the page already declares it. Default: None
+        embed_font -- Inline the font in the SVG (self-contained export, ~140KB per SVG). Default: False
         Output: Visualization
         """
 
@@ -400,7 +465,7 @@ class RelationExtractionVisualizer:
         res = result[relation_col]
 
         html_content = self.__gen_graph(res, original_text, exclude_relations, show_relations, max_x=max_x,
-                                        subcolor="#d3e5eb")
+                                        subcolor="#d3e5eb", font_url=font_url, embed_font=embed_font)
 
         if return_html:
             return html_content
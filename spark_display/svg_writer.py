@@ -0,0 +1,89 @@
+"""
+Minimal SVG writer with the subset of the svgwrite.Drawing API used by the relation visualizer (rect, text, polyline,
+path, g, embed_font, embed_stylesheet, tostring). Elements are formatted straight into escaped strings, without
+attribute validation or an XML tree, which makes rendering large relation graphs much cheaper.
+"""
+from functools import lru_cache
+from xml.sax.saxutils import escape, quoteattr
+
+from svgwrite.container import FONT_TEMPLATE
+from svgwrite.utils import base64_data, font_mimetype
+
+SVG_HEADER = ('<svg baseProfile="full" height="%s" version="1.1" width="%s" xmlns="http://www.w3.org/2000/svg" '
+              'xmlns:ev="http://www.w3.org/2001/xml-events" xmlns:xlink="http://www.w3.org/1999/xlink">')
+
+
+def fmt(value):
+    if isinstance(value, float):
+        return '%.7g' % value
+    return str(value)
+
+
+def format_attributes(attributes):
+    return ''.join(' %s=%s' % (k.replace('_', '-'), quoteattr(fmt(v))) for k, v in sorted(attributes.items()))
+
+
+def element(tag, attributes, content=None):
+    attrs = format_attributes(attributes)
+    if content is None:
+        return '<%s%s />' % (tag, attrs)
+    return '<%s%s>%s</%s>' % (tag, attrs, escape(content), tag)
+
+
+@lru_cache(maxsize=4)
+def font_data(font_path):
+    with open(font_path, 'rb') as f_:
+        return base64_data(f_.read(), font_mimetype(font_path))
+
+
+class Group:
+    def __init__(self, **attributes):
+        self.attributes = attributes
+        self.parts = []
+
+    def add(self, part):
+        self.parts.append(part)
+        return part
+
+    def __str__(self):
+        return '<g%s>%s</g>' % (format_attributes(self.attributes), ''.join(str(p) for p in self.parts))
+
+
+class Drawing(Group):
+    """Drop-in replacement of svgwrite.Drawing for the visualizer, tostring() returns the same markup structure"""
+
+    def __init__(self, size):
+        super().__init__()
+        self.size = size
+        self.styles = []
+
+    def embed_stylesheet(self, content):
+        self.styles.append('<style type="text/css"><![CDATA[%s]]></style>' % content)
+
+    def embed_font(self, name, filename):
+        self.embed_stylesheet(FONT_TEMPLATE.format(name=name, data=font_data(filename)))
+
+    @staticmethod
+    def g(**attributes):
+        return Group(**attributes)
+
+    @staticmethod
+    def rect(insert, size, **attributes):
+        return element('rect', dict(attributes, x=insert[0], y=insert[1], width=size[0], height=size[1]))
+
+    @staticmethod
+    def text(text, insert, **attributes):
+        return element('text', dict(attributes, x=insert[0], y=insert[1]), content=text)
+
+    @staticmethod
+    def polyline(points, **attributes):
+        return element('polyline', dict(attributes, points=' '.join('%s,%s' % (fmt(x), fmt(y)) for x, y in points)))
+
+    @staticmethod
+    def path(d, **attributes):
+        return element('path', dict(attributes, d=d))
+
+    def tostring(self):
+        defs = '<defs>%s</defs>' % ''.join(self.styles) if self.styles else '<defs />'
+        return (SVG_HEADER % (fmt(self.size[1]), fmt(self.size[0])) + defs + ''.join(str(p) for p in self.parts) +
+                '</svg>')
@@ -0,0 +1,55 @@
+import pathlib
+import sys
+
+import pytest
+
+ROOT = pathlib.Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT.joinpath("tests")))
+
+from pkcase import standin  # noqa: E402
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+
+    def json(self):
+        if isinstance(self.payload, str):
+            raise ValueError("Expecting value: line 1 column 1 (char 0)")
+        return self.payload
+
+
+class FakeSession(object):
+    """
+    Answers like the stand-in API by text: a non-JSON body for "bad json", a 502 for "down" and a payload without main
+    and sentence_offsets for "no main"
+    """
+
+    def post(self, url, json, timeout):
+        text = json['text']
+        if "bad json" in text:
+            return FakeResponse(200, "<html>")
+        if "down" in text:
+            return FakeResponse(502, None)
+        if "no main" in text:
+            return FakeResponse(200, dict(relations=[]))
+        predict = standin.predict_ner if url.endswith("pred_ner") else standin.predict_rex
+        return FakeResponse(200, predict(text))
+
+
+@pytest.fixture
+def fake_session():
+    return FakeSession()
+
+
+@pytest.fixture
+def standin_url():
+    """
+    Base URL of a stand-in API server on a free local port
+    """
+    server, url = standin.start_in_thread()
+    yield url
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,110 @@
+"""
+Frozen copy of the regex-based standardise_divide that the unit expression parser of pkcase.predicted replaced, kept
+as the reference of the differential test
+"""
+import re
+from typing import List, Tuple
+
+
+def check_for_divide(inp_mention: str) -> str:
+    if len(inp_mention.split("/")) > 1:
+        # Checks for the first "/" and if more than one, conversts subsequent "/" to "·"
+        splt_on_divide = inp_mention.split("/", 1)
+        replaced_second_divide = [x.replace("/", "·") for x in splt_on_divide]
+        replaced_second_divide = ["(" + item + ")(-1)" for item in replaced_second_divide[1:]]
+        replaced_second_divide.insert(0, splt_on_divide[0])
+        new_inp_mention = "·".join(replaced_second_divide)
+        return new_inp_mention.strip("·")
+
+    return inp_mention
+
+
+def check_weight_bracket_dot_split(inp_mention: str) -> List:
+    weight_split = re.split(r"70·kg\(-1\)|70·kg-1|70·\(kg\)-1", inp_mention)
+    if len(weight_split) > 1:
+        weight_split = [minus for minus in weight_split if (minus != "" and minus is not None)]
+        weight_split = "".join(weight_split)
+        dot_split = re.split(r"·(?=[^\)]*(?:\(|$))", weight_split)
+        dot_split.extend(["70·kg(-1)"])
+        dot_split = [dot for dot in dot_split if (dot != "" and dot is not None)]
+    else:
+        dot_split = re.split(r"·(?=[^\)]*(?:\(|$))", inp_mention)
+        dot_split = [dot for dot in dot_split if (dot != "" and dot is not None)]
+    return dot_split
+
+
+def check_weight_dot_split(inp_mention: str) -> List:
+    if len(re.findall(r"70·kg\(-1\)|70·kg-1|70·\(kg\)-1", inp_mention)) >= 1:
+        weight_split = re.split(r"70·kg\(-1\)|70·kg-1|70·\(kg\)-1", inp_mention)
+        weight_split = [minus for minus in weight_split if (minus != "" and minus is not None)]
+        weight_split = "".join(weight_split)
+        dot_split = re.split(r"·", weight_split)
+        dot_split.extend(["70·kg(-1)"])
+        dot_split = [dot for dot in dot_split if (dot != "" and dot is not None)]
+    else:
+        dot_split = re.split(r"·", inp_mention)
+        dot_split = [dot for dot in dot_split if (dot != "" and dot is not None)]
+
+    return dot_split
+
+
+def check_for_brackets(inp_mention: str) -> List:
+    big_parenthesis_regex = r"\((.*?)\)-\d+|\((.*?)\)−\d+|\((.*?)\)\(-\d+\)|\((.*?)\)\(−\d+\)"
+    small_parenthesis_regex = r"\((-\d+)\)|\((−\d+)\)|(-\d+)|(−\d+)"
+    if len(re.findall(big_parenthesis_regex, inp_mention)) >= 1:
+        # split on dots outside of brackets only
+        dot_split = check_weight_bracket_dot_split(inp_mention)
+        brackets_split = [re.split(r"\((.*?)\)", dot) and re.split(r"(-\d)|(−\d)", dot) for dot in dot_split]
+        brackets_split = [[bracket for bracket in i if bracket is not None] for i in brackets_split]
+        brackets_split = [[num_bracket.strip("(){}[]") for num_bracket in i] for i in brackets_split]
+        brackets_split = [[bracket for bracket in i if bracket != ""] for i in brackets_split]
+        final_split = [[strip_bracket.replace("−", "-") for strip_bracket in i] for i in brackets_split]
+    elif len(re.findall(small_parenthesis_regex, inp_mention)) >= 1:
+        dot_split = check_weight_dot_split(inp_mention)
+        minus_one_split = [re.split(small_parenthesis_regex, dot2) for dot2 in dot_split]
+        minus_one_split = [[num_minus.strip("(){}[]") for num_minus in i if num_minus] for i in minus_one_split]
+        minus_one_split = [[minus for minus in i if (minus != "" and minus is not None)] for i in minus_one_split]
+        final_split = [[strip_minus.replace("−", "-") for strip_minus in i] for i in minus_one_split]
+    else:
+        final_split = [[inp_mention]]
+    return final_split
+
+
+def standardise_divide(inp_mention: str) -> Tuple:
+    """
+    Converts all units into dict of numerator and denominator (removes all "/" and "-1")
+    N.B. second slash equivalent to multiplication
+    """
+    # 1. check for /, and if more than one convert subsequent to ·
+    inp_mention = check_for_divide(inp_mention)
+
+    # 2. Check for brackets and splits on the dot returning numerator and denominator candidates
+    units_split = check_for_brackets(inp_mention)
+    # ml*kg-1*h*min-1 -> [[ml], [kg, -1], [h], [min, -1]]
+    # ml/h -> [[ml],[h, -1]
+    # 3. Add all those without -digits to nominator list
+    num_list = [sublist for sublist in units_split if len(sublist) == 1]
+    minus_list = [sub for sub in units_split if sub not in num_list]
+    minus_list = [x for x in minus_list if x]
+    # sort out if any minus digits that are not 1s
+    denom_list = []
+    for sublist in minus_list:
+        if sublist[1] != "-1":
+            power = sublist[1].replace("-", "^")
+            subject = "(" + sublist[0] + ")"
+            new_sublist = "".join([subject, power])
+            denom_list.append([new_sublist])
+        else:
+            new_subject = sublist[0]
+            denom_list.append([new_subject])
+
+    # get final denominator and nominator lists
+    num_list = [item for sublist in num_list for item in sublist]
+    denom_list = [item for sublist in denom_list for item in sublist]
+
+    # join elements with mutliplication sign
+    numerator = "·".join(num_list)
+    denominator = "·".join(denom_list)
+    # print(numerator, "/", denominator)
+
+    return numerator, denominator
@@ -0,0 +1,26 @@
+import pytest
+
+from utils.backends import PredictionBackend, HTTPBackend, APIResponseError
+
+
+def test_backends_must_implement_predict():
+    with pytest.raises(TypeError):
+        PredictionBackend()
+
+
+def test_http_backend_errors(fake_session):
+    backend = HTTPBackend(api_url="http://localhost")
+    backend.session = lambda: fake_session
+    with pytest.raises(APIResponseError) as e:
+        backend.predict(inp_text="bad json", pred_type="ner")
+    assert e.value.status_code == 200 and "invalid JSON" in str(e.value)
+    with pytest.raises(APIResponseError) as e:
+        backend.predict(inp_text="down", pred_type="ner")
+    assert e.value.status_code == 502
+
+
+def test_http_backend_against_standin_server(standin_url):
+    backend = HTTPBackend(api_url=standin_url)
+    text = "The clearance was 3.5 mL/min."
+    assert backend.predict(inp_text=text, pred_type="ner")["text"] == text
+    assert backend.predict(inp_text=text, pred_type="rex")["main"]["text"] == text
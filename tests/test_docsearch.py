@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("dash_bootstrap_components")
+from utils.docsearch import parse_pubdates, PaperIndex  # noqa: E402
+
+
+def test_parse_pubdates_mixed_formats():
+    dates = parse_pubdates(pd.Series(["2020-01-05", "2019 Mar", "2018", "Spring 2016", None, "n.d."]))
+    expected = pd.to_datetime(["2020-01-05", "2019-03-01", "2018-01-01", "2016-01-01", None, None])
+    np.testing.assert_array_equal(dates, expected.to_numpy(dtype="datetime64[ns]"))
+
+
+def test_paper_index_missing_values():
+    papers = pd.DataFrame(dict(pubdate=["2020-01-05", "2019 Mar", None, "2018"],
+                               prob=[0.95, np.nan, 0.6, 0.2],
+                               pmc=["PMC1", np.nan, None, ""]))
+    index = PaperIndex(papers)
+    assert index.facets["has_pmc"].tolist() == [True, False, False, False]
+    assert index.facets["relevance_bucket"].tolist() == [3, -1, 1, 0]
+    assert index.facets["year"].tolist() == [2020, 2019, 0, 2018]
+    assert index.orders["pk"].tolist() == [0, 2, 3, 1]
+    assert index.orders["date"].tolist() == [0, 1, 3, 2]
@@ -0,0 +1,59 @@
+import re
+from concurrent.futures import Future
+
+from utils.incremental import DocumentJob, merge_rex
+
+
+class ManualExecutor(object):
+    """Futures are completed by the test, in any order"""
+
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, inp_text):
+        future = Future()
+        self.calls.append((future, fn, inp_text))
+        return future
+
+    def complete(self, i):
+        future, fn, inp_text = self.calls[i]
+        future.set_result(fn(inp_text))
+
+
+def predict_rex(inp_text):
+    tokens = [dict(start=m.start(), end=m.end(), id=i, token_start=i, token_end=i)
+              for i, m in enumerate(re.finditer(r"\S+", inp_text))]
+    spans = [dict(start=t['start'], end=t['end'], token_start=t['id'], token_end=t['id'], label="VALUE")
+             for t in tokens if t['id'] % 3 == 0]
+    relations = [dict(head_span=a, child_span=b, head=a['token_start'], child=b['token_start'], label="C_VAL")
+                 for a, b in zip(spans, spans[1:])]
+    return dict(main=dict(text=inp_text, spans=spans, relations=relations, tokens=tokens), extra_ents=[],
+                sentence_offsets=[(0, len(inp_text))])
+
+
+def test_chunks_are_merged_once_in_any_order():
+    text = " ".join(f"Sentence {i} has a value of {i}.5 mg." for i in range(40))
+    executor = ManualExecutor()
+    rendered = []
+    job = DocumentJob(inp_text=text, pred_type="rex", predict_fn=predict_rex, executor=executor, max_chunk_chars=120,
+                      render_fn=lambda x: rendered.append(x['main']['text']) or len(rendered))
+    assert job.n_chunks > 4 and job.merge_done() == []
+    order = [3, 0, 4] + list(range(job.n_chunks))[::-1]
+    merge_order = []
+    for step in range(0, len(order), 2):
+        for i in order[step:step + 2]:
+            if not job.futures[i].done():
+                executor.complete(i)
+        # the chunks done since the previous call are merged in document order
+        merge_order.extend(job.merge_done())
+    assert job.finished and job.merge_done() == []
+    assert sorted(job.rendered) == list(range(job.n_chunks)) and len(rendered) == job.n_chunks
+
+    merged = job.merged()
+    expected = merge_rex(text, [(job.chunks[i][0], predict_rex(text[slice(*job.chunks[i])])) for i in merge_order])
+    assert merged == expected
+    tokens = merged['main']['tokens']
+    assert [t['id'] for t in tokens] == list(range(len(tokens)))
+    for span in merged['main']['spans']:
+        assert tokens[span['token_start']]['start'] == span['start']
+        assert text[span['start']:span['end']] == text[tokens[span['token_start']]['start']:span['end']]
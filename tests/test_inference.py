@@ -0,0 +1,56 @@
+import json
+
+from pkcase import standin
+from pkcase.inference import RexBatchRunner, abstract_text, rex2sentences
+
+
+def write_abstracts(path, abstracts):
+    path.write_text("".join(json.dumps(a) + "\n" for a in abstracts), encoding="utf-8")
+
+
+def test_malformed_responses_fail_only_their_abstract(tmp_path, fake_session):
+    abstracts = [dict(pmid=1, title="", abstract="The clearance of midazolam was 3.5 L/h."),
+                 dict(pmid=2, title="", abstract="This answer is bad json."),
+                 dict(pmid=3, title="", abstract="This answer has no main."),
+                 dict(pmid=4, title="", abstract="The half-life of loprazolam was 8.4 h.")]
+    write_abstracts(tmp_path.joinpath("abstracts.jsonl"), abstracts)
+    runner = RexBatchRunner(out_dir=str(tmp_path.joinpath("out")), max_in_flight=2, max_retries=0)
+    runner.session = lambda: fake_session
+    stats = runner.run(inp_path=str(tmp_path.joinpath("abstracts.jsonl")))
+    assert stats == dict(done=2, failed=2)
+    checkpoint = runner.read_checkpoint()
+    assert sorted(checkpoint['done']) == [1, 4]
+    assert sorted(checkpoint['failed']) == ["2", "3"]
+    assert "Invalid JSON" in checkpoint['failed']["2"]
+    assert "KeyError" in checkpoint['failed']["3"]
+
+
+def read_shards(runner):
+    return [json.loads(line) for shard_id in range(runner.read_checkpoint()['shards'])
+            for line in open(runner.shard_path(shard_id), encoding="utf-8")]
+
+
+def test_runner_against_standin_server(tmp_path, standin_url):
+    abstracts = [dict(pmid=i, title=f"Pharmacokinetics of midazolam {i}.",
+                      abstract=f"The clearance of midazolam was {i}.5 mL/min. The peak was {i} ng/mL.")
+                 for i in range(12)]
+    inp_path = tmp_path.joinpath("abstracts.jsonl")
+    write_abstracts(inp_path, abstracts[:7])
+    runner = RexBatchRunner(out_dir=str(tmp_path.joinpath("out")), api_url=standin_url, max_in_flight=3,
+                            max_retries=0, shard_size=4)
+    assert runner.run(inp_path=str(inp_path)) == dict(done=7, failed=0)
+
+    # a second run only predicts the abstracts that are not in the checkpoint yet
+    write_abstracts(inp_path, abstracts)
+    assert runner.run(inp_path=str(inp_path)) == dict(done=5, failed=0)
+    assert runner.run(inp_path=str(inp_path)) == dict(done=0, failed=0)
+    checkpoint = runner.read_checkpoint()
+    assert sorted(checkpoint['done']) == list(range(12)) and checkpoint['failed'] == {}
+
+    sentences = read_shards(runner)
+    expected = []
+    for a in sorted(abstracts, key=lambda x: x['pmid']):
+        text, title_end = abstract_text(a)
+        expected.extend(rex2sentences(inp_pmid=a['pmid'], inp_result=standin.predict_rex(text), title_end=title_end))
+    assert sorted(sentences, key=json.dumps) == sorted(expected, key=json.dumps)
+    assert any(s['relations'] for s in sentences)
@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+pytest.importorskip("dash_bootstrap_components")
+from apps import pkbulkapi  # noqa: E402
+from utils import backends, cache, common  # noqa: E402
+
+
+@pytest.fixture
+def standin_backend(monkeypatch):
+    monkeypatch.setattr(common, "BACKEND", backends.InProcessBackend())
+    monkeypatch.setattr(common, "PREDICTION_CACHE", cache.PredictionCache(db_path=None, model_version="standin-1"))
+
+
+def stream(inp_texts):
+    return [json.loads(line) for line in pkbulkapi.stream_rows(inp_texts=inp_texts)]
+
+
+def test_one_status_row_per_text(standin_backend, monkeypatch):
+    rows = stream([("a", "The clearance of midazolam was 3.5 mL/min."), ("b", "No pharmacokinetics here.")])
+    statuses = dict((row["id"], row) for row in rows if "estimate" not in row)
+    estimates = [row for row in rows if "estimate" in row]
+    assert statuses["a"]["n_estimates"] == len(estimates) > 0
+    assert all(row["id"] == "a" for row in estimates)
+    assert statuses["b"] == dict(id="b", n_estimates=0)
+    # the status row of a text comes after its estimates
+    assert rows.index(statuses["a"]) > max(rows.index(row) for row in estimates)
+
+    monkeypatch.setattr(common, "BACKEND", backends.InProcessBackend(error_rate=1.))
+    rows = stream([("c", "The clearance of midazolam was 4.5 mL/min.")])
+    assert len(rows) == 1 and rows[0]["id"] == "c" and rows[0]["n_estimates"] == 0 and "error" in rows[0]
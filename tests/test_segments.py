@@ -0,0 +1,160 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from pkcase import predicted
+from pkcase.corpus import build_corpus, RECORDS_FILE, RECORDS_COLUMNS, SPAN_RECORD_COLUMNS
+from pkcase.segments import SegmentedStore, StoreLockedError
+
+UNITS = ["mL/min", "L/hr", "ng/mL", "mg·h/L"]
+
+
+def sentence(pmid, value, unit, is_title=False):
+    """Predicted sentence with one clearance estimate: PK -C_VAL- VALUE -RELATED- UNITS"""
+    text = f"The clearance was {value} {unit} in adults."
+    pk = dict(start=4, end=13, label="PK", kb_id="CL", kb_name="clearance")
+    value_span = dict(start=18, end=18 + len(value), label="VALUE")
+    unit_span = dict(start=19 + len(value), end=19 + len(value) + len(unit), label="UNITS")
+    relations = [dict(left=pk, right=value_span, label="C_VAL"), dict(left=value_span, right=unit_span, label="RELATED")]
+    return dict(text=text, relations=relations, pmid=pmid, is_title=is_title)
+
+
+def write_sentences(path, pmids, value="3.5", mode="w"):
+    with open(path, mode, encoding="utf-8") as f:
+        for pmid in pmids:
+            for i in range(2):
+                f.write(json.dumps(sentence(pmid=pmid, value=f"{value}{i}", unit=UNITS[(pmid + i) % len(UNITS)],
+                                            is_title=i == 0)) + "\n")
+
+
+def without_ids(records):
+    return records.drop(columns=["ID"]).sort_values(["PMID", "Value"]).reset_index(drop=True)
+
+
+def fresh_records(tmp_path, inp_path, name):
+    build_corpus(inp_path=str(inp_path), out_dir=str(tmp_path.joinpath(name)), n_workers=1)
+    return pd.read_parquet(tmp_path.joinpath(name, RECORDS_FILE))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SegmentedStore(store_dir=str(tmp_path.joinpath("store")))
+
+
+def test_unit_table_change_restandardises_only_hit_rows(tmp_path, store, monkeypatch):
+    inp_path = tmp_path.joinpath("sentences.jsonl")
+    write_sentences(inp_path, pmids=range(8))
+    store.append(inp_path=str(inp_path), n_workers=1)
+    before = store.load_records()
+    fingerprints = store.read_index().set_index("PMID")["Fingerprint"]
+
+    # "hr" is no longer a synonym of "h": only the "L/hr" estimates change
+    monkeypatch.setitem(predicted.UNIT_SYNONYMS, "h", ["hrs", "hour", "hours"])
+    name = store.restandardise()
+    assert name is not None
+    after = store.load_records()
+    changed = before["Units"] == "[l] / [h]"
+    changed_pmids = set(before.loc[changed, "PMID"])
+    assert changed_pmids and changed_pmids != set(before["PMID"])
+    # only the rows whose units changed get new IDs, the other rows (of the same abstracts too) keep theirs
+    new_rows = after[~after["ID"].isin(before["ID"])]
+    assert len(new_rows) == changed.sum() and set(new_rows["Units"]) == {"[l] / [hr]"}
+    assert set(before.loc[~changed, "PMID"]) & changed_pmids
+    pd.testing.assert_frame_equal(after[after["ID"].isin(before["ID"])].sort_values("ID").reset_index(drop=True),
+                                  before[~changed].sort_values("ID").reset_index(drop=True))
+    assert set(store.load_estimates()["ID"]) == set(after["ID"])
+    pd.testing.assert_frame_equal(without_ids(after), without_ids(fresh_records(tmp_path, inp_path, "fresh")),
+                                  check_dtype=False)
+
+    # fingerprints do not depend on the tables, and the output hashes of the new rows are those of a fresh build
+    assert store.read_index().set_index("PMID")["Fingerprint"].equals(fingerprints)
+    assert store.rebuild(inp_path=str(inp_path), n_workers=1) is None
+    assert store.restandardise() is None
+
+
+def test_empty_store(store):
+    assert list(store.load_records().columns) == RECORDS_COLUMNS
+    assert store.load_estimates().empty
+    assert store.load_pmids() == set()
+    assert store.compact() is None
+    assert not os.path.exists(store.manifest_path)
+
+
+def test_append_rebuild_compact(tmp_path, store):
+    first, second = tmp_path.joinpath("first.jsonl"), tmp_path.joinpath("second.jsonl")
+    write_sentences(first, pmids=range(4))
+    write_sentences(second, pmids=range(2, 6))
+    first_name = store.append(inp_path=str(first), n_workers=1)
+    second_name = store.append(inp_path=str(second), n_workers=1)
+    # abstracts already in the store are skipped
+    assert store.read_manifest()["segments"][1]["n_estimates"] == 4
+    assert list(store.load_records().columns) == RECORDS_COLUMNS
+    assert list(store.load_estimates().columns) == SPAN_RECORD_COLUMNS
+
+    # new predictions for PMIDs 0 and 1 hide their older rows
+    changed = tmp_path.joinpath("changed.jsonl")
+    write_sentences(changed, pmids=range(2), value="7.1")
+    write_sentences(changed, pmids=range(2, 6), mode="a")
+    rebuilt_name = store.rebuild(inp_path=str(changed), n_workers=1)
+    assert rebuilt_name is not None
+    records = store.load_records()
+    assert len(records) == 12 and records["ID"].is_unique
+    assert set(records.loc[records["PMID"].isin([0, 1]), "Value"]) == {"7.10", "7.11"}
+    assert store.rebuild(inp_path=str(changed), n_workers=1) is None
+
+    version = store.read_manifest()["version"]
+    assert store.compact(max_segments=3) is None
+    assert store.read_manifest()["version"] == version
+    compacted_name = store.compact()
+    manifest = store.read_manifest()
+    assert [seg["name"] for seg in manifest["segments"]] == [compacted_name]
+    assert manifest["retired"][:3] == [first_name, second_name, rebuilt_name]
+    pd.testing.assert_frame_equal(store.load_records(), records)
+    assert set(store.read_index()["Segment"]) == {compacted_name}
+
+    # retired segments are deleted by the next compaction, once readers of the previous manifest are done
+    store.append(inp_path=str(first), n_workers=1)
+    write_sentences(tmp_path.joinpath("third.jsonl"), pmids=[6])
+    store.append(inp_path=str(tmp_path.joinpath("third.jsonl")), n_workers=1)
+    store.compact()
+    assert not os.path.exists(store.segment_path(first_name))
+    assert len(store.load_records()) == 14
+
+
+def test_rebuild_keeps_ids_of_unchanged_rows(tmp_path, store):
+    inp_path = tmp_path.joinpath("sentences.jsonl")
+    write_sentences(inp_path, pmids=range(4))
+    store.append(inp_path=str(inp_path), n_workers=1)
+    before = store.load_records()
+
+    # one more estimate in PMID 0: its abstract is reprocessed, only the new estimate gets a new ID
+    write_sentences(inp_path, pmids=[0])
+    with open(inp_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(sentence(pmid=0, value="9.9", unit="ng/mL")) + "\n")
+    write_sentences(inp_path, pmids=range(1, 4), mode="a")
+    assert store.rebuild(inp_path=str(inp_path), n_workers=1) is not None
+    after = store.load_records()
+    new_rows = after[~after["ID"].isin(before["ID"])]
+    assert new_rows["Value"].tolist() == ["9.9"]
+    pd.testing.assert_frame_equal(after[after["ID"].isin(before["ID"])].sort_values("ID").reset_index(drop=True),
+                                  before.sort_values("ID").reset_index(drop=True))
+    assert set(store.load_estimates()["ID"]) == set(after["ID"])
+    store.compact()
+    pd.testing.assert_frame_equal(store.load_records().sort_values("ID").reset_index(drop=True),
+                                  after.sort_values("ID").reset_index(drop=True))
+
+
+def test_background_compaction_skips_locked_store(tmp_path, store):
+    for pmid in range(3):
+        inp_path = tmp_path.joinpath(f"{pmid}.jsonl")
+        write_sentences(inp_path, pmids=[pmid])
+        store.append(inp_path=str(inp_path), n_workers=1)
+    with store.lock():
+        with pytest.raises(StoreLockedError):
+            store.compact()
+        store.compact_in_background().join()
+    assert len(store.read_manifest()["segments"]) == 3
+    store.compact_in_background().join()
+    assert len(store.read_manifest()["segments"]) == 1
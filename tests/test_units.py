@@ -0,0 +1,59 @@
+import pathlib
+
+import pytest
+
+import legacy_units
+from pkcase.predicted import standardise_unit, standardise_divide, convert_final_std
+
+UNIT_MENTIONS = pathlib.Path(__file__).parent.joinpath("data", "unit_mentions.txt").read_text(
+    encoding="utf-8").splitlines()
+
+# Mentions where the parser fixes the output of the regex standardiser: "^-1" exponents left a trailing "^" and an
+# unbalanced ")" leaked into the unit names
+KNOWN_FIXES = {
+    '(ml/min)/kg': ('ml', 'min·kg'),
+    'l·h^-1': ('l', 'h'),
+    'mg·kg^-1': ('mg', 'kg'),
+    'h^-1': ('', 'h'),
+}
+
+
+@pytest.mark.parametrize("mention", UNIT_MENTIONS)
+def test_same_as_legacy_standardiser(mention):
+    std_mention = standardise_unit(inp_mention=mention)
+    if std_mention in KNOWN_FIXES:
+        assert standardise_divide(inp_mention=std_mention) == KNOWN_FIXES[std_mention]
+        return
+    legacy = legacy_units.standardise_divide(inp_mention=std_mention)
+    assert standardise_divide(inp_mention=std_mention) == legacy
+    assert convert_final_std(*standardise_divide(inp_mention=std_mention)) == convert_final_std(*legacy)
+
+
+def test_known_fixes_are_in_corpus():
+    std_mentions = set(standardise_unit(inp_mention=m) for m in UNIT_MENTIONS)
+    assert set(KNOWN_FIXES) <= std_mentions
+
+
+@pytest.mark.parametrize("mention, expected", [
+    ("(mg/l)-1", ('l', 'mg')),
+    ("(mg/l)(-1)", ('l', 'mg')),
+    ("mg·(kg·h)-1", ('mg', 'kg·h')),
+    ("(ml/min)-1·ml·h", ('min·ml·h', 'ml')),
+    ("((l/h)-1)-1", ('l', 'h')),
+])
+def test_inverted_bracket_group(mention, expected):
+    assert standardise_divide(inp_mention=mention) == expected
+
+
+def test_inverted_bracket_group_final_units():
+    assert convert_final_std(*standardise_divide(inp_mention="(mg/l)-1"))[0] == "[l] / [mg]"
+
+
+@pytest.mark.parametrize("mention, expected", [
+    ("(mg/l)-2", ('(l)^2', '(mg)^2')),
+    ("(ml·h)-2", ('', '(ml)^2·(h)^2')),
+    ("(mg/h-2)-1", ('(h)^2', 'mg')),
+    ("l·(min·kg)^-2", ('l', '(min)^2·(kg)^2')),
+])
+def test_raised_bracket_group(mention, expected):
+    assert standardise_divide(inp_mention=mention) == expected
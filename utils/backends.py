@@ -0,0 +1,154 @@
+"""
+Prediction backends behind common.predict, selected with the PKPDAI_BACKEND environment variable:
+
+* remote (default): the PKPDAI API over pooled keep-alive connections (PKPDAI_API_URL overrides the URL)
+* standin: the local stand-in API of pkcase.standin, started in a background thread on a free port
+* inprocess: the stand-in predictors called directly, without HTTP
+
+The stand-in backends simulate PKPDAI_STANDIN_LATENCY seconds per request and fail PKPDAI_STANDIN_ERROR_RATE of the
+requests, to load-test and benchmark the demos without the real service.
+"""
+import abc
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pkcase import standin
+
+PRED_TYPES = ["ner", "rex"]
+
+
+class APIError(Exception):
+    pass
+
+
+class APITimeoutError(APIError):
+    pass
+
+
+class APIConnectionError(APIError):
+    pass
+
+
+class APIResponseError(APIError):
+    def __init__(self, status_code: int, reason: str = ""):
+        super().__init__(f"The API answered with status {status_code}" + (f" ({reason})" if reason else ""))
+        self.status_code = status_code
+
+
+def check_pred_type(pred_type: str):
+    if pred_type not in PRED_TYPES:
+        raise ValueError(f"Unknown prediction type: {pred_type}")
+
+
+class PredictionBackend(abc.ABC):
+    # Predictions of backends with another cache namespace than the real API are never mixed with its cached results
+    cache_namespace = ""
+
+    @abc.abstractmethod
+    def predict(self, inp_text: str, pred_type: str) -> Dict:
+        """
+        Decoded pred_ner or pred_rex results of inp_text. Raises APITimeoutError, APIConnectionError or
+        APIResponseError
+        """
+
+
+class HTTPBackend(PredictionBackend):
+    """
+    Prediction API over HTTP. One connection pool is shared by all threads, every thread gets its own session mounted
+    on it
+    """
+
+    def __init__(self, api_url: str, pool_size: int = 10, connect_timeout: float = 5., read_timeout: float = 30.):
+        self.api_url = api_url.rstrip("/") + "/"
+        self.timeout = (connect_timeout, read_timeout)
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.local = threading.local()
+
+    def session(self) -> requests.Session:
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+            self.local.session = session
+        return session
+
+    def post(self, inp_text: str, pred_type: str) -> requests.Response:
+        check_pred_type(pred_type)
+        try:
+            return self.session().post(self.api_url + f"pred_{pred_type}", json=dict(text=inp_text),
+                                       timeout=self.timeout)
+        except requests.Timeout as e:
+            raise APITimeoutError(str(e)) from e
+        except requests.RequestException as e:
+            raise APIConnectionError(str(e)) from e
+
+    def predict(self, inp_text: str, pred_type: str) -> Dict:
+        response = self.post(inp_text=inp_text, pred_type=pred_type)
+        if response.status_code not in [200, 201]:
+            raise APIResponseError(status_code=response.status_code)
+        try:
+            return response.json()
+        except ValueError as e:
+            raise APIResponseError(status_code=response.status_code, reason=f"invalid JSON: {e}") from e
+
+
+class StandinBackend(HTTPBackend):
+    """
+    HTTP backend talking to a local stand-in server started in a background thread
+    """
+    cache_namespace = "standin"
+
+    def __init__(self, latency: float = 0., error_rate: float = 0., **kwargs):
+        self.server, api_url = standin.start_in_thread(latency=latency, error_rate=error_rate)
+        super().__init__(api_url=api_url, **kwargs)
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+class InProcessBackend(PredictionBackend):
+    """
+    Calls prediction functions (text -> results) directly, by default the stand-in predictors. Latency and failures
+    (as 503 responses) are simulated like on the stand-in server
+    """
+    cache_namespace = "standin"
+
+    def __init__(self, predictors: Dict[str, Callable[[str], Dict]] = None, latency: float = 0.,
+                 error_rate: float = 0.):
+        self.predictors = predictors if predictors is not None else dict(ner=standin.predict_ner,
+                                                                         rex=standin.predict_rex)
+        self.latency = latency
+        self.error_rate = error_rate
+
+    def predict(self, inp_text: str, pred_type: str) -> Dict:
+        check_pred_type(pred_type)
+        if self.latency:
+            time.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if random.random() < self.error_rate:
+            raise APIResponseError(status_code=503)
+        return self.predictors[pred_type](inp_text)
+
+
+BACKENDS = {"remote": HTTPBackend, "standin": StandinBackend, "inprocess": InProcessBackend}
+
+
+def backend_from_env(default_url: str, pool_size: int, connect_timeout: float,
+                     read_timeout: float) -> PredictionBackend:
+    name = os.environ.get("PKPDAI_BACKEND", "remote")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown prediction backend {name}, expected one of {', '.join(BACKENDS)}")
+    http_options = dict(pool_size=pool_size, connect_timeout=connect_timeout, read_timeout=read_timeout)
+    if name == "remote":
+        return HTTPBackend(api_url=os.environ.get("PKPDAI_API_URL", default_url), **http_options)
+    simulation = dict(latency=float(os.environ.get("PKPDAI_STANDIN_LATENCY", 0.)),
+                      error_rate=float(os.environ.get("PKPDAI_STANDIN_ERROR_RATE", 0.)))
+    if name == "standin":
+        return StandinBackend(**simulation, **http_options)
+    return InProcessBackend(**simulation)
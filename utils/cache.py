@@ -0,0 +1,133 @@
+"""
+Caches shared by the demo apps: a thread-safe in-memory LRU, the two-tier (memory + SQLite on disk) cache of API
+predictions and the cache of rendered HTML.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Union
+
+RENDER_CACHE_SIZE = 256
+
+
+class LRUCache(object):
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return dict(hits=self.hits, misses=self.misses, size=len(self.items), maxsize=self.maxsize)
+
+
+def normalise_text(inp_text: str) -> str:
+    """
+    Texts that only differ in unicode composition or whitespace (e.g. an example copied from the rendered page) share
+    a cache entry
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", inp_text)).strip()
+
+
+class PredictionCache(object):
+    """
+    Content-addressed cache of API responses, keyed by the hash of the prediction type, the model version and the
+    normalised text. Entries are kept as JSON so that every caller gets its own copy of the response. The disk tier
+    keeps the most recently used max_disk_entries responses across restarts
+    """
+
+    def __init__(self, db_path: Union[str, None], model_version: str, max_memory_entries: int = 256,
+                 max_disk_entries: int = 20000):
+        self.model_version = model_version
+        self.memory = LRUCache(maxsize=max_memory_entries)
+        self.max_disk_entries = max_disk_entries
+        self.db_lock = threading.Lock()
+        self.db = None
+        if db_path is not None:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS predictions "
+                            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, accessed REAL NOT NULL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS predictions_accessed ON predictions (accessed)")
+            self.db.commit()
+
+    def key(self, inp_text: str, pred_type: str) -> str:
+        return hashlib.sha256(f"{pred_type}\n{self.model_version}\n{normalise_text(inp_text)}".encode("utf-8")
+                              ).hexdigest()
+
+    def get(self, inp_text: str, pred_type: str) -> Union[Dict, None]:
+        key = self.key(inp_text=inp_text, pred_type=pred_type)
+        value = self.memory.get(key)
+        if value is None and self.db is not None:
+            with self.db_lock:
+                row = self.db.execute("SELECT value FROM predictions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.db.execute("UPDATE predictions SET accessed = ? WHERE key = ?", (time.time(), key))
+                    self.db.commit()
+            if row is not None:
+                value = row[0]
+                self.memory.set(key, value)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set(self, inp_text: str, pred_type: str, inp_result: Dict):
+        key = self.key(inp_text=inp_text, pred_type=pred_type)
+        value = json.dumps(inp_result)
+        self.memory.set(key, value)
+        if self.db is not None:
+            with self.db_lock:
+                self.db.execute("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)", (key, value, time.time()))
+                self.db.execute("DELETE FROM predictions WHERE key IN (SELECT key FROM predictions "
+                                "ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_disk_entries,))
+                self.db.commit()
+
+    def stats(self) -> Dict:
+        return self.memory.stats()
+
+
+def content_key(*inp_parts) -> str:
+    """
+    Hash of JSON-serialisable parts (text, entities, relations, rendering options...)
+    """
+    return hashlib.sha256(json.dumps(inp_parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+# Rendered SVG / displacy HTML shared by the REX, NER and PKDB pages
+RENDER_CACHE = LRUCache(maxsize=RENDER_CACHE_SIZE)
+
+
+def cached_render(render_fn: Callable[[], str], *inp_key_parts) -> str:
+    """
+    Output of render_fn, which is only called when the same content (inp_key_parts) has not been rendered recently
+    """
+    key = content_key(*inp_key_parts)
+    out = RENDER_CACHE.get(key)
+    if out is None:
+        out = render_fn()
+        RENDER_CACHE.set(key, out)
+    return out
@@ -1,7 +1,18 @@
+import asyncio
+import pathlib
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Union
+
 import dash_bootstrap_components as dbc
 import dash_html_components as html
 from dash import dcc
-import requests
+
+from utils import backends
+from utils.backends import APIError, APITimeoutError
+from utils.cache import PredictionCache
+from utils.incremental import split_sentences, result_text, MERGERS
 
 META_TAGS = [{'name': 'viewport',
               'content': 'width=device-width, initial-scale=0.8, maximum-scale=1.2, minimum-scale=0.3,'}]
@@ -16,31 +27,123 @@ FONT_SIZE_NAVBAR = 20  # remember to change navbar-brand font-size
 FONTSIZE_PAR = 18
 # DIV STYLING
 MAIN_DIV_STYLE = dict(margin=MAIN_BORDER_MARGIN, verticalAlign="top", marginTop=MAIN_MARGIN_TOP)
+# API
+API_URL = "https://pkpdai.azurewebsites.net/"
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+API_POOL_SIZE = 10
+# Bump when the models behind the API change, cached predictions of other versions are ignored
+API_MODEL_VERSION = "1"
+PREDICTIONS_CACHE_PATH = pathlib.Path(__file__).parent.joinpath("../.cache/predictions.sqlite").resolve()
+
+
+BACKEND = backends.backend_from_env(default_url=API_URL, pool_size=API_POOL_SIZE, connect_timeout=CONNECT_TIMEOUT,
+                                   read_timeout=READ_TIMEOUT)
+API_EXECUTOR = ThreadPoolExecutor(max_workers=API_POOL_SIZE)
+
+
+def cache_version(inp_backend: backends.PredictionBackend) -> str:
+    if inp_backend.cache_namespace:
+        return f"{inp_backend.cache_namespace}-{API_MODEL_VERSION}"
+    return API_MODEL_VERSION
+
+
+PREDICTION_CACHE = PredictionCache(db_path=str(PREDICTIONS_CACHE_PATH), model_version=cache_version(BACKEND))
+
+
+def set_backend(inp_backend: backends.PredictionBackend):
+    """
+    Switches the backend of predict (e.g. to a stand-in in a benchmark), cached results of other backends are not used
+    """
+    global BACKEND
+    BACKEND = inp_backend
+    PREDICTION_CACHE.model_version = cache_version(inp_backend)
+
+
+def predict(inp_text: str, pred_type: str, use_cache: bool = True) -> Dict:
+    """
+    Predicts with the configured backend (by default the pred_ner or pred_rex endpoint over pooled keep-alive
+    connections) and returns the decoded results. Responses are cached by content. Raises APITimeoutError,
+    APIConnectionError or APIResponseError
+    """
+    if use_cache:
+        cached = PREDICTION_CACHE.get(inp_text=inp_text, pred_type=pred_type)
+        if cached is not None:
+            return cached
+    results = BACKEND.predict(inp_text=inp_text, pred_type=pred_type)
+    PREDICTION_CACHE.set(inp_text=inp_text, pred_type=pred_type, inp_result=results)
+    return results
+
+
+def predict_exact(inp_text: str, pred_type: str) -> Dict:
+    """
+    Cached prediction whose offsets are guaranteed to refer to inp_text (the cache can return the result of the same
+    text with different whitespace)
+    """
+    result = predict(inp_text=inp_text, pred_type=pred_type)
+    if result_text(inp_result=result, pred_type=pred_type) != inp_text:
+        result = predict(inp_text=inp_text, pred_type=pred_type, use_cache=False)
+    return result
+
+
+def predict_by_sentence(inp_text: str, pred_type: str) -> Dict:
+    """
+    Same output as predict, but the text is predicted sentence by sentence (concurrently, and only the sentences that
+    are not cached yet) and the results are merged with offsets relative to the whole text
+    """
+    sent_offs = split_sentences(inp_text)
+    if len(sent_offs) < 2:
+        return predict(inp_text=inp_text, pred_type=pred_type)
+    sentences = [inp_text[s:e] for s, e in sent_offs]
+    results = list(API_EXECUTOR.map(lambda x: predict_exact(inp_text=x, pred_type=pred_type), sentences))
+    for sentence, result in zip(sentences, results):
+        if result_text(inp_result=result, pred_type=pred_type) != sentence:
+            return predict(inp_text=inp_text, pred_type=pred_type)
+    return MERGERS[pred_type](inp_text, [(s, result) for (s, _), result in zip(sent_offs, results)])
+
+
+def prewarm_predictions(inp_texts: List[str], pred_type: str) -> threading.Thread:
+    """
+    Fills the prediction cache with the examples of a demo in the background, examples already cached (e.g. on disk
+    from a previous run) are not sent again
+    """
+
+    def prewarm():
+        for t in inp_texts:
+            try:
+                predict_by_sentence(inp_text=t, pred_type=pred_type)
+            except APIError:
+                pass
+
+    thread = threading.Thread(target=prewarm, daemon=True)
+    thread.start()
+    return thread
+
+
+def markdown_examples(inp_markdown: str) -> List[str]:
+    """
+    Texts of the bullet points of an examples markdown
+    """
+    return [x.strip() for x in re.split(r"^\s*\* ", inp_markdown, flags=re.MULTILINE)[1:]]
+
+
+async def predict_async(inp_text: str, pred_type: str) -> Dict:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(API_EXECUTOR, predict, inp_text, pred_type)
+
+
+async def predict_many(inp_texts: List[str], pred_type: str) -> List[Union[Dict, APIError]]:
+    """
+    Fans out the predictions of several texts (at most API_POOL_SIZE at a time), failed ones are returned as errors
+    """
+    return await asyncio.gather(*[predict_async(inp_text=t, pred_type=pred_type) for t in inp_texts],
+                                return_exceptions=True)
 
 
-def query_api(inp_text: str, pred_type: str):
-
-    api_url = "https://pkpdai.azurewebsites.net/"
-    out = None
-    if pred_type in ["ner", "rex"]:
-        if pred_type == "ner":
-            query_url = api_url + f"pred_ner"
-        else:
-            query_url = api_url + f"pred_rex"
-        params = dict(text=inp_text)
-        try:
-            out = requests.post(query_url, json=params, timeout=30)
-        except:
-            return None
-    return out
-
-
-def request_handler(inp_request):
-    if inp_request is not None and inp_request.status_code in [200, 201]:
-        results = inp_request.json()
-        return results
-    else:
-        return None
+def api_error_message(inp_error: APIError, pred_type: str) -> str:
+    if isinstance(inp_error, APITimeoutError):
+        return f"The {pred_type.upper()} API took too long to answer - try with a shorter text or in a few minutes"
+    return f"Error querying the {pred_type.upper()} API - try in a few minutes"
 
 
 def make_home_card(card_title, card_text, card_link):
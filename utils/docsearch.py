@@ -1,5 +1,6 @@
 from typing import Iterable, List, Dict
 import numpy as np
+import pandas as pd
 import re
 import urllib.request
 import json
@@ -34,6 +35,11 @@ EXTRA_MARG = "0px"
 MARGIN_TOP_FILTERS = "30px"
 
 MARGIN_RESULTS_TOP = '120px'
+# Search results are rendered PAGE_SIZE cards at a time, the results stay on the server
+PAGE_SIZE = 30
+PAGER_BUTTON_STYLE = {'borderRadius': '8px', 'margin': '0px 15px'}
+# Lower edges of the PK relevance buckets above the first one (relevance_bucket facet)
+RELEVANCE_BUCKETS = [0.5, 0.75, 0.9]
 
 
 
@@ -186,6 +192,84 @@ def render_cards(inp_list_cards: List[dbc.Card]):
     return html.Div(all_rows)
 
 
+def n_pages(n_results: int) -> int:
+    return max(1, -(-n_results // PAGE_SIZE))
+
+
+def page_slice(page: int, n_results: int) -> slice:
+    """
+    Positions of the results shown on a page (0-based), pages out of range are clamped to the first or last one
+    """
+    page = min(max(page, 0), n_pages(n_results=n_results) - 1)
+    return slice(page * PAGE_SIZE, min((page + 1) * PAGE_SIZE, n_results))
+
+
+def parse_pubdates(inp_dates: pd.Series) -> np.ndarray:
+    """
+    Publication dates as datetime64, dates that cannot be parsed fall back to the 1st of January of the first year
+    they mention (NaT without a year). Dates come in mixed formats (2020-01-05, 2019 Mar, 2018...), so every distinct
+    date is parsed on its own instead of with the one format pandas would infer for the whole series
+    """
+    parsed = {x: pd.to_datetime(str(x), errors="coerce") for x in inp_dates.dropna().unique()}
+    dates = pd.to_datetime(inp_dates.map(parsed))
+    years = inp_dates.astype(str).str.extract(r"((?:19|20)\d{2})", expand=False)
+    fallback = pd.to_datetime(years, format="%Y", errors="coerce")
+    return dates.fillna(fallback).to_numpy(dtype="datetime64[ns]")
+
+
+def descending_order(inp_values: np.ndarray) -> np.ndarray:
+    """
+    Positions sorted by decreasing value, ties keep the order of the positions and missing values go last
+    """
+    return pd.Series(inp_values).sort_values(ascending=False, kind="stable", na_position="last").index.to_numpy()
+
+
+class PaperIndex(object):
+    """
+    Sort orders and facets of the papers of the search, computed once when they are loaded. Search results are row
+    positions of the papers, ordered by gathers over the precomputed orders and ranks instead of sorting records
+    """
+
+    def __init__(self, inp_papers: pd.DataFrame):
+        self.n = len(inp_papers)
+        self.pubdate = parse_pubdates(inp_papers['pubdate'].reset_index(drop=True))
+        prob = inp_papers['prob'].to_numpy(dtype=float)
+        # orders[key][r] is the position of the paper ranked r, ranks[key][i] the rank of the paper at position i
+        self.orders = dict(pk=descending_order(prob), date=descending_order(self.pubdate))
+        self.ranks = {}
+        for key, order in self.orders.items():
+            self.ranks[key] = np.empty(self.n, dtype=np.int64)
+            self.ranks[key][order] = np.arange(self.n)
+        pmc = inp_papers['pmc'].to_numpy(dtype=object)
+        self.facets = pd.DataFrame(dict(
+            year=pd.DatetimeIndex(self.pubdate).year.fillna(0).astype(int).to_numpy(),
+            has_pmc=np.array([not pd.isna(x) and str(x).strip() != '' for x in pmc], dtype=bool),
+            # papers without a relevance probability get bucket -1 instead of landing in the top one
+            relevance_bucket=np.where(np.isnan(prob), -1, np.digitize(prob, RELEVANCE_BUCKETS))
+        ))
+
+    def order(self, inp_positions: np.ndarray, sortby: str) -> np.ndarray:
+        """
+        All the positions in inp_positions, in the sortby order
+        """
+        selected = np.zeros(self.n, dtype=bool)
+        selected[inp_positions] = True
+        order = self.orders[sortby]
+        return order[selected[order]]
+
+    def page(self, inp_positions: np.ndarray, sortby: str, inp_slice: slice) -> np.ndarray:
+        """
+        The positions of one page (slice of the sorted results). Only the results up to the end of the page are sorted
+        """
+        ranks = self.ranks[sortby][inp_positions]
+        if inp_slice.stop >= len(ranks):
+            top = np.argsort(ranks)
+        else:
+            top = np.argpartition(ranks, inp_slice.stop - 1)[:inp_slice.stop]
+            top = top[np.argsort(ranks[top])]
+        return inp_positions[top[inp_slice]]
+
+
 def group_elements(inp_list: List, subgroup_size: int):
     """
     Gets a flat list and groups its elements in subgroups of size subgroup_size
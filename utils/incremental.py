@@ -0,0 +1,203 @@
+"""
+Sentence-level predictions: texts are split into sentences that are predicted (and cached) one by one, then the
+results are stitched back together with offsets relative to the whole text. Editing one sentence of a long text only
+sends that sentence to the API again.
+"""
+import re
+import threading
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[A-Z(\[])|\n+")
+
+
+def split_sentences(inp_text: str) -> List[Tuple[int, int]]:
+    """
+    Character offsets of the sentences of a text, without surrounding whitespace. Sentences end at a full stop,
+    question or exclamation mark followed by an upper case letter or a bracket, or at a line break
+    """
+    offsets = []
+    start = 0
+    for m in list(SENTENCE_BOUNDARY.finditer(inp_text)) + [None]:
+        end = m.start() if m is not None else len(inp_text)
+        chunk = inp_text[start:end]
+        if chunk.strip():
+            s = start + len(chunk) - len(chunk.lstrip())
+            offsets.append((s, s + len(chunk.strip())))
+        if m is not None:
+            start = m.end()
+    return offsets
+
+
+def chunk_sentences(inp_sent_offs: List[Tuple[int, int]], max_chars: int) -> List[Tuple[int, int]]:
+    """
+    Groups consecutive sentences into chunks of at most max_chars characters (longer sentences are chunks on their own)
+    """
+    chunks = []
+    for start, end in inp_sent_offs:
+        if chunks and end - chunks[-1][0] <= max_chars:
+            chunks[-1] = (chunks[-1][0], end)
+        else:
+            chunks.append((start, end))
+    return chunks
+
+
+def shift_span(inp_span: Dict, char_offset: int, token_offset: int) -> Dict:
+    out = dict(inp_span)
+    out['start'] += char_offset
+    out['end'] += char_offset
+    for k in ['token_start', 'token_end']:
+        if k in out:
+            out[k] += token_offset
+    return out
+
+
+def shift_relation(inp_relation: Dict, char_offset: int, token_offset: int) -> Dict:
+    out = dict(inp_relation)
+    for k in ['head_span', 'child_span']:
+        out[k] = shift_span(inp_relation[k], char_offset=char_offset, token_offset=token_offset)
+    for k in ['head', 'child']:
+        if k in out:
+            out[k] += token_offset
+    return out
+
+
+def merge_ner(inp_text: str, inp_parts: List[Tuple[int, Dict]], token_offset: int = 0) -> Dict:
+    """
+    Merges pred_ner results of the sentences of inp_text, given as (sentence start offset, result). Entities have no
+    token indices, token_offset is only there for the signature of MERGERS
+    """
+    entities = []
+    for offset, result in inp_parts:
+        entities.extend(shift_span(e, char_offset=offset, token_offset=0) for e in result.get('entities', []))
+    return dict(text=inp_text, entities=entities)
+
+
+def merge_rex(inp_text: str, inp_parts: List[Tuple[int, Dict]], token_offset: int = 0) -> Dict:
+    """
+    Merges pred_rex results of the sentences of inp_text, given as (sentence start offset, result). Spans, relations,
+    tokens, extra entities and sentence offsets are re-based on the whole text, token indices start at token_offset
+    (the number of tokens already merged when the parts are added to an earlier merge)
+    """
+    spans, relations, tokens, extra_ents, sent_offs = [], [], [], [], []
+    for offset, result in inp_parts:
+        main = result['main']
+        part_token_offset = token_offset + len(tokens)
+        spans.extend(shift_span(s, char_offset=offset, token_offset=part_token_offset) for s in main.get('spans', []))
+        relations.extend(shift_relation(r, char_offset=offset, token_offset=part_token_offset)
+                         for r in main.get('relations', []))
+        for t in main.get('tokens', []):
+            t = shift_span(t, char_offset=offset, token_offset=part_token_offset)
+            t['id'] += part_token_offset
+            tokens.append(t)
+        extra_ents.extend(shift_span(e, char_offset=offset, token_offset=0) for e in result.get('extra_ents', []))
+        part_offs = result.get('sentence_offsets') or [(0, len(main['text']))]
+        sent_offs.extend((s + offset, e + offset) for s, e in part_offs)
+    main = dict(text=inp_text, spans=spans, relations=relations)
+    if tokens:
+        main['tokens'] = tokens
+    return dict(spark_format=main, main=main, extra_ents=extra_ents, sentence_offsets=sent_offs)
+
+
+def extend_ner(inp_merged: Dict, inp_delta: Dict):
+    """
+    Adds the entities of a merge of other sentences of the same text to inp_merged, in place
+    """
+    inp_merged['entities'].extend(inp_delta['entities'])
+
+
+def extend_rex(inp_merged: Dict, inp_delta: Dict):
+    """
+    Adds a merge of other sentences of the same text (with token indices following those of inp_merged) to
+    inp_merged, in place
+    """
+    main, delta_main = inp_merged['main'], inp_delta['main']
+    main['spans'].extend(delta_main['spans'])
+    main['relations'].extend(delta_main['relations'])
+    if 'tokens' in delta_main:
+        main.setdefault('tokens', []).extend(delta_main['tokens'])
+    inp_merged['extra_ents'].extend(inp_delta['extra_ents'])
+    inp_merged['sentence_offsets'].extend(inp_delta['sentence_offsets'])
+
+
+def result_text(inp_result: Dict, pred_type: str) -> str:
+    if pred_type == "ner":
+        return inp_result.get('text')
+    return inp_result['main']['text']
+
+
+MERGERS = {"ner": merge_ner, "rex": merge_rex}
+EXTENDERS = {"ner": extend_ner, "rex": extend_rex}
+
+
+class DocumentJob(object):
+    """
+    Predicts the chunks of a long document on an executor (which bounds the concurrency) so that the chunks done so far
+    can be shown while the rest are still running. Every chunk is merged into the document result once, when it is
+    done, and render_fn (if given) is called once on its result (offsets relative to the chunk), rendered[i] keeps the
+    output of the chunk at position i
+    """
+
+    def __init__(self, inp_text: str, pred_type: str, predict_fn: Callable[[str], Dict], executor: Executor,
+                 max_chunk_chars: int, render_fn: Callable[[Dict], Any] = None):
+        self.text = inp_text
+        self.pred_type = pred_type
+        self.chunks = chunk_sentences(split_sentences(inp_text), max_chars=max_chunk_chars)
+        self.futures = [executor.submit(predict_fn, inp_text[s:e]) for s, e in self.chunks]
+        self.render_fn = render_fn
+        self.result = MERGERS[pred_type](inp_text, [])
+        self.n_tokens = 0
+        self.merged_chunks: Set[int] = set()
+        self.rendered: Dict[int, Any] = {}
+        # interval ticks of the same job can overlap
+        self.lock = threading.Lock()
+
+    @property
+    def n_chunks(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def n_done(self) -> int:
+        return sum(f.done() for f in self.futures)
+
+    @property
+    def finished(self) -> bool:
+        return all(f.done() for f in self.futures)
+
+    def succeeded(self, i: int) -> bool:
+        f = self.futures[i]
+        return f.done() and not f.cancelled() and f.exception() is None
+
+    def errors(self) -> List[BaseException]:
+        return [f.exception() for f in self.futures if f.done() and not f.cancelled() and f.exception() is not None]
+
+    def merge_done(self) -> List[int]:
+        """
+        Merges (and renders) only the chunks done since the last call, returns their positions. Chunks that failed are
+        returned too but have no results to merge
+        """
+        with self.lock:
+            new = [i for i, f in enumerate(self.futures) if i not in self.merged_chunks and f.done()]
+            parts = [(i, self.futures[i].result()) for i in new if self.succeeded(i)]
+            delta = MERGERS[self.pred_type](self.text, [(self.chunks[i][0], r) for i, r in parts],
+                                            token_offset=self.n_tokens)
+            EXTENDERS[self.pred_type](self.result, delta)
+            if self.pred_type == "rex":
+                self.n_tokens += len(delta['main'].get('tokens', []))
+            if self.render_fn is not None:
+                for i, r in parts:
+                    self.rendered[i] = self.render_fn(r)
+            self.merged_chunks.update(new)
+            return new
+
+    def merged(self) -> Dict:
+        """
+        Merged results of the chunks done so far (in the order they finished), with offsets relative to the whole
+        document
+        """
+        self.merge_done()
+        return self.result
+
+    def cancel(self):
+        for f in self.futures:
+            f.cancel()
@@ -5,6 +5,7 @@ from termcolor import colored
 import re
 from tqdm import tqdm
 from utils.docsearch import get_json
+from pkcase.predicted import parse_unit_expression, index_relations, find_related, unique_dicts
 import dash_bootstrap_components as dbc
 from dash import html, dcc
 
@@ -140,6 +141,13 @@ class Span(object):
         if self.label == "PK":
             self.is_param = True
 
+    @property
+    def key(self) -> Tuple[int, int, str]:
+        return self.start, self.end, self.label
+
+    def to_dict(self) -> Dict:
+        return dict(start=self.start, end=self.end, label=self.label)
+
 
 class PKSpan(Span):
     def __init__(self, inp_dict: Dict, inp_text: str):
@@ -214,108 +222,18 @@ def standardise_unit(inp_mention: str) -> str:
     return inp_mention
 
 
-def check_for_divide(inp_mention: str) -> str:
-    if len(inp_mention.split("/")) > 1:
-        # Checks for the first "/" and if more than one, conversts subsequent "/" to "·"
-        splt_on_divide = inp_mention.split("/", 1)
-        replaced_second_divide = [x.replace("/", "·") for x in splt_on_divide]
-        replaced_second_divide = ["(" + item + ")(-1)" for item in replaced_second_divide[1:]]
-        replaced_second_divide.insert(0, splt_on_divide[0])
-        new_inp_mention = "·".join(replaced_second_divide)
-        return new_inp_mention.strip("·")
-
-    return inp_mention
-
-
-def check_weight_bracket_dot_split(inp_mention: str) -> List:
-    weight_split = re.split(r"70·kg\(-1\)|70·kg-1|70·\(kg\)-1", inp_mention)
-    if len(weight_split) > 1:
-        weight_split = [minus for minus in weight_split if (minus != "" and minus is not None)]
-        weight_split = "".join(weight_split)
-        dot_split = re.split(r"·(?=[^\)]*(?:\(|$))", weight_split)
-        dot_split.extend(["70·kg(-1)"])
-        dot_split = [dot for dot in dot_split if (dot != "" and dot is not None)]
-    else:
-        dot_split = re.split(r"·(?=[^\)]*(?:\(|$))", inp_mention)
-        dot_split = [dot for dot in dot_split if (dot != "" and dot is not None)]
-    return dot_split
-
-
-def check_weight_dot_split(inp_mention: str) -> List:
-    if len(re.findall("70·kg\(-1\)|70·kg-1|70·\(kg\)-1", inp_mention)) >= 1:
-        weight_split = re.split("70·kg\(-1\)|70·kg-1|70·\(kg\)-1", inp_mention)
-        weight_split = [minus for minus in weight_split if (minus != "" and minus is not None)]
-        weight_split = "".join(weight_split)
-        dot_split = re.split(r"·", weight_split)
-        dot_split.extend(["70·kg(-1)"])
-        dot_split = [dot for dot in dot_split if (dot != "" and dot is not None)]
-    else:
-        dot_split = re.split(r"·", inp_mention)
-        dot_split = [dot for dot in dot_split if (dot != "" and dot is not None)]
-
-    return dot_split
-
-
-def check_for_brackets(inp_mention: str) -> List:
-    big_parenthesis_regex = r"\((.*?)\)-\d+|\((.*?)\)−\d+|\((.*?)\)\(-\d+\)|\((.*?)\)\(−\d+\)"
-    small_parenthesis_regex = r"\((-\d+)\)|\((−\d+)\)|(-\d+)|(−\d+)"
-    if len(re.findall(big_parenthesis_regex, inp_mention)) >= 1:
-        # split on dots outside of brackets only
-        dot_split = check_weight_bracket_dot_split(inp_mention)
-        brackets_split = [re.split(r"\((.*?)\)", dot) and re.split(r"(-\d)|(−\d)", dot) for dot in dot_split]
-        brackets_split = [[bracket for bracket in i if bracket is not None] for i in brackets_split]
-        brackets_split = [[num_bracket.strip("(){}[]") for num_bracket in i] for i in brackets_split]
-        brackets_split = [[bracket for bracket in i if bracket != ""] for i in brackets_split]
-        final_split = [[strip_bracket.replace("−", "-") for strip_bracket in i] for i in brackets_split]
-    elif len(re.findall(small_parenthesis_regex, inp_mention)) >= 1:
-        dot_split = check_weight_dot_split(inp_mention)
-        minus_one_split = [re.split(small_parenthesis_regex, dot2) for dot2 in dot_split]
-        minus_one_split = [[num_minus.strip("(){}[]") for num_minus in i if num_minus] for i in minus_one_split]
-        minus_one_split = [[minus for minus in i if (minus != "" and minus is not None)] for i in minus_one_split]
-        final_split = [[strip_minus.replace("−", "-") for strip_minus in i] for i in minus_one_split]
-    else:
-        final_split = [[inp_mention]]
-    if not all([0 < len(sublist) <= 2 for sublist in final_split]):
-        a = 1
-    return final_split
-
-
 def standardise_divide(inp_mention: str) -> Tuple:
     """
     Converts all units into dict of numerator and denominator (removes all "/" and "-1")
     N.B. second slash equivalent to multiplication
     """
-    # 1. check for /, and if more than one convert subsequent to ·
-    inp_mention = check_for_divide(inp_mention)
-
-    # 2. Check for brackets and splits on the dot returning numerator and denominator candidates
-    units_split = check_for_brackets(inp_mention)
-    # ml*kg-1*h*min-1 -> [[ml], [kg, -1], [h], [min, -1]]
-    # ml/h -> [[ml],[h, -1]
-    # 3. Add all those without -digits to nominator list
-    num_list = [sublist for sublist in units_split if len(sublist) == 1]
-    minus_list = [sub for sub in units_split if sub not in num_list]
-    minus_list = [x for x in minus_list if x]
-    # sort out if any minus digits that are not 1s
-    denom_list = []
-    for sublist in minus_list:
-        if sublist[1] != "-1":
-            power = sublist[1].replace("-", "^")
-            subject = "(" + sublist[0] + ")"
-            new_sublist = "".join([subject, power])
-            denom_list.append([new_sublist])
-        else:
-            new_subject = sublist[0]
-            denom_list.append([new_subject])
-
-    # get final denominator and nominator lists
-    num_list = [item for sublist in num_list for item in sublist]
-    denom_list = [item for sublist in denom_list for item in sublist]
+    # ml*kg-1*h*min-1 -> [ml, h] / [kg, min]
+    # ml/h -> [ml] / [h]
+    num_list, denom_list = parse_unit_expression(inp_mention=inp_mention)
 
     # join elements with mutliplication sign
     numerator = "·".join(num_list)
     denominator = "·".join(denom_list)
-    # print(numerator, "/", denominator)
 
     return numerator, denominator
 
@@ -437,15 +355,15 @@ class PKEstimate(object):
             Compare=self.get_text_or_none(self.compare)
         )
 
+    def get_spans(self) -> List[Span]:
+        return [x for x in [self.param, self.central_v, self.central_v_units, self.deviation_v,
+                            self.deviation_v_units, self.compare] if x is not None]
+
     def get_ents(self):
-        out_ents = []
-        for x in [self.param, self.central_v, self.central_v_units, self.deviation_v, self.deviation_v_units,
-                  self.compare]:
-            if x is not None:
-                e = dict(start=x.start, end=x.end, label=x.label)
-                if e not in out_ents:
-                    out_ents.append(e)
-        return out_ents
+        out_ents = dict()
+        for x in self.get_spans():
+            out_ents.setdefault(x.key, x.to_dict())
+        return list(out_ents.values())
 
     def print_estimate(self):
         character_annots = self.get_character_spans()
@@ -455,21 +373,13 @@ class PKEstimate(object):
         print(t)
 
     def get_character_spans(self):
-        ents = []
-        for x in [self.param, self.central_v, self.central_v_units, self.deviation_v, self.deviation_v_units,
-                  self.compare]:
-            if x is not None and x not in ents:
-                ents.append(dict(start=x.start, end=x.end, label=x.label))
-        return ents
+        return self.get_ents()
 
     @staticmethod
     def view_all_entities_terminal(inp_text, ner_dictionaries):
         color_map = {"PK": "red", "VALUE": "blue", "UNITS": "green", "RANGE": "cyan", "COMPARE": "magenta"}
         # filter uniques
-        uq_ner_dictionaries = []
-        for t in ner_dictionaries:
-            if t not in uq_ner_dictionaries:
-                uq_ner_dictionaries.append(t)
+        uq_ner_dictionaries = unique_dicts(ner_dictionaries)
         if uq_ner_dictionaries:
             uq_ner_dictionaries = sorted(uq_ner_dictionaries, key=lambda anno: anno['start'])
             sentence_text = ""
@@ -496,6 +406,7 @@ def get_measurements(inp_sent: Dict) -> Union[List[PKEstimate], None]:
     measurements = []
     sent_text = inp_sent['text']
     sent_relations = inp_sent['relations']
+    relations_index = index_relations(inp_relations=sent_relations)
     for r in sent_relations:
         if r['label'] == 'C_VAL':
             # HERE, EXTRACT EVERYTHING FROM INSIDE
@@ -510,35 +421,19 @@ def get_measurements(inp_sent: Dict) -> Union[List[PKEstimate], None]:
                     if ent['label'] in ['VALUE', 'RANGE']:
                         c_v = ent  # Span(inp_dict=ent, inp_text=sent_text)
             if param is not None and c_v is not None:
-                c_v_units = None
-                d_v = None
-                d_v_units = None
-                compare = None
                 # 2) Find Units and Compare
-                for sub_r in sent_relations:
-                    if sub_r['label'] == 'RELATED' and (sub_r['right'] == c_v or sub_r['left'] == c_v):
-                        for side in ['left', 'right']:
-                            if sub_r[side] != c_v:
-                                if sub_r[side]['label'] == "COMPARE":
-                                    compare = sub_r[side]
-                                if sub_r[side]['label'] == "UNITS":
-                                    c_v_units = sub_r[side]
+                c_v_units = find_related(relations_index=relations_index, inp_span=c_v, rel_label='RELATED',
+                                         ent_labels=['UNITS'])
+                compare = find_related(relations_index=relations_index, inp_span=c_v, rel_label='RELATED',
+                                       ent_labels=['COMPARE'])
                 # 3) Find Dev
-                for sub_r in sent_relations:
-                    if sub_r['label'] == 'D_VAL' and (sub_r['right'] == c_v or sub_r['left'] == c_v):
-                        for side in ['left', 'right']:
-                            if sub_r[side] != c_v:
-                                if sub_r[side]['label'] in ['VALUE', 'RANGE']:
-                                    d_v = sub_r[side]
-
+                d_v = find_related(relations_index=relations_index, inp_span=c_v, rel_label='D_VAL',
+                                   ent_labels=['VALUE', 'RANGE'])
                 # 4) Find Dev units
+                d_v_units = None
                 if d_v:
-                    for sub_r in sent_relations:
-                        if sub_r['label'] == 'RELATED' and (sub_r['right'] == d_v or sub_r['left'] == d_v):
-                            for side in ['left', 'right']:
-                                if sub_r[side] != d_v:
-                                    if sub_r[side]['label'] == "UNITS":
-                                        d_v_units = sub_r[side]
+                    d_v_units = find_related(relations_index=relations_index, inp_span=d_v, rel_label='RELATED',
+                                             ent_labels=['UNITS'])
 
                 # Estimation object
 
@@ -585,19 +480,11 @@ class PKSentence(object):
     def get_dict_estimates(self):
         out_estimates = []
         if self.estimates is not None:
-            for e in self.estimates:
-                out_dict = e.get_dict_output()
-                if out_dict not in out_estimates:
-                    out_estimates.append(out_dict)
+            out_estimates = unique_dicts(e.get_dict_output() for e in self.estimates)
         return out_estimates
 
     def get_entities(self):
-        uq_ents = []
-        for estimate in self.estimates:
-            ents = estimate.get_ents()
-            for e in ents:
-                if e not in uq_ents:
-                    uq_ents.append(e)
+        uq_ents = unique_dicts(e for estimate in self.estimates for e in estimate.get_ents())
         uq_ents = sorted(uq_ents, key=lambda x: x['start'])
         return uq_ents
 
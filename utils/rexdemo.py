@@ -1,9 +1,11 @@
 import os
-from typing import Dict, List
+import bisect
+from typing import Dict, List, Tuple
 from sparknlp.annotation import Annotation
 import pandas as pd
 import dash_bootstrap_components as dbc
 from dash import html, dcc
+from spark_display.relation_extraction import get_color, ENTITY_COLORS, RELATION_COLORS
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 ACCEPTABLE_ENTITY_COMBINATIONS = [
@@ -22,6 +24,30 @@ ID2REX = {v: k for k, v in REX2ID.items()}
 TO_PRESERVE = ['input_ids', 'token_type_ids', 'attention_mask', 'overflow_to_sample_mapping', 'labels']
 
 
+def pkre2graph(pkre: Dict, exclude_relations: List[str] = ("NO_RELATION",), font_url: str = None) -> Dict:
+    """
+    Compact relation graph drawn in the browser by assets/rex_graph.js: text (t), entities of the relations as
+    [start, end, label] (e), relations as [head entity, child entity, label] (r), colours of the entity (ec) and
+    relation (rc) labels and the URL of the font (f)
+    """
+    ents, ent_ids, rels = [], {}, []
+    for r in pkre['relations']:
+        if r['label'] in exclude_relations:
+            continue
+        ids = []
+        for span in [r['head_span'], r['child_span']]:
+            key = (span['start'], span['end'])
+            if key not in ent_ids:
+                ent_ids[key] = len(ents)
+                ents.append([span['start'], span['end'], span['label']])
+            ids.append(ent_ids[key])
+        rels.append(ids + [r['label']])
+    return dict(t=pkre['text'], e=ents, r=rels,
+                ec={e[2]: get_color(e[2], ENTITY_COLORS) for e in ents},
+                rc={r[2]: get_color(r[2], RELATION_COLORS) for r in rels},
+                f=font_url)
+
+
 def pkre2sparknlp(pkre: Dict):
     text = pkre['text']
     result = {
@@ -131,6 +157,27 @@ def get_predicted_cval_entities(inp_annotation: Dict) -> List[Dict]:
     return out_c_vals
 
 
+def span_key(inp_span: Dict) -> Tuple[int, int, str]:
+    return inp_span['start'], inp_span['end'], inp_span['label']
+
+
+def index_relations(inp_relations: List[Dict]) -> Dict[Tuple[int, int, str], Dict[str, List[Dict]]]:
+    """
+    Builds an adjacency map of the predicted relations in one pass:
+    span key (start, end, label) -> {relation label: [related spans in relation order]}
+    """
+    relations_index = dict()
+    for relation in inp_relations:
+        child_key = span_key(relation["child_span"])
+        head_key = span_key(relation["head_span"])
+        if child_key != head_key:
+            relations_index.setdefault(child_key, dict()).setdefault(relation["label"], []).append(
+                relation["head_span"])
+            relations_index.setdefault(head_key, dict()).setdefault(relation["label"], []).append(
+                relation["child_span"])
+    return relations_index
+
+
 def get_c_val_dicts(annotation: Dict) -> List[Dict]:
     """
     Gets as an input an annotated sentence in prodigy format and it returns a list of central values with all
@@ -160,6 +207,7 @@ def get_c_val_dicts(annotation: Dict) -> List[Dict]:
     # 1. Get central values
 
     c_val_entities = get_predicted_cval_entities(annotation)
+    relations_index = index_relations(annotation["relations"])
     output_cvals = []
 
     if c_val_entities:
@@ -181,32 +229,21 @@ def get_c_val_dicts(annotation: Dict) -> List[Dict]:
                 },
                 sentence=annotation["text"],
             )
-            relations = annotation["relations"]
-            for relation in relations:
-                relation_ents = [relation["child_span"], relation["head_span"]]
-                rel_type = relation["label"]
-                if c_val in relation_ents:
-                    nocval_ent = [x for x in relation_ents if x != c_val][0]
-                    if rel_type == "C_VAL":
-                        if nocval_ent['label'] == "PK":
-                            new_cval['parameter'] = nocval_ent
-                        else:
-                            print("CAREFUL! HEAD OF C_VAL DOESN'T SEEM TO BE PK")
-                    elif rel_type == "RELATED":
-                        for f in complementary_fields:
-                            if nocval_ent['label'] == f:
-                                new_cval["central_v"][f.lower()] = nocval_ent
-                    elif rel_type == "D_VAL":
-                        d_val = nocval_ent
-                        new_cval["deviation"]["value/range"] = d_val
-                        # search for complementary information on dval
-                        for subrel in relations:
-                            subrel_ents = [subrel["child_span"], subrel["head_span"]]
-                            if d_val in subrel_ents and subrel['label'] == "RELATED":
-                                nodvalent = [x for x in subrel_ents if x != d_val][0]
-                                for f in complementary_fields:
-                                    if nodvalent['label'] == f:
-                                        new_cval["deviation"][f.lower()] = nodvalent
+            neighbours = relations_index.get(span_key(c_val), dict())
+            for nocval_ent in neighbours.get("C_VAL", []):
+                if nocval_ent['label'] == "PK":
+                    new_cval['parameter'] = nocval_ent
+                else:
+                    print("CAREFUL! HEAD OF C_VAL DOESN'T SEEM TO BE PK")
+            for nocval_ent in neighbours.get("RELATED", []):
+                if nocval_ent['label'] in complementary_fields:
+                    new_cval["central_v"][nocval_ent['label'].lower()] = nocval_ent
+            for d_val in neighbours.get("D_VAL", []):
+                new_cval["deviation"]["value/range"] = d_val
+                # search for complementary information on dval
+                for nodvalent in relations_index.get(span_key(d_val), dict()).get("RELATED", []):
+                    if nodvalent['label'] in complementary_fields:
+                        new_cval["deviation"][nodvalent['label'].lower()] = nodvalent
 
             output_cvals.append(new_cval)
     return output_cvals
@@ -247,6 +284,54 @@ def find_closest(central_entity, candidate_neighbours):
     return main_candidate
 
 
+class SentenceLocator(object):
+    """
+    Finds the sentence containing an entity with a binary search over the sorted sentence offsets (same result as
+    inwhich_sentence for non-overlapping sentences)
+    """
+
+    def __init__(self, sent_offs):
+        order = sorted(range(len(sent_offs)), key=lambda i: sent_offs[i][0])
+        self.sent_ids = order
+        self.starts = [sent_offs[i][0] for i in order]
+        self.ends = [sent_offs[i][1] for i in order]
+
+    def find(self, inp_ent):
+        pos = bisect.bisect_right(self.starts, inp_ent['start']) - 1
+        if pos >= 0 and inp_ent['end'] <= self.ends[pos]:
+            return self.sent_ids[pos]
+        return None
+
+
+class ClosestEntityFinder(object):
+    """
+    Sorted-position version of find_closest: candidates are indexed by their start and end offsets so that the
+    closest one is found with two binary searches. Ties are resolved like find_closest (first candidate wins)
+    """
+
+    def __init__(self, candidate_neighbours):
+        self.candidates = candidate_neighbours
+        self.first_by_end = dict()
+        self.first_by_start = dict()
+        for i, cand in enumerate(candidate_neighbours):
+            self.first_by_end.setdefault(cand['end'], i)
+            self.first_by_start.setdefault(cand['start'], i)
+        self.ends = sorted(self.first_by_end.keys())
+        self.starts = sorted(self.first_by_start.keys())
+
+    @staticmethod
+    def nearest_distance(sorted_offsets, inp_offset):
+        pos = bisect.bisect_left(sorted_offsets, inp_offset)
+        return min(abs(sorted_offsets[p] - inp_offset) for p in [pos - 1, pos] if 0 <= p < len(sorted_offsets))
+
+    def find_closest(self, central_entity):
+        c_start, c_end = central_entity['start'], central_entity['end']
+        mindist = min(self.nearest_distance(self.ends, c_start), self.nearest_distance(self.starts, c_end))
+        matches = [self.first_by_end.get(c_start - mindist), self.first_by_end.get(c_start + mindist),
+                   self.first_by_start.get(c_end - mindist), self.first_by_start.get(c_end + mindist)]
+        return self.candidates[min(i for i in matches if i is not None)]
+
+
 def add_drugs(inp_c_val_dicts, inp_extra_dicts, sentences_offsets):
     out_dicts = []
     drug_dicts = [x for x in inp_extra_dicts if x['label'] == 'CHEMICAL']
@@ -261,17 +346,19 @@ def add_drugs(inp_c_val_dicts, inp_extra_dicts, sentences_offsets):
                     out_dicts.append(cvd)
                 return out_dicts
             else:
+                sentence_locator = SentenceLocator(sent_offs=sentences_offsets)
+                drugs_per_sentence = dict()
+                for d in drug_dicts:
+                    drugs_per_sentence.setdefault(sentence_locator.find(inp_ent=d), []).append(d)
+                finders_per_sentence = {sent_id: ClosestEntityFinder(candidate_neighbours=drugs)
+                                        for sent_id, drugs in drugs_per_sentence.items()}
+                all_drugs_finder = ClosestEntityFinder(candidate_neighbours=drug_dicts)
                 for cvd in inp_c_val_dicts:
                     cv = cvd['central_v']['value/range']
-                    cv_sent_id = inwhich_sentence(sent_offs=sentences_offsets, inp_ent=cv)
-                    drugs_in_same_sentence = [d for d in drug_dicts if inwhich_sentence(sent_offs=sentences_offsets,
-                                                                                        inp_ent=d) == cv_sent_id]
-                    if drugs_in_same_sentence:
-                        match_drug = find_closest(central_entity=cv, candidate_neighbours=drugs_in_same_sentence)
-                    else:
-                        match_drug = find_closest(central_entity=cv, candidate_neighbours=drug_dicts)
-
-                    cvd['chemical'] = match_drug
+                    cv_sent_id = sentence_locator.find(inp_ent=cv)
+                    # closest drug in the same sentence, otherwise closest drug in the text
+                    finder = finders_per_sentence.get(cv_sent_id, all_drugs_finder)
+                    cvd['chemical'] = finder.find_closest(central_entity=cv)
                     out_dicts.append(cvd)
         else:
             out_dicts = inp_c_val_dicts
@@ -297,6 +384,20 @@ def transform2mentions(inp_text, inp_c_val_dicts):
     return out_dicts
 
 
+def extract_estimates(rex_results: Dict) -> List[Dict]:
+    """
+    Central values of a pred_rex result with the text of their parameter, drug, units, deviation and compare mentions
+    """
+    prodigy_output = rex_results['main']
+    c_val_dicts = get_c_val_dicts(prodigy_output)
+    if not c_val_dicts:
+        return []
+    extra_ents = remove_bad_chemicals(inp_chemicals=rex_results['extra_ents'], inp_cvals=c_val_dicts)
+    c_val_dicts = add_drugs(inp_c_val_dicts=c_val_dicts, inp_extra_dicts=extra_ents,
+                            sentences_offsets=rex_results['sentence_offsets'])
+    return transform2mentions(inp_text=prodigy_output["text"], inp_c_val_dicts=c_val_dicts)
+
+
 def cvalmentions2table(inp_cvals):
     allentries = []
     for entry in inp_cvals:
@@ -315,8 +416,8 @@ def cvalmentions2table(inp_cvals):
 
 def remove_bad_chemicals(inp_chemicals, inp_cvals):
     if inp_cvals:
-        c_val_limits = [(x['central_v']['value/range']['start'], x['central_v']['value/range']['end'])
-                        for x in inp_cvals]
+        c_val_limits = {(x['central_v']['value/range']['start'], x['central_v']['value/range']['end'])
+                        for x in inp_cvals}
         inp_chemicals = [ch for ch in inp_chemicals if (ch['start'], ch['end']) not in c_val_limits]
 
     return inp_chemicals